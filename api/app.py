@@ -1,21 +1,78 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Header
+import anyio
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy.exc import DBAPIError
 from sqlmodel import SQLModel, Field, Session, create_engine, select
 from typing import Optional, List
+import hmac
 import os
+import tempfile
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
-import jwt
+from functools import lru_cache
+
+# Cold starts matter on Vercel: passlib/bcrypt, PyJWT, python-multipart and the
+# metrics and rate-limit stores are imported by the first request that needs
+# them, not at module import, and startup checks a schema version instead of
+# reflecting every table.
+
+from housing.mediafiles import content_hash, hashed_name, plan as plan_media
+
+from .instrumentation import instrument
 
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./rwanda.db")
 SECRET_KEY = os.environ.get("SECRET_KEY", "change-me")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 
+# Uploaded media, served by serve_media below (see housing.mediafiles).
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT", "media")
+MEDIA_MAX_AGE = int(os.environ.get("MEDIA_MAX_AGE", "3600"))
+
+# Local state (rate-limit buckets, metrics) lives in VAR_DIR, the Django site's
+# var/ by default. Serverless filesystems are read-only outside the temp
+# directory, so fall back there when the checkout isn't writable.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VAR_DIR = os.path.abspath(os.environ.get("VAR_DIR") or (
+    os.path.join(BASE_DIR, "var") if os.access(BASE_DIR, os.W_OK)
+    else os.path.join(tempfile.gettempdir(), "rwanda-housing")))
+
+# Token buckets shared by all workers (and the Django site) through a local SQLite file.
+RATE_LIMIT_STORE = os.path.join(VAR_DIR, os.environ.get("RATE_LIMIT_STORE", "ratelimit.sqlite3"))
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "True") == "True"
+
+# Prometheus metrics summed over every worker (see housing.metrics), served at
+# /metrics to METRICS_ALLOWED_IPS or to requests bearing METRICS_TOKEN.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "True") == "True"
+METRICS_ALLOWED_IPS = os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_DIR = os.path.join(VAR_DIR, os.environ.get("API_METRICS_DIR", os.path.join("metrics", "api")))
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+
 engine = create_engine(DATABASE_URL, echo=False)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+@lru_cache(maxsize=None)
+def pwd_context():
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+@lru_cache(maxsize=None)
+def rate_limit_store():
+    from housing.ratelimit import TokenBucketStore
+
+    return TokenBucketStore(RATE_LIMIT_STORE)
+
+
+@lru_cache(maxsize=None)
+def metrics():
+    from housing.metrics import Registry
+
+    return Registry(METRICS_DIR, METRICS_FLUSH_INTERVAL, enabled=METRICS_ENABLED)
 
 
 class User(SQLModel, table=True):
@@ -48,19 +105,71 @@ class AgentRating(SQLModel, table=True):
     comment: Optional[str] = None
 
 
+# Bump whenever the table models above change so the next cold start creates them.
+SCHEMA_VERSION = 1
+
+
+class SchemaVersion(SQLModel, table=True):
+    __tablename__ = "api_schema_version"
+    version: int = Field(primary_key=True)
+
+
 def create_db_and_tables():
+    """Create missing tables unless the database already records SCHEMA_VERSION (one query)."""
+    with Session(engine) as session:
+        try:
+            current = session.exec(
+                select(SchemaVersion.version).where(SchemaVersion.version == SCHEMA_VERSION)
+            ).first()
+        except DBAPIError:
+            current = None
+        if current is not None:
+            return
     SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.merge(SchemaVersion(version=SCHEMA_VERSION))
+        session.commit()
 
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
+
+
+def bucket_checks(scope: str, ip: Optional[str] = None, account=None):
+    # The limits are housing.ratelimit's; accounts are this app's, not the Django site's.
+    from housing.ratelimit import LIMITS, bucket_checks as checks_for
+
+    return checks_for(LIMITS, scope, "api", ip, account)
+
+
+def rate_limit(scope: str, ip: Optional[str] = None, account=None, peek: bool = False):
+    """Take (or with `peek`, only check) a token for this request; 429 when a bucket is empty."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    from housing.ratelimit import check as check_limits
+
+    checks = bucket_checks(scope, ip, account)
+    if peek:
+        decisions = [rate_limit_store().peek(key, limit) for key, limit in checks]
+        decision = next((d for d in decisions if not d.allowed), None)
+    else:
+        decision = check_limits(rate_limit_store(), checks)
+    if decision is not None and not decision.allowed:
+        raise HTTPException(status_code=429, detail="Too many requests",
+                            headers={"Retry-After": str(decision.retry_after)})
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else ""
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -72,6 +181,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 
 def get_current_user_from_token(authorization: Optional[str] = Header(None)):
+    import jwt
+
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization header")
     try:
@@ -103,11 +214,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Serve static and uploaded media
-os.makedirs("static", exist_ok=True)
-os.makedirs("media/property_images", exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/media", StaticFiles(directory="media"), name="media")
+instrument(app, engine, metrics=metrics)
+
+# Static files; the directory may not exist yet, so don't stat it at import.
+app.mount("/static", StaticFiles(directory="static", check_dir=False), name="static")
+
+
+async def media_chunks(path: str, offset: int, length: int, chunk_size: int = 64 * 1024):
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(offset)
+        while length > 0:
+            chunk = await f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@app.api_route("/media/{name:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_media(name: str, request: Request):
+    plan = await run_in_threadpool(plan_media, MEDIA_ROOT, name, request.headers, MEDIA_MAX_AGE)
+    if plan.status == 404:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if plan.path is None or request.method == "HEAD":
+        return Response(status_code=plan.status, headers=plan.headers)
+    return StreamingResponse(media_chunks(plan.path, plan.offset, plan.length),
+                             status_code=plan.status, headers=plan.headers)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint(request: Request, authorization: Optional[str] = Header(None)):
+    token = (authorization or "").removeprefix("Bearer ")
+    allowed = client_ip(request) in METRICS_ALLOWED_IPS or (
+        METRICS_TOKEN and hmac.compare_digest(token, METRICS_TOKEN))
+    if not allowed or not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    from housing.metrics import CONTENT_TYPE
+
+    return Response(metrics().collect(), headers={"Content-Type": CONTENT_TYPE})
 
 
 @app.on_event("startup")
@@ -132,7 +276,9 @@ def get_property(property_id: int):
 
 
 @app.post("/api/properties", response_model=Property)
-def create_property(property: Property, current_user: User = Depends(get_current_user_from_token)):
+def create_property(property: Property, request: Request,
+                    current_user: User = Depends(get_current_user_from_token)):
+    rate_limit("listing_write", ip=client_ip(request), account=current_user.id)
     property.owner_id = current_user.id
     with Session(engine) as session:
         session.add(property)
@@ -149,7 +295,8 @@ def list_users():
 
 
 @app.post("/api/register")
-def register(username: str, email: Optional[str] = None, password: str = None):
+def register(request: Request, username: str, email: Optional[str] = None, password: str = None):
+    rate_limit("register", ip=client_ip(request))
     if not password:
         raise HTTPException(status_code=400, detail="Password required")
     hashed = get_password_hash(password)
@@ -163,24 +310,55 @@ def register(username: str, email: Optional[str] = None, password: str = None):
 
 
 @app.post("/api/login")
-def login(username: str, password: str):
+def login(request: Request, username: str, password: str):
+    rate_limit("login", ip=client_ip(request))
+    rate_limit("login_failures", account=username, peek=True)
     with Session(engine) as session:
         user = session.exec(select(User).where(User.username == username)).first()
         if not user or not user.hashed_password or not verify_password(password, user.hashed_password):
+            if RATE_LIMIT_ENABLED:
+                from housing.ratelimit import check as check_limits
+
+                check_limits(rate_limit_store(), bucket_checks("login_failures", account=username))
             raise HTTPException(status_code=401, detail="Invalid credentials")
         token = create_access_token({"sub": user.username})
         return {"access_token": token, "token_type": "bearer"}
 
 
-@app.post("/api/properties/{property_id}/upload-image")
-def upload_property_image(property_id: int, file: UploadFile = File(...)):
-    # Save uploaded file to media/property_images
-    upload_dir = os.path.join("media", "property_images")
+UPLOAD_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    },
+}
+
+
+@app.post("/api/properties/{property_id}/upload-image", openapi_extra=UPLOAD_SCHEMA)
+async def upload_property_image(property_id: int, request: Request):
+    # The form is parsed here rather than declared as an UploadFile parameter so
+    # python-multipart loads on the first upload instead of at startup.
+    form = await request.form()
+    file = form.get("file")
+    if file is None or isinstance(file, str):
+        raise HTTPException(status_code=422, detail="file is required")
+    contents = await file.read()
+    metrics().inc("upload_bytes_total", len(contents), kind="property_images")
+    return await run_in_threadpool(save_property_image, property_id, file.filename, contents)
+
+
+def save_property_image(property_id: int, original_name: str, contents: bytes):
+    # Save uploaded file to media/property_images under a content-hashed name,
+    # which serve_media caches as immutable.
+    upload_dir = os.path.join(MEDIA_ROOT, "property_images")
     os.makedirs(upload_dir, exist_ok=True)
-    filename = f"{property_id}_{int(datetime.utcnow().timestamp())}_{file.filename}"
+    filename = hashed_name(f"{property_id}_{os.path.basename(original_name)}", content_hash([contents]))
     path = os.path.join(upload_dir, filename)
     with open(path, "wb") as f:
-        f.write(file.file.read())
+        f.write(contents)
     with Session(engine) as session:
         prop = session.get(Property, property_id)
         if not prop:
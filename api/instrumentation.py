@@ -0,0 +1,116 @@
+"""
+Per-request SQL instrumentation for the FastAPI backend.
+
+SQLAlchemy cursor events feed a recorder bound to the current request through a
+context variable; an HTTP middleware reports the totals as a `Server-Timing`
+header and one JSON log line per request on the `api.sql` logger. Given a
+function returning a housing.metrics registry, latency, in-flight requests, SQL
+totals per route and pool connection usage are recorded there too; it is first
+called by the first connection or request, so the registry loads lazily.
+"""
+import heapq
+import itertools
+import json
+import logging
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger("api.sql")
+
+_current: ContextVar[Optional["QueryRecorder"]] = ContextVar("api_query_recorder", default=None)
+
+
+class QueryRecorder:
+    def __init__(self, keep: int = 3):
+        self.keep = keep
+        self.count = 0
+        self.duration = 0.0
+        self._slowest = []
+        self._tiebreak = itertools.count()
+
+    def record(self, sql: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        entry = (duration, next(self._tiebreak), sql)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif self.keep:
+            heapq.heappushpop(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        return [
+            {"sql": sql, "ms": round(duration * 1000, 2)}
+            for duration, _, sql in sorted(self._slowest, reverse=True)
+        ]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start"].pop()
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.record(statement, time.perf_counter() - start)
+
+
+@lru_cache(maxsize=None)
+def _disabled_registry():
+    from housing.metrics import Registry
+
+    return Registry("", enabled=False)
+
+
+def instrument(app, engine, keep: int = 3, metrics: Optional[Callable] = None):
+    """Attach the SQL event listeners to `engine` and the timing middleware to `app`."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    metrics = metrics or _disabled_registry
+    event.listen(engine, "connect", lambda *args: metrics().inc("db_connections_opened_total", db="default"))
+    event.listen(engine, "checkout", lambda *args: metrics().add("db_connections_in_use", 1, db="default"))
+    event.listen(engine, "checkin", lambda *args: metrics().add("db_connections_in_use", -1, db="default"))
+
+    @app.middleware("http")
+    async def sql_instrumentation(request, call_next):
+        from housing.metrics import method_label
+
+        registry = metrics()
+        recorder = QueryRecorder(keep=keep)
+        token = _current.set(recorder)
+        registry.add("http_requests_in_flight", 1)
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            _current.reset(token)
+            registry.add("http_requests_in_flight", -1)
+        total = time.perf_counter() - start
+
+        response.headers["Server-Timing"] = (
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries", '
+            f"app;dur={total * 1000:.1f}"
+        )
+        route = request.scope.get("route")
+        label, method = getattr(route, "name", None) or "unmatched", method_label(request.method)
+        registry.inc("http_requests_total", route=label, method=method, status=str(response.status_code))
+        registry.observe("http_request_duration_seconds", total, route=label, method=method)
+        registry.inc("db_queries_total", recorder.count, route=label)
+        registry.inc("db_query_duration_seconds_total", recorder.duration, route=label)
+        registry.maybe_flush()
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.url.path,
+            "route": getattr(route, "name", None),
+            "status": response.status_code,
+            "queries": recorder.count,
+            "sql_ms": round(recorder.duration * 1000, 2),
+            "total_ms": round(total * 1000, 2),
+            "slowest": recorder.slowest,
+        }))
+        return response
@@ -1,3 +1,166 @@
-from django.contrib import admin
+"""
+Admin for the large housing tables.
 
-# Register your models here.
+Every change list here avoids the queries that stop the stock admin from
+scaling: foreign keys are fetched with list_select_related and edited through
+raw-id or autocomplete widgets rather than <select>s of every row, filters are
+only offered on indexed columns, and the paginator estimates the total instead
+of running COUNT(*) over the table (see EstimatedCountPaginator). Bulk actions
+are single UPDATE statements, published to housing.catalog as one change;
+set_listed queues the work the skipped save signals would have done for the
+background thread.
+"""
+from collections import Counter
+
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+from . import autocomplete, background, catalog, dedup, price_stats, saved_searches
+from .models import AgentRating, ChatArchive, ChatMessage, Property, PropertyImage, User
+
+# Below this many rows an exact COUNT(*) is cheap enough.
+EXACT_COUNT_LIMIT = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts exactly up to EXACT_COUNT_LIMIT rows. Past that, an unfiltered list
+    reports the largest primary key (one index lookup; it overcounts by the
+    number of deleted rows) and a filtered one stops counting at the limit, so
+    only its first EXACT_COUNT_LIMIT rows can be paged to.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        capped = queryset.order_by()[:EXACT_COUNT_LIMIT + 1].count()
+        if capped <= EXACT_COUNT_LIMIT:
+            return capped
+        if not queryset.query.has_filters():
+            return queryset.model._default_manager.aggregate(n=Max('pk'))['n'] or capped
+        return EXACT_COUNT_LIMIT
+
+
+def set_listed(queryset, listed):
+    """
+    List or de-list the properties in `queryset` with one UPDATE. The catalog
+    change is published on commit; the other stores kept by the Property
+    signals are brought up to date by refresh_listed on the background thread.
+    Returns how many changed.
+    """
+    ids = list(queryset.filter(is_listed=not listed).values_list('pk', flat=True))
+    if not ids:
+        return 0
+    Property.objects.filter(pk__in=ids).update(is_listed=listed)
+    transaction.on_commit(catalog.publish)
+    transaction.on_commit(lambda: background.submit(refresh_listed, ids, listed))
+    return len(ids)
+
+
+def refresh_listed(ids, listed):
+    """
+    Background task for set_listed: one price-statistics update per affected
+    group, this process's autocomplete index, duplicate-detection buckets and,
+    for re-listed homes, saved-search matches.
+    """
+    properties = list(Property.objects.filter(pk__in=ids, is_listed=listed).only(
+        'title', 'description', 'location', 'property_type', 'listing_type', 'price', 'owner', 'is_listed'))
+    groups, locations = {}, Counter()
+    for prop in properties:
+        groups.setdefault((price_stats.area_key(prop.location), prop.property_type, prop.listing_type),
+                          []).append(prop.price)
+        locations[prop.location] += 1
+    for key, prices in groups.items():
+        price_stats.apply_many(key, prices, 1 if listed else -1)
+    for location, count in locations.items():
+        autocomplete.listing_moved(None if listed else location, location if listed else None, count)
+    for prop in properties:
+        dedup.index_listing(prop)
+        if listed:
+            saved_searches.match_listing(prop)
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk',)
+
+
+@admin.register(User)
+class UserAdmin(BaseUserAdmin, ScalableAdmin):
+    list_display = ('username', 'email', 'user_type', 'is_active', 'date_joined')
+    list_filter = ('user_type',)
+    # Prefix matches only; also used by the autocomplete widgets below.
+    search_fields = ('^username', '^email')
+    fieldsets = BaseUserAdmin.fieldsets + (
+        ('Profile', {'fields': ('user_type', 'phone', 'whatsapp', 'profile_picture', 'bio',
+                                'houses_sold', 'houses_rented', 'locations')}),
+    )
+    actions = ['delist_properties']
+
+    @admin.action(description='De-list every property of the selected users')
+    def delist_properties(self, request, queryset):
+        count = set_listed(Property.objects.filter(owner__in=queryset.values('pk')), False)
+        self.message_user(request, f'De-listed {count} properties.', messages.SUCCESS)
+
+
+@admin.register(Property)
+class PropertyAdmin(ScalableAdmin):
+    list_display = ('title', 'location', 'price', 'property_type', 'listing_type', 'is_listed', 'owner',
+                    'created_at')
+    list_select_related = ('owner',)
+    list_filter = ('listing_type', 'property_type', 'is_listed')
+    search_fields = ('^title',)
+    autocomplete_fields = ('owner',)
+    readonly_fields = ('views',)
+    actions = ['delist', 'relist']
+
+    @admin.action(description='De-list selected properties')
+    def delist(self, request, queryset):
+        count = set_listed(queryset, False)
+        self.message_user(request, f'De-listed {count} properties.', messages.SUCCESS)
+
+    @admin.action(description='Re-list selected properties')
+    def relist(self, request, queryset):
+        count = set_listed(queryset, True)
+        self.message_user(request, f'Re-listed {count} properties.', messages.SUCCESS)
+
+
+@admin.register(PropertyImage)
+class PropertyImageAdmin(ScalableAdmin):
+    list_display = ('__str__', 'image', 'is_thumbnail')
+    list_select_related = ('property',)
+    raw_id_fields = ('property',)
+
+
+@admin.register(AgentRating)
+class AgentRatingAdmin(ScalableAdmin):
+    list_display = ('agent', 'rater', 'score', 'created_at')
+    list_select_related = ('agent', 'rater')
+    autocomplete_fields = ('agent', 'rater')
+
+
+@admin.register(ChatMessage)
+class ChatMessageAdmin(ScalableAdmin):
+    list_display = ('sender', 'receiver', 'timestamp', 'is_read')
+    list_select_related = ('sender', 'receiver')
+    list_filter = ('is_read',)
+    raw_id_fields = ('sender', 'receiver')
+    actions = ['mark_read']
+
+    @admin.action(description='Mark selected messages as read')
+    def mark_read(self, request, queryset):
+        count = queryset.filter(is_read=False).update(is_read=True)
+        self.message_user(request, f'Marked {count} messages as read.', messages.SUCCESS)
+
+
+@admin.register(ChatArchive)
+class ChatArchiveAdmin(ScalableAdmin):
+    list_display = ('conversation', 'first_timestamp', 'last_timestamp', 'message_count')
+    search_fields = ('=conversation',)
+    exclude = ('payload',)
+    readonly_fields = ('conversation', 'first_timestamp', 'last_timestamp', 'message_count')
@@ -0,0 +1,152 @@
+"""
+Per-agent daily rollups behind the agent dashboard.
+
+Signal handlers (housing.signals) add each new listing, chat message and
+rating to the owning agent's AgentDailyStat row for that day, and the view
+counter flush (housing.counters) adds views. The dashboard then reads one
+agent's rows through the (agent, day) unique index instead of aggregating
+Property, ChatMessage and AgentRating. `rebuild()` recomputes every row from
+history for backfills.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import chat
+from .models import AgentDailyStat, AgentRating, ChatMessage, Property, PropertyViewCount, User, conversation_key
+
+# Users who list properties and answer enquiries.
+AGENT_TYPES = ('agent', 'seller', 'landlord')
+
+COUNTERS = ('listings_added', 'listings_removed', 'views', 'chats_received', 'responses',
+            'response_seconds', 'ratings', 'rating_total')
+
+
+def bump(agent_id, day=None, **deltas):
+    """Add `deltas` to one agent's row for `day` (today by default)."""
+    day = day or timezone.localdate()
+    rows = AgentDailyStat.objects.filter(agent_id=agent_id, day=day)
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if rows.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            AgentDailyStat.objects.create(agent_id=agent_id, day=day, **deltas)
+    except IntegrityError:
+        rows.update(**updates)
+
+
+def first_unanswered(agent_id, client_id, before):
+    """When the oldest of `client_id`'s messages since the agent last replied was sent, if any."""
+    conversation = ChatMessage.objects.filter(conversation=conversation_key(agent_id, client_id), timestamp__lt=before)
+    last_reply = (conversation.filter(sender_id=agent_id)
+                  .order_by('-timestamp').values_list('timestamp', flat=True).first())
+    waiting = conversation.filter(sender_id=client_id)
+    if last_reply is not None:
+        waiting = waiting.filter(timestamp__gt=last_reply)
+    return waiting.order_by('timestamp').values_list('timestamp', flat=True).first()
+
+
+def record_message(message):
+    day = timezone.localdate(message.timestamp)
+    if message.receiver.user_type in AGENT_TYPES:
+        bump(message.receiver_id, day, chats_received=1)
+    if message.sender.user_type in AGENT_TYPES:
+        since = first_unanswered(message.sender_id, message.receiver_id, message.timestamp)
+        if since is not None:
+            bump(message.sender_id, day, responses=1,
+                 response_seconds=(message.timestamp - since).total_seconds())
+
+
+def rebuild():
+    """Recompute every agent's rows from Property, PropertyViewCount, ChatMessage and AgentRating."""
+    rows = defaultdict(Counter)
+    agents = set(User.objects.filter(user_type__in=AGENT_TYPES).values_list('id', flat=True))
+
+    listings = (Property.objects.annotate(day=TruncDate('created_at'))
+                .values('owner_id', 'day').annotate(n=Count('id')).values_list('owner_id', 'day', 'n'))
+    for agent_id, day, n in listings:
+        rows[agent_id, day]['listings_added'] += n
+
+    views = (PropertyViewCount.objects.values('property__owner_id', 'day')
+             .annotate(n=Sum('views')).values_list('property__owner_id', 'day', 'n'))
+    for agent_id, day, n in views:
+        rows[agent_id, day]['views'] += n
+
+    ratings = (AgentRating.objects.annotate(day=TruncDate('created_at')).values('agent_id', 'day')
+               .annotate(n=Count('id'), total=Sum('score')).values_list('agent_id', 'day', 'n', 'total'))
+    for agent_id, day, n, total in ratings:
+        rows[agent_id, day]['ratings'] += n
+        rows[agent_id, day]['rating_total'] += total
+
+    # One ordered pass over every conversation, live and archived, for chats received and response times.
+    waiting = {}
+    for sender_id, receiver_id, timestamp in chat.all_messages():
+        day = timezone.localdate(timestamp)
+        if receiver_id in agents:
+            rows[receiver_id, day]['chats_received'] += 1
+            waiting.setdefault((receiver_id, sender_id), timestamp)
+        if sender_id in agents:
+            since = waiting.pop((sender_id, receiver_id), None)
+            if since is not None:
+                rows[sender_id, day]['responses'] += 1
+                rows[sender_id, day]['response_seconds'] += (timestamp - since).total_seconds()
+
+    stats = [AgentDailyStat(agent_id=agent_id, day=day, **counts)
+             for (agent_id, day), counts in rows.items() if agent_id in agents]
+    with transaction.atomic():
+        AgentDailyStat.objects.all().delete()
+        AgentDailyStat.objects.bulk_create(stats, batch_size=1000)
+    return len(stats)
+
+
+def _average(total, count):
+    return round(total / count, 2) if count else None
+
+
+def dashboard(agent, days=30):
+    """Headline numbers and a per-day series for the last `days` days, in three queries."""
+    today = timezone.localdate()
+    since = today - datetime.timedelta(days=days - 1)
+    stats = AgentDailyStat.objects.filter(agent=agent)
+    totals = stats.aggregate(**{field: Sum(field) for field in COUNTERS})
+    totals = {field: value or 0 for field, value in totals.items()}
+    recent = {row.day: row for row in stats.filter(day__gte=since)}
+
+    # Running rating average as of each day, starting from everything before the window.
+    ratings = totals['ratings'] - sum(row.ratings for row in recent.values())
+    rating_total = totals['rating_total'] - sum(row.rating_total for row in recent.values())
+    series = []
+    for i in range(days):
+        day = since + datetime.timedelta(days=i)
+        row = recent.get(day) or AgentDailyStat(agent=agent, day=day)
+        ratings += row.ratings
+        rating_total += row.rating_total
+        series.append({
+            'day': day,
+            'listings_added': row.listings_added,
+            'views': row.views,
+            'chats_received': row.chats_received,
+            'response_minutes': _average(row.response_seconds / 60, row.responses),
+            'rating': _average(rating_total, ratings),
+        })
+
+    window = {field: sum(getattr(row, field) for row in recent.values()) for field in COUNTERS}
+    peak_views = max((entry['views'] for entry in series), default=0)
+    return {
+        'days': days,
+        'listing_count': Property.objects.filter(owner=agent).count(),
+        'views_total': totals['views'],
+        'views_window': window['views'],
+        'chats_window': window['chats_received'],
+        'response_minutes': _average(window['response_seconds'] / 60, window['responses']),
+        'response_minutes_all_time': _average(totals['response_seconds'] / 60, totals['responses']),
+        'rating': _average(totals['rating_total'], totals['ratings']),
+        'rating_count': totals['ratings'],
+        'series': series,
+        'peak_views': peak_views,
+    }
@@ -0,0 +1,120 @@
+"""
+Authenticated users from the cache instead of the database.
+
+Resolving `request.user` normally costs a User query per request (session
+auth) or a Token join per API call (token auth). Both go through this module:
+CachedModelBackend.get_user and CachedTokenAuthentication read the user (and
+the token -> user id mapping) from the default cache, and only go to the
+database on a miss. Sessions themselves use the cached_db engine, so an
+authenticated page view needs no query before the view runs.
+
+Every User save or delete drops the cached copy, once immediately and again
+after the transaction commits (so a concurrent request cannot re-cache the
+old row in between); deleting a Token drops its mapping. Password changes are
+saves, and Django still checks the session's password hash against the cached
+user, so they log out other sessions as before. Logging in warms the cache.
+
+The cache holds the user's field values minus the password hash, plus the
+session auth hash derived from it; the password comes back as a deferred field
+(loaded only if read, and left alone by save()).
+
+Writes that bypass signals (QuerySet.update() on users) must call
+`invalidate_user` themselves; otherwise a cached user is at most
+AUTH_USER_CACHE_SECONDS old.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .instrumentation import metrics
+
+
+def _user_key(pk):
+    # v2: field values instead of a pickled User.
+    return f'auth:user:v2:{pk}'
+
+
+def _token_key(key):
+    # Raw tokens never appear in cache keys (or file names of a file cache).
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def cache_user(user):
+    fields = {f.attname: getattr(user, f.attname) for f in user._meta.concrete_fields if f.attname != 'password'}
+    cache.set(_user_key(user.pk), {'fields': fields, 'session_auth_hash': user.get_session_auth_hash()},
+              settings.AUTH_USER_CACHE_SECONDS)
+
+
+def _restore(entry):
+    model = get_user_model()
+    names = list(entry['fields'])
+    user = model.from_db(router.db_for_read(model), names, [entry['fields'][name] for name in names])
+    user._session_auth_hash = entry['session_auth_hash']
+    return user
+
+
+def cached_user(pk):
+    """The User with primary key `pk`, or None if there is none."""
+    entry = cache.get(_user_key(pk))
+    metrics().inc('cache_requests_total', cache='auth_user', result='miss' if entry is None else 'hit')
+    user = _restore(entry) if entry is not None else None
+    if user is None:
+        user = get_user_model()._default_manager.filter(pk=pk).first()
+        if user is not None:
+            cache_user(user)
+    return user
+
+
+def invalidate_user(pk):
+    cache.delete(_user_key(pk))
+
+
+def invalidate_token(key):
+    cache.delete(_token_key(key))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user (called for every session-authenticated request)
+    is cached. The stock ModelBackend stays listed after it for sessions that
+    were created before this backend; it must not check a password twice.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None:
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        user = cached_user(get_user_model()._meta.pk.to_python(user_id))
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication with the token -> user lookup served from the cache."""
+
+    def authenticate_credentials(self, key):
+        user_id = cache.get(_token_key(key))
+        metrics().inc('cache_requests_total', cache='auth_token', result='miss' if user_id is None else 'hit')
+        if user_id is None:
+            user_id = Token.objects.filter(key=key).values_list('user_id', flat=True).first()
+            if user_id is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            cache.set(_token_key(key), user_id, settings.AUTH_USER_CACHE_SECONDS)
+        user = cached_user(user_id)
+        if user is None:
+            invalidate_token(key)
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, Token(key=key, user=user)
@@ -0,0 +1,157 @@
+"""
+Location autocomplete.
+
+An in-process prefix index over normalized Property.location values and the
+places agents list in User.locations, weighted by how many listings (and
+agents) mention each place. Every word of a location is indexed, so "kac"
+finds "Kigali, Kacyiru". Lookups are a bisect into a sorted array plus a
+memoized top-k, so a warm query never touches the database.
+
+Only listed properties count. The index is built lazily per process and
+adjusted in place by the signal handlers when this process saves or deletes a
+listing. Once it is older than settings.LOCATION_INDEX_MAX_AGE, so other
+processes' writes show up, a fresh one is built on the background thread
+(housing.background) while requests keep using the stale one.
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count
+
+from . import background
+from .models import Property, User
+from .price_stats import area_key
+
+CACHE_SIZE = 4096
+_WORD_START = re.compile(r'(?:^|[\s,/-])(?=\w)')
+
+
+def display_name(location):
+    return re.sub(r'\s*,\s*', ', ', re.sub(r'\s+', ' ', (location or '').strip()))
+
+
+def word_suffixes(key):
+    """'kigali, kacyiru' -> ['kigali, kacyiru', 'kacyiru']"""
+    return [key[m.end():] for m in _WORD_START.finditer(key)]
+
+
+class LocationIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []  # sorted (suffix, key)
+        self._weights = {}
+        self._names = {}  # key -> Counter of display spellings
+        self._cache = {}
+        self.built_at = time.monotonic()
+
+    def add(self, location, delta=1):
+        key = area_key(location)
+        if not key:
+            return
+        with self._lock:
+            weight = self._weights.get(key, 0) + delta
+            names = self._names.setdefault(key, Counter())
+            names[display_name(location)] += delta
+            names += Counter()  # drop spellings no longer in use
+            self._names[key] = names
+            if weight > 0:
+                if key not in self._weights:
+                    for suffix in word_suffixes(key):
+                        insort(self._entries, (suffix, key))
+                self._weights[key] = weight
+            elif key in self._weights:
+                del self._weights[key]
+                for suffix in word_suffixes(key):
+                    del self._entries[bisect_left(self._entries, (suffix, key))]
+            if key not in self._weights:
+                del self._names[key]
+            self._cache.clear()
+
+    def search(self, prefix, limit=8):
+        """
+        [(display name, weight)] of the heaviest locations with a word starting
+        with `prefix`; equal weights in alphabetical order.
+        """
+        prefix = area_key(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            cached = self._cache.get((prefix, limit))
+            if cached is not None:
+                return cached
+            start = bisect_left(self._entries, (prefix,))
+            stop = bisect_left(self._entries, (prefix + '\uffff',), start)
+            keys = {key for _, key in self._entries[start:stop]}
+            best = heapq.nsmallest(limit, keys, key=lambda k: (-self._weights[k], k))
+            result = [(self._display(k), self._weights[k]) for k in best]
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache.clear()
+            self._cache[(prefix, limit)] = result
+            return result
+
+    def _display(self, key):
+        names = self._names.get(key)
+        return names.most_common(1)[0][0] if names else key.title()
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        rows = (Property.objects.filter(is_listed=True).values('location').annotate(n=Count('id'))
+                .values_list('location', 'n'))
+        for location, count in rows:
+            index.add(location, count)
+        for locations in User.objects.exclude(locations__isnull=True).exclude(
+                locations='').values_list('locations', flat=True):
+            for place in re.split(r'[;,\n]', locations):
+                index.add(place)
+        return index
+
+
+_index = None
+_build_lock = threading.Lock()
+_refreshing = False
+
+
+def get_index():
+    """This process's index; only the very first call waits for a build."""
+    global _index, _refreshing
+    index = _index
+    if index is None:
+        with _build_lock:
+            if _index is None:
+                _index = LocationIndex.build()
+            return _index
+    if time.monotonic() - index.built_at > settings.LOCATION_INDEX_MAX_AGE:
+        with _build_lock:
+            schedule, _refreshing = not _refreshing, True
+        if schedule:
+            background.submit(_refresh)
+    return index
+
+
+def _refresh():
+    global _index, _refreshing
+    try:
+        _index = LocationIndex.build()
+    finally:
+        _refreshing = False
+
+
+def listing_moved(old_location, new_location, count=1):
+    """Keep this process's index in step with `count` listings saved or deleted."""
+    index = _index
+    if index is None or old_location == new_location:
+        return
+    if old_location is not None:
+        index.add(old_location, -count)
+    if new_location is not None:
+        index.add(new_location, count)
+
+
+def suggest(prefix, limit=8):
+    return [{'location': name, 'count': weight} for name, weight in get_index().search(prefix, limit)]
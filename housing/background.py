@@ -0,0 +1,55 @@
+"""
+Work moved off the request path.
+
+`submit(task, *args)` queues `task(*args)` for this process's single
+background thread, so tasks run one at a time in the order they were
+submitted. Each task's database connection is closed when it finishes and
+failures are logged, not raised. Tasks still queued at a normal exit are run
+before the process ends; a killed worker loses them, so only submit work whose
+result can be rebuilt (every user of this module has a rebuild command).
+
+With BACKGROUND_TASKS_INLINE (set for test runs) tasks run immediately in the
+caller instead.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _forget_executor():
+    # A forked child does not inherit the parent's thread.
+    global _executor
+    _executor = None
+
+
+os.register_at_fork(after_in_child=_forget_executor)
+
+
+def _run(task, args):
+    try:
+        task(*args)
+    except Exception:
+        logger.exception('Background task %s failed', task.__qualname__)
+    finally:
+        connections.close_all()
+
+
+def submit(task, *args):
+    global _executor
+    if settings.BACKGROUND_TASKS_INLINE:
+        task(*args)
+        return
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='housing-background')
+        executor = _executor
+    executor.submit(_run, task, args)
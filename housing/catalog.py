@@ -0,0 +1,316 @@
+"""
+In-process columnar snapshot of the listed catalog.
+
+The buy/rent pages and the paged properties API filter, sort and page over
+NumPy columns (id, price, property type, listing type, location code and
+created_at) held in memory, and only go to the database to load the rows of
+the final page (`hydrate`). Rows are kept newest first, so the default order
+is a boolean mask and a slice.
+
+Snapshots are immutable and versioned by a counter in CATALOG_SNAPSHOT_DIR/
+state.json, which the signal handlers bump after every committed listing
+change (`publish`) along with the changed id. A process that finds the counter
+moved re-reads just those listings and patches its snapshot; a change without
+an id (bulk updates) or a gap in the change log means a full rebuild. The
+version read from the file decides staleness; the file's stat() is only a
+pre-check that lets a request skip reading it, and is trusted only once the
+mtime is older than the file system's timestamp resolution, since two
+publishes within one tick can leave the same mtime and size behind.
+
+With CATALOG_SNAPSHOT_SHARED each version is written once as .npy files and
+memory-mapped by every worker, so a host holds one copy whatever its worker
+count; the first worker to need a version builds it under a file lock.
+"""
+import datetime
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from filelock import FileLock
+
+from .instrumentation import metrics
+from .models import Property
+from .price_stats import area_key
+
+PROPERTY_TYPES = [code for code, _ in Property.PROPERTY_TYPE_CHOICES]
+LISTING_TYPES = [code for code, _ in Property.LISTING_TYPE_CHOICES]
+FIELDS = ('id', 'price', 'property_type', 'listing_type', 'location', 'created_at')
+COLUMNS = ('ids', 'price', 'property_type', 'listing_type', 'location', 'created')
+ORDERINGS = ('-created_at', 'created_at', 'price', '-price')
+# Changes remembered in state.json; a process further behind than this rebuilds.
+MAX_CHANGES = 1000
+KEEP_VERSIONS = 2
+# Coarsest mtime resolution we expect (FAT has 2s); newer stamps are re-checked.
+STAMP_RESOLUTION_NS = 2 * 10 ** 9
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _code(choices, value):
+    return choices.index(value) if value in choices else -1
+
+
+class Snapshot:
+    """Listed properties as parallel arrays, newest first."""
+
+    def __init__(self, version, columns, locations):
+        self.version = version
+        self.columns = columns
+        self.locations = locations  # location code -> area_key
+
+    def __len__(self):
+        return len(self.columns['ids'])
+
+    @classmethod
+    def from_rows(cls, version, rows, locations=()):
+        """Encode (id, price, property_type, listing_type, location, created_at) rows."""
+        locations = list(locations)
+        codes = {key: code for code, key in enumerate(locations)}
+        encoded = []
+        for pk, price, property_type, listing_type, location, created_at in rows:
+            key = area_key(location)
+            if key not in codes:
+                codes[key] = len(locations)
+                locations.append(key)
+            encoded.append((pk, float(price), _code(PROPERTY_TYPES, property_type),
+                            _code(LISTING_TYPES, listing_type), codes[key],
+                            (created_at - _EPOCH) // datetime.timedelta(microseconds=1)))
+        columns = {
+            'ids': np.fromiter((r[0] for r in encoded), dtype=np.int64, count=len(encoded)),
+            'price': np.fromiter((r[1] for r in encoded), dtype=np.float64, count=len(encoded)),
+            'property_type': np.fromiter((r[2] for r in encoded), dtype=np.int8, count=len(encoded)),
+            'listing_type': np.fromiter((r[3] for r in encoded), dtype=np.int8, count=len(encoded)),
+            'location': np.fromiter((r[4] for r in encoded), dtype=np.int32, count=len(encoded)),
+            'created': np.fromiter((r[5] for r in encoded), dtype=np.int64, count=len(encoded)),
+        }
+        return cls(version, _newest_first(columns), locations)
+
+    @classmethod
+    def build(cls, version):
+        rows = Property.objects.filter(is_listed=True).values_list(*FIELDS)
+        return cls.from_rows(version, rows.iterator(chunk_size=5000))
+
+    def patched(self, version, changed_ids):
+        """A new snapshot with the current database state of `changed_ids`."""
+        rows = Property.objects.filter(pk__in=changed_ids, is_listed=True).values_list(*FIELDS)
+        fresh = Snapshot.from_rows(version, rows, self.locations)
+        keep = ~np.isin(self.columns['ids'], np.asarray(changed_ids, dtype=np.int64))
+        columns = {name: np.concatenate([self.columns[name][keep], fresh.columns[name]]) for name in COLUMNS}
+        return Snapshot(version, _newest_first(columns), fresh.locations)
+
+    def select(self, listing_type=None, property_type=None, location=None, min_price=None, max_price=None,
+               ordering='-created_at'):
+        """Row positions matching the filters, in `ordering` order."""
+        c = self.columns
+        mask = np.ones(len(self), dtype=bool)
+        if listing_type:
+            mask &= c['listing_type'] == _code(LISTING_TYPES, listing_type)
+        if property_type:
+            mask &= c['property_type'] == _code(PROPERTY_TYPES, property_type)
+        if location:
+            needle = area_key(location)
+            mask &= np.isin(c['location'], [code for code, key in enumerate(self.locations) if needle in key])
+        if min_price is not None:
+            mask &= c['price'] >= min_price
+        if max_price is not None:
+            mask &= c['price'] <= max_price
+        rows = np.flatnonzero(mask)
+        if ordering == 'created_at':
+            rows = rows[::-1]
+        elif ordering in ('price', '-price'):
+            prices = c['price'][rows]
+            # Stable sorts keep newest-first order among equal prices.
+            rows = rows[np.argsort(prices if ordering == 'price' else -prices, kind='stable')]
+        return rows
+
+    def page(self, offset, limit, **filters):
+        """(ids of one page, total matches)."""
+        rows = self.select(**filters)
+        return self.columns['ids'][rows[offset:offset + limit]].tolist(), len(rows)
+
+
+def _newest_first(columns):
+    order = np.lexsort((-columns['ids'], -columns['created']))
+    return {name: np.ascontiguousarray(values[order]) for name, values in columns.items()}
+
+
+# Shared version counter
+
+def _root():
+    return Path(settings.CATALOG_SNAPSHOT_DIR)
+
+
+def _read_state():
+    try:
+        return json.loads((_root() / 'state.json').read_text())
+    except (OSError, ValueError):
+        return {'version': 0, 'changes': []}
+
+
+def _write_json(path, data):
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(data))
+    tmp.replace(path)
+
+
+def publish(pk=None):
+    """Record a committed change to listing `pk`, or to any number of listings if None."""
+    root = _root()
+    root.mkdir(parents=True, exist_ok=True)
+    with FileLock(str(root / 'state.lock')):
+        state = _read_state()
+        version = state['version'] + 1
+        _write_json(root / 'state.json', {
+            'version': version, 'changes': (state['changes'] + [[version, pk]])[-MAX_CHANGES:]})
+
+
+def changed_since(state, version):
+    """Ids changed after `version`, or None when a full rebuild is needed."""
+    if state['version'] < version:
+        return None  # the state file was reset
+    changes = [(v, pk) for v, pk in state['changes'] if v > version]
+    if len(changes) != state['version'] - version or any(pk is None for _, pk in changes):
+        return None
+    return sorted({pk for _, pk in changes})
+
+
+def _advance(snapshot, state):
+    changed = None if snapshot is None else changed_since(state, snapshot.version)
+    if changed is None:
+        return Snapshot.build(state['version'])
+    if not changed:
+        return snapshot
+    return snapshot.patched(state['version'], changed)
+
+
+# Memory-mapped snapshot files (CATALOG_SNAPSHOT_SHARED)
+
+def _save(snapshot, target):
+    tmp = target.with_name(target.name + '.tmp')
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name in COLUMNS:
+        np.save(tmp / f'{name}.npy', snapshot.columns[name])
+    (tmp / 'meta.json').write_text(json.dumps({'version': snapshot.version, 'locations': snapshot.locations}))
+    tmp.rename(target)
+
+
+def _load(target):
+    meta = json.loads((target / 'meta.json').read_text())
+    columns = {name: np.load(target / f'{name}.npy', mmap_mode='r') for name in COLUMNS}
+    return Snapshot(meta['version'], columns, meta['locations'])
+
+
+def _advance_shared(snapshot, state):
+    root = _root()
+    target = root / f"v{state['version']}"
+    if not target.exists():
+        root.mkdir(parents=True, exist_ok=True)
+        with FileLock(str(root / 'build.lock')):
+            if not target.exists():
+                _save(_advance(snapshot, state), target)
+                versions = sorted((p for p in root.glob('v*') if p.name[1:].isdigit()),
+                                  key=lambda p: int(p.name[1:]))
+                for old in versions[:-KEEP_VERSIONS]:
+                    shutil.rmtree(old, ignore_errors=True)
+    return _load(target)
+
+
+# Process-wide current snapshot
+
+_lock = threading.Lock()
+_snapshot = None
+_stamp = None
+
+
+def _state_stamp():
+    try:
+        stat = os.stat(_root() / 'state.json')
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _settled(stamp):
+    """Whether no later publish can leave the same stamp behind."""
+    return stamp is not None and time.time_ns() - stamp[0] > STAMP_RESOLUTION_NS
+
+
+def current():
+    """The snapshot for the latest published version, or None if snapshots are disabled."""
+    global _snapshot, _stamp
+    if not settings.CATALOG_SNAPSHOT_ENABLED:
+        return None
+    # Stat before reading, so a publish in between only costs another read.
+    stamp = _state_stamp()
+    if _snapshot is not None and stamp is not None and stamp == _stamp:
+        metrics().inc('cache_requests_total', cache='catalog_snapshot', result='hit')
+        return _snapshot
+    with _lock:
+        state = _read_state()
+        if _snapshot is None or _snapshot.version != state['version']:
+            metrics().inc('cache_requests_total', cache='catalog_snapshot', result='miss')
+            advance = _advance_shared if settings.CATALOG_SNAPSHOT_SHARED else _advance
+            _snapshot = advance(_snapshot, state)
+        else:
+            metrics().inc('cache_requests_total', cache='catalog_snapshot', result='hit')
+        _stamp = stamp if _settled(stamp) else None
+    return _snapshot
+
+
+def reset():
+    global _snapshot, _stamp
+    with _lock:
+        _snapshot = _stamp = None
+
+
+# Querying
+
+def page(offset, limit, **filters):
+    """(ids, total) of one page of listed properties; see Snapshot.select for `filters`."""
+    snapshot = current()
+    if snapshot is not None:
+        return snapshot.page(offset, limit, **filters)
+    return _page_from_database(offset, limit, **filters)
+
+
+def _page_from_database(offset, limit, listing_type=None, property_type=None, location=None,
+                        min_price=None, max_price=None, ordering='-created_at'):
+    properties = Property.objects.filter(is_listed=True)
+    if listing_type:
+        properties = properties.filter(listing_type=listing_type)
+    if property_type:
+        properties = properties.filter(property_type=property_type)
+    if location:
+        properties = properties.filter(Q(location__icontains=location.strip()))
+    if min_price is not None:
+        properties = properties.filter(price__gte=min_price)
+    if max_price is not None:
+        properties = properties.filter(price__lte=max_price)
+    tiebreak = '-pk' if ordering != 'created_at' else 'pk'
+    ids = properties.order_by(ordering, tiebreak).values_list('pk', flat=True)
+    return list(ids[offset:offset + limit]), properties.count()
+
+
+def filters_from(params):
+    """Snapshot filters from query parameters; raises ValueError for bad prices or orderings."""
+    filters = {name: params.get(name) or None for name in ('listing_type', 'property_type', 'location')}
+    for name in ('min_price', 'max_price'):
+        filters[name] = float(params[name]) if params.get(name) else None
+    filters['ordering'] = params.get('ordering') or '-created_at'
+    if filters['ordering'] not in ORDERINGS:
+        raise ValueError(f"ordering must be one of {', '.join(ORDERINGS)}")
+    return filters
+
+
+def hydrate(ids, queryset=None):
+    """Model instances for `ids`, in that order, in one query (plus `queryset`'s prefetches)."""
+    queryset = Property.objects.all() if queryset is None else queryset
+    by_id = queryset.in_bulk(ids)
+    return [by_id[pk] for pk in ids if pk in by_id]
@@ -0,0 +1,186 @@
+"""
+Conversation history across the live ChatMessage table and its archive.
+
+Every message carries the canonical id of its conversation
+(models.conversation_key), and ChatMessage is indexed on (conversation,
+timestamp), so a page of one conversation is a single index range scan
+however many messages the site holds.
+
+Read messages older than CHAT_ARCHIVE_AFTER_DAYS are moved in batches
+(`archive`, run by `manage.py archive_chat_messages`) into ChatArchive rows:
+up to CHAT_ARCHIVE_CHUNK_SIZE messages of one conversation as a
+zlib-compressed JSON blob. Each batch is merged into its conversation's last
+chunk until that is full, so a conversation's history ends up in as few
+chunks as the cap allows however many runs archived it. Unread messages and the newest message of every conversation stay
+live, so unread counts and the inbox never look at the archive.
+
+`history` pages newest first through both: the archive is only read when a
+page reaches back past the archive age.
+"""
+import datetime
+import json
+import zlib
+from collections import defaultdict
+from heapq import merge
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import ChatArchive, ChatMessage
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_FIELDS = ('id', 'sender_id', 'receiver_id', 'timestamp', 'message')
+
+
+def _micros(moment):
+    return (moment - _EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def _moment(micros):
+    return _EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def encode_cursor(message):
+    return f'{_micros(message.timestamp)}_{message.pk}'
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from encode_cursor; raises ValueError for anything else."""
+    micros, _, pk = cursor.partition('_')
+    return _moment(int(micros)), int(pk)
+
+
+def archive_cutoff():
+    return timezone.now() - datetime.timedelta(days=settings.CHAT_ARCHIVE_AFTER_DAYS)
+
+
+def _pack(rows):
+    return zlib.compress(json.dumps(
+        [[pk, sender_id, receiver_id, _micros(timestamp), message]
+         for pk, sender_id, receiver_id, timestamp, message in rows],
+        separators=(',', ':')).encode())
+
+
+def _rows(chunk):
+    """The (id, sender_id, receiver_id, timestamp, message) rows packed in `chunk`."""
+    return [(pk, sender_id, receiver_id, _moment(micros), message)
+            for pk, sender_id, receiver_id, micros, message in json.loads(zlib.decompress(chunk.payload))]
+
+
+def _unpack(chunk):
+    return [ChatMessage(id=pk, sender_id=sender_id, receiver_id=receiver_id, conversation=chunk.conversation,
+                        timestamp=timestamp, message=message, is_read=True)
+            for pk, sender_id, receiver_id, timestamp, message in _rows(chunk)]
+
+
+def _fill(chunk, rows):
+    chunk.first_timestamp, chunk.last_timestamp = rows[0][3], rows[-1][3]
+    chunk.message_count = len(rows)
+    chunk.payload = _pack(rows)
+    return chunk
+
+
+def _newest_first(message):
+    return message.timestamp, message.pk
+
+
+def history(conversation, before=None, limit=50):
+    """
+    Up to `limit` messages of `conversation`, newest first, older than the
+    `before` cursor (see decode_cursor) if given. Archived messages come back
+    as unsaved ChatMessage instances.
+    """
+    live = ChatMessage.objects.filter(conversation=conversation)
+    if before is not None:
+        timestamp, pk = before
+        live = live.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk))
+    page = list(live.order_by('-timestamp', '-pk')[:limit])
+    if len(page) == limit and page[-1].timestamp >= archive_cutoff():
+        return page  # nothing archived can be newer than this page
+
+    chunks = ChatArchive.objects.filter(conversation=conversation).order_by('-last_timestamp')
+    if before is not None:
+        chunks = chunks.filter(first_timestamp__lte=before[0])
+    if len(page) == limit:
+        chunks = chunks.filter(last_timestamp__gte=page[-1].timestamp)
+    for chunk in chunks.iterator():
+        if len(page) >= limit and chunk.last_timestamp < page[limit - 1].timestamp:
+            break
+        archived = _unpack(chunk)
+        if before is not None:
+            archived = [m for m in archived if _newest_first(m) < before]
+        page = sorted(page + archived, key=_newest_first, reverse=True)
+    return page[:limit]
+
+
+def archive(cutoff=None, batch_size=None):
+    """Move read messages sent before `cutoff` into ChatArchive; returns how many moved."""
+    cutoff = archive_cutoff() if cutoff is None else cutoff
+    batch_size = batch_size or settings.CHAT_ARCHIVE_BATCH_SIZE
+    chunk_size = settings.CHAT_ARCHIVE_CHUNK_SIZE
+    # Ids grow with timestamps, so everything to archive sits below the first recent id.
+    boundary = ChatMessage.objects.filter(timestamp__gte=cutoff).order_by('pk').values_list('pk', flat=True).first()
+    candidates = ChatMessage.objects.filter(timestamp__lt=cutoff, is_read=True)
+    if boundary is not None:
+        candidates = candidates.filter(pk__lt=boundary)
+    moved, after = 0, 0
+    while True:
+        with transaction.atomic():
+            rows = list(candidates.filter(pk__gt=after).order_by('pk')
+                        .values_list('conversation', *_FIELDS)[:batch_size])
+            if not rows:
+                return moved
+            after = rows[-1][1]
+            newest = set(ChatMessage.objects.filter(conversation__in={row[0] for row in rows})
+                         .values('conversation').annotate(last=Max('pk')).values_list('last', flat=True))
+            by_conversation = defaultdict(list)
+            for conversation, *fields in rows:
+                if fields[0] not in newest:
+                    by_conversation[conversation].append(tuple(fields))
+            ids = [fields[0] for messages in by_conversation.values() for fields in messages]
+            _store(by_conversation, chunk_size)
+            ChatMessage.objects.filter(pk__in=ids).delete()
+            moved += len(ids)
+
+
+def _store(by_conversation, chunk_size):
+    """Add each conversation's rows to its last chunk while it has room, then to new chunks."""
+    last = {}
+    open_chunks = (ChatArchive.objects.filter(conversation__in=by_conversation, message_count__lt=chunk_size)
+                   .order_by('last_timestamp', 'pk'))
+    for chunk in open_chunks:
+        last[chunk.conversation] = chunk
+    updated, created = [], []
+    for conversation, messages in by_conversation.items():
+        chunk = last.get(conversation)
+        rows = sorted((_rows(chunk) if chunk else []) + messages, key=lambda row: (row[3], row[0]))
+        pieces = [rows[start:start + chunk_size] for start in range(0, len(rows), chunk_size)]
+        if chunk is not None:
+            updated.append(_fill(chunk, pieces.pop(0)))
+        created += [_fill(ChatArchive(conversation=conversation), piece) for piece in pieces]
+    ChatArchive.objects.bulk_update(updated, ['first_timestamp', 'last_timestamp', 'message_count', 'payload'])
+    ChatArchive.objects.bulk_create(created)
+
+
+def all_messages():
+    """
+    (sender_id, receiver_id, timestamp) of every live and archived message,
+    ordered by conversation and then time.
+    """
+    live = (ChatMessage.objects.order_by('conversation', 'timestamp', 'pk')
+            .values_list('conversation', 'timestamp', 'pk', 'sender_id', 'receiver_id')
+            .iterator(chunk_size=5000))
+    return ((sender_id, receiver_id, timestamp)
+            for _, timestamp, _, sender_id, receiver_id in merge(live, _archived_rows()))
+
+
+def _archived_rows():
+    conversation, rows = None, []
+    for chunk in ChatArchive.objects.order_by('conversation').iterator(chunk_size=100):
+        if chunk.conversation != conversation:
+            yield from sorted(rows)
+            conversation, rows = chunk.conversation, []
+        rows += [(m.conversation, m.timestamp, m.pk, m.sender_id, m.receiver_id) for m in _unpack(chunk)]
+    yield from sorted(rows)
@@ -0,0 +1,133 @@
+"""
+Write-buffered view counters.
+
+Counting a page view with its own UPDATE would queue every request behind
+SQLite's single writer. Instead each process accumulates increments in memory
+and flushes them as three batched statements:
+
+- an additive upsert into the per-day PropertyViewCount rollup,
+- an UPDATE of the Property.views running total, and
+- an additive upsert into the owner's AgentDailyStat row.
+
+A flush happens once the buffer is VIEW_COUNTER_FLUSH_INTERVAL seconds old or
+holds VIEW_COUNTER_MAX_PENDING distinct listings, and again at interpreter
+exit. The age is checked after every request (request_finished) and by a timer
+started when the buffer fills, so an idle worker flushes too; a crashed worker
+loses at most one interval's worth of its own views. Test runs
+(BACKGROUND_TASKS_INLINE) start no timer.
+"""
+import atexit
+import datetime
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import AgentDailyStat, Property, PropertyViewCount
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedViewCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()  # (property_id, day) -> views
+        self._last_flush = time.monotonic()
+
+    def increment(self, property_id, n=1):
+        day = timezone.localdate()
+        with self._lock:
+            filling = not self._pending
+            self._pending[(property_id, day)] += n
+            due = len(self._pending) >= settings.VIEW_COUNTER_MAX_PENDING or self._expired()
+        if due:
+            self.flush()
+        elif filling and not settings.BACKGROUND_TASKS_INLINE:
+            timer = threading.Timer(settings.VIEW_COUNTER_FLUSH_INTERVAL, self._flush_idle)
+            timer.daemon = True
+            timer.start()
+
+    def _expired(self):
+        return time.monotonic() - self._last_flush >= settings.VIEW_COUNTER_FLUSH_INTERVAL
+
+    def maybe_flush(self):
+        """Flush if the buffer has waited VIEW_COUNTER_FLUSH_INTERVAL seconds."""
+        if self._pending and self._expired():
+            self.flush()
+
+    def _flush_idle(self):
+        try:
+            self.maybe_flush()
+        finally:
+            connections.close_all()
+
+    def pending(self, property_id):
+        """Views of `property_id` counted in this process but not yet flushed."""
+        with self._lock:
+            return sum(n for (pk, _), n in self._pending.items() if pk == property_id)
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        if not batch:
+            return 0
+        try:
+            write(batch)
+        except DatabaseError:
+            logger.exception('Failed to flush %d view counters; keeping them for the next flush', len(batch))
+            with self._lock:
+                self._pending.update(batch)
+            return 0
+        return sum(batch.values())
+
+
+def write(batch):
+    """Apply {(property_id, day): views} to the listing, daily and agent counters."""
+    alias = router.db_for_write(PropertyViewCount)
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    daily = PropertyViewCount._meta
+    agent = AgentDailyStat._meta
+    totals = Counter()
+    for (property_id, _), n in batch.items():
+        totals[property_id] += n
+
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {quote(daily.db_table)} ({quote("property_id")}, {quote("day")}, {quote("views")}) '
+            f'SELECT %s, %s, %s WHERE EXISTS (SELECT 1 FROM {quote(Property._meta.db_table)} WHERE id = %s) '
+            f'ON CONFLICT ({quote("property_id")}, {quote("day")}) '
+            f'DO UPDATE SET {quote("views")} = {quote(daily.db_table)}.{quote("views")} + excluded.{quote("views")}',
+            [(pk, connection.ops.adapt_datefield_value(day), n, pk) for (pk, day), n in batch.items()])
+        cursor.executemany(
+            f'UPDATE {quote(Property._meta.db_table)} SET {quote("views")} = {quote("views")} + %s WHERE id = %s',
+            [(n, pk) for pk, n in totals.items()])
+        # The owning agent's dashboard rollup (housing.agent_stats).
+        cursor.executemany(
+            f'INSERT INTO {quote(agent.db_table)} ({quote("agent_id")}, {quote("day")}, {quote("views")}) '
+            f'SELECT {quote("owner_id")}, %s, %s FROM {quote(Property._meta.db_table)} WHERE id = %s '
+            f'ON CONFLICT ({quote("agent_id")}, {quote("day")}) '
+            f'DO UPDATE SET {quote("views")} = {quote(agent.db_table)}.{quote("views")} + excluded.{quote("views")}',
+            [(connection.ops.adapt_datefield_value(day), n, pk) for (pk, day), n in batch.items()])
+
+
+views = BufferedViewCounter()
+atexit.register(views.flush)
+
+
+def daily_views(days=30, **filters):
+    """
+    [(day, views)] over the last `days` days, oldest first, summed over the
+    listings selected by `filters` (e.g. property__owner=agent or property=prop).
+    """
+    since = timezone.localdate() - datetime.timedelta(days=days - 1)
+    totals = dict(PropertyViewCount.objects.filter(day__gte=since, **filters)
+                  .values('day').annotate(total=Sum('views')).values_list('day', 'total'))
+    return [(since + datetime.timedelta(days=i), totals.get(since + datetime.timedelta(days=i), 0))
+            for i in range(days)]
@@ -0,0 +1,83 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY_DB = 'default'
+
+# Set for the duration of a request that must read its own writes.
+_pinned = ContextVar('housing_db_pinned', default=False)
+# Set as soon as anything is routed for writing during the current request.
+_wrote = ContextVar('housing_db_wrote', default=False)
+# The replica serving every read of the current request, so its reads never
+# mix replicas that have replayed different amounts of the primary's log.
+_replica = ContextVar('housing_db_replica', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+def pin_to_primary():
+    return _pinned.set(True)
+
+
+def unpin(token):
+    _pinned.reset(token)
+
+
+def wrote_to_primary():
+    return _wrote.get()
+
+
+def reset_write_flag():
+    return _wrote.set(False)
+
+
+def restore_write_flag(token):
+    _wrote.reset(token)
+
+
+def choose_replica():
+    replicas = replica_aliases()
+    return _replica.set(random.choice(replicas) if replicas else None)
+
+
+def release_replica(token):
+    _replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to the primary and spreads reads over the `replica_<n>` aliases.
+    Within a request every read goes to the replica PrimaryPinningMiddleware
+    chose for it. Reads fall back to the primary when no replica is
+    configured, when the request is pinned or once the current request has
+    written anything.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or _wrote.get():
+            return PRIMARY_DB
+        replica = _replica.get()
+        if replica is not None:
+            return replica
+        replicas = replica_aliases()
+        if not replicas:
+            return PRIMARY_DB
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data, so objects may relate across them.
+        pool = {PRIMARY_DB, *replica_aliases()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication.
+        return db == PRIMARY_DB
@@ -0,0 +1,230 @@
+"""
+Near-duplicate listing detection.
+
+Every listing has a ListingFingerprint (MinHash of title/description/location
+and dHashes of its photos) and one ListingBucket row per LSH band key. A new
+listing is checked by looking up its own band keys, which returns only the
+few listings that share a band, and verifying those candidates' signatures;
+the catalog is never scanned. Bands shared by more than MAX_BUCKET_SIZE
+listings are skipped here just as in find_clusters. De-listed homes keep their fingerprint, so
+re-listing one needs no photo re-hashing, but have no buckets, so they are
+never candidates.
+
+Saves and photo uploads only queue re-indexing (reindex_listing,
+reindex_image, unindex_image) for the background thread once their
+transaction commits, so neither hashing nor band rewrites add to a request.
+`manage.py find_duplicate_listings --reindex` rebuilds the whole index.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+
+from . import fingerprints
+from .models import ListingBucket, ListingFingerprint, Property, PropertyImage
+
+# Band groups larger than this are too generic to be evidence of duplication.
+MAX_BUCKET_SIZE = 1000
+
+
+def signature_of(fingerprint):
+    return np.frombuffer(bytes(fingerprint.minhash), dtype=np.uint64)
+
+
+def keys_for(signature, image_hashes):
+    keys = fingerprints.text_band_keys(signature)
+    for value in image_hashes:
+        keys.extend(fingerprints.image_band_keys(value))
+    return keys
+
+
+def _store(prop_id, signature, image_hashes, listed=True):
+    with transaction.atomic():
+        ListingFingerprint.objects.update_or_create(
+            property_id=prop_id,
+            defaults={'minhash': signature.tobytes(), 'image_hashes': image_hashes})
+        ListingBucket.objects.filter(property_id=prop_id).delete()
+        if listed:
+            ListingBucket.objects.bulk_create(
+                [ListingBucket(key=key, property_id=prop_id)
+                 for key in set(keys_for(signature, image_hashes.values()))])
+
+
+def index_listing(prop):
+    """(Re)index a listing's text, keeping the photo hashes already recorded."""
+    existing = ListingFingerprint.objects.filter(property_id=prop.pk).values_list(
+        'image_hashes', flat=True).first()
+    signature = fingerprints.listing_signature(prop.title, prop.description, prop.location)
+    _store(prop.pk, signature, existing or {}, prop.is_listed)
+
+
+def reindex_listing(pk):
+    """Background task: index listing `pk` as it is now, if it still exists."""
+    prop = Property.objects.filter(pk=pk).only('title', 'description', 'location', 'is_listed').first()
+    if prop is not None:
+        index_listing(prop)
+
+
+def reindex_image(pk):
+    """Background task: hash photo `pk` into its listing's fingerprint, if it still exists."""
+    image = PropertyImage.objects.filter(pk=pk).select_related('property').first()
+    if image is not None:
+        index_image(image)
+
+
+def _hash_stored_image(image):
+    try:
+        with image.image.open('rb') as f:
+            return fingerprints.image_hash(f)
+    except (OSError, ValueError):
+        return None
+
+
+def index_image(image):
+    value = _hash_stored_image(image)
+    if value is None:
+        return
+    fingerprint = ListingFingerprint.objects.filter(property_id=image.property_id).first()
+    if fingerprint is None:
+        index_listing(image.property)
+        fingerprint = ListingFingerprint.objects.get(property_id=image.property_id)
+    hashes = dict(fingerprint.image_hashes, **{str(image.pk): value})
+    _store(image.property_id, signature_of(fingerprint), hashes, image.property.is_listed)
+
+
+def unindex_image(image):
+    fingerprint = ListingFingerprint.objects.filter(property_id=image.property_id).first()
+    if fingerprint is None or str(image.pk) not in fingerprint.image_hashes:
+        return
+    hashes = {k: v for k, v in fingerprint.image_hashes.items() if k != str(image.pk)}
+    listed = Property.objects.filter(pk=image.property_id, is_listed=True).exists()
+    _store(image.property_id, signature_of(fingerprint), hashes, listed)
+
+
+def crowded_keys(keys):
+    """The band keys among `keys` shared by more than MAX_BUCKET_SIZE listings."""
+    crowded = (ListingBucket.objects.filter(key__in=keys).values('key')
+               .annotate(members=Count('property_id')).filter(members__gt=MAX_BUCKET_SIZE))
+    return {row['key'] for row in crowded}
+
+
+def find_duplicates(title, description, location, image_files=(), owner=None, exclude=None):
+    """
+    Existing listings (optionally only `owner`'s) that the given listing text and
+    photos nearly duplicate, as [(property, reason)], best match first.
+    """
+    signature = fingerprints.listing_signature(title, description, location)
+    image_hashes = []
+    for f in image_files:
+        value = fingerprints.image_hash(f)
+        f.seek(0)
+        if value is not None:
+            image_hashes.append(value)
+
+    keys = set(keys_for(signature, image_hashes))
+    keys -= crowded_keys(keys)
+    candidates = ListingFingerprint.objects.filter(
+        property_id__in=ListingBucket.objects.filter(key__in=keys).values('property_id'),
+        property__is_listed=True,
+    ).select_related('property')
+    if owner is not None:
+        candidates = candidates.filter(property__owner=owner)
+    if exclude is not None:
+        candidates = candidates.exclude(property_id=exclude)
+
+    matches = []
+    for fingerprint in candidates:
+        text = fingerprints.similarity(signature, signature_of(fingerprint))
+        if text >= fingerprints.JACCARD_THRESHOLD:
+            matches.append((text, fingerprint.property, f'{text:.0%} similar description'))
+            continue
+        for value in image_hashes:
+            if any(fingerprints.hamming(value, other) <= fingerprints.IMAGE_HAMMING_THRESHOLD
+                   for other in fingerprint.image_hashes.values()):
+                matches.append((1.0, fingerprint.property, 'same photo'))
+                break
+    matches.sort(key=lambda match: match[0], reverse=True)
+    return [(prop, reason) for _, prop, reason in matches]
+
+
+def reindex_all(chunk_size=5000, images=False):
+    """Recompute every listing's fingerprint in bulk (for catalogs created before this index)."""
+    image_hashes = {}
+    if images:
+        for image in PropertyImage.objects.only('id', 'property_id', 'image').iterator(chunk_size):
+            value = _hash_stored_image(image)
+            if value is not None:
+                image_hashes.setdefault(image.property_id, {})[str(image.pk)] = value
+
+    with transaction.atomic():
+        if not images:
+            image_hashes = dict(ListingFingerprint.objects.values_list('property_id', 'image_hashes'))
+        ListingBucket.objects.all().delete()
+        ListingFingerprint.objects.all().delete()
+        rows = Property.objects.values_list('id', 'title', 'description', 'location', 'is_listed')
+        fingerprint_rows, bucket_rows, count = [], [], 0
+        for pk, title, description, location, listed in rows.iterator(chunk_size):
+            signature = fingerprints.listing_signature(title, description, location)
+            hashes = image_hashes.get(pk, {})
+            fingerprint_rows.append(ListingFingerprint(
+                property_id=pk, minhash=signature.tobytes(), image_hashes=hashes))
+            if listed:
+                bucket_rows.extend(ListingBucket(key=key, property_id=pk)
+                                   for key in set(keys_for(signature, hashes.values())))
+            count += 1
+            if len(fingerprint_rows) >= chunk_size or len(bucket_rows) >= chunk_size * 4:
+                ListingFingerprint.objects.bulk_create(fingerprint_rows, batch_size=chunk_size)
+                ListingBucket.objects.bulk_create(bucket_rows, batch_size=chunk_size)
+                fingerprint_rows, bucket_rows = [], []
+        ListingFingerprint.objects.bulk_create(fingerprint_rows, batch_size=chunk_size)
+        ListingBucket.objects.bulk_create(bucket_rows, batch_size=chunk_size)
+    return count
+
+
+def find_clusters(chunk_size=5000):
+    """
+    Group the whole catalog into clusters of near-duplicates. Only listings
+    sharing an LSH bucket are compared; matches are merged with union-find.
+    """
+    signatures, image_hashes = {}, {}
+    for pk, minhash, hashes in ListingFingerprint.objects.filter(property__is_listed=True).values_list(
+            'property_id', 'minhash', 'image_hashes').iterator(chunk_size):
+        signatures[pk] = np.frombuffer(bytes(minhash), dtype=np.uint64)
+        image_hashes[pk] = list(hashes.values())
+
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def is_duplicate(a, b):
+        if fingerprints.similarity(signatures[a], signatures[b]) >= fingerprints.JACCARD_THRESHOLD:
+            return True
+        return any(fingerprints.hamming(x, y) <= fingerprints.IMAGE_HAMMING_THRESHOLD
+                   for x in image_hashes[a] for y in image_hashes[b])
+
+    def compare(members):
+        if len(members) < 2 or len(members) > MAX_BUCKET_SIZE:
+            return
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if find(a) != find(b) and is_duplicate(a, b):
+                    parent[find(a)] = find(b)
+
+    current_key, members = None, []
+    buckets = ListingBucket.objects.order_by('key').values_list('key', 'property_id')
+    for key, pk in buckets.iterator(chunk_size):
+        if key != current_key:
+            compare(members)
+            current_key, members = key, []
+        if pk in signatures:
+            members.append(pk)
+    compare(members)
+
+    clusters = {}
+    for pk in parent:
+        clusters.setdefault(find(pk), []).append(pk)
+    return sorted((sorted(c) for c in clusters.values() if len(c) > 1), key=len, reverse=True)
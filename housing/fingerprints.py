@@ -0,0 +1,98 @@
+"""
+Near-duplicate fingerprints for listings: MinHash signatures of listing text,
+difference hashes (dHash) of photos, and the LSH band keys that make both
+searchable by exact lookup.
+
+This module only depends on NumPy and Pillow; housing.dedup stores and queries
+the keys for the Django app. The FastAPI backend (api/app.py) keeps its own
+listing tables with no fingerprints or buckets, so POST /api/properties does
+not check for duplicates: only listings created through the Django site are.
+"""
+import hashlib
+import re
+import zlib
+
+import numpy as np
+
+NUM_PERMUTATIONS = 64
+# 16 bands of 4 rows: listings with text Jaccard similarity 0.7 share a band
+# with probability ~0.99, pairs at 0.3 only ~0.12.
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+JACCARD_THRESHOLD = 0.7
+
+# 64-bit dHash split into 6 bands: by pigeonhole, two hashes within Hamming
+# distance 5 agree exactly on at least one band.
+IMAGE_HASH_BANDS = [(0, 11), (11, 22), (22, 33), (33, 44), (44, 54), (54, 64)]
+IMAGE_HAMMING_THRESHOLD = 5
+
+_PRIME = 4294967311  # smallest prime above 2**32
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(1, 2 ** 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+_B = _rng.randint(0, 2 ** 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def shingles(*parts, size=3):
+    """Word `size`-grams of the normalized text parts."""
+    tokens = _TOKEN.findall(' '.join(p or '' for p in parts).lower())
+    if len(tokens) < size:
+        return {' '.join(tokens)} if tokens else set()
+    return {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def minhash(shingle_set):
+    """MinHash signature (uint64 array of NUM_PERMUTATIONS) of a shingle set."""
+    if not shingle_set:
+        return np.full(NUM_PERMUTATIONS, _PRIME, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingle_set), dtype=np.uint64)
+    # a * x stays below 2**63 because a < 2**31 and x < 2**32.
+    permuted = (_A[:, None] * hashes[None, :] + _B[:, None]) % np.uint64(_PRIME)
+    return permuted.min(axis=1)
+
+
+def listing_signature(title, description, location):
+    return minhash(shingles(title, description, location))
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return float(np.mean(signature_a == signature_b))
+
+
+def _key(*parts):
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def text_band_keys(signature):
+    return [
+        _key('text', band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes())
+        for band in range(BANDS)
+    ]
+
+
+def image_hash(fileobj):
+    """64-bit difference hash of an image file, or None if it cannot be read."""
+    from PIL import Image
+
+    try:
+        with Image.open(fileobj) as image:
+            pixels = np.asarray(image.convert('L').resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    except Exception:
+        return None
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+def image_band_keys(value):
+    keys = []
+    for band, (start, stop) in enumerate(IMAGE_HASH_BANDS):
+        bits = (value >> (64 - stop)) & ((1 << (stop - start)) - 1)
+        keys.append(_key('image', band, bits))
+    return keys
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
@@ -1,5 +1,6 @@
 from django import forms
-from .models import Property, AgentRating
+from .models import Property, AgentRating, SavedSearch
+from .price_stats import area_key
 from django.contrib.auth import get_user_model
 
 class MultipleFileInput(forms.ClearableFileInput):
@@ -71,3 +72,17 @@ class ChatForm(forms.Form):
         'class': 'block w-full px-4 py-3 rounded-md border-gray-300 shadow-sm focus:border-blue-500 focus:ring-blue-500 sm:text-sm',
         'placeholder': 'Type your message...'
     }))
+
+class SavedSearchForm(forms.ModelForm):
+    class Meta:
+        model = SavedSearch
+        fields = ['listing_type', 'property_type', 'location', 'price_band']
+        widgets = {
+            'listing_type': forms.Select(attrs={'class': 'block w-full px-4 py-3 rounded-md border-gray-300 shadow-sm focus:border-blue-500 focus:ring-blue-500 sm:text-sm'}),
+            'property_type': forms.Select(attrs={'class': 'block w-full px-4 py-3 rounded-md border-gray-300 shadow-sm focus:border-blue-500 focus:ring-blue-500 sm:text-sm'}),
+            'location': forms.TextInput(attrs={'class': 'block w-full px-4 py-3 rounded-md border-gray-300 shadow-sm focus:border-blue-500 focus:ring-blue-500 sm:text-sm', 'placeholder': 'Any location (e.g. Kigali or Kacyiru)'}),
+            'price_band': forms.Select(attrs={'class': 'block w-full px-4 py-3 rounded-md border-gray-300 shadow-sm focus:border-blue-500 focus:ring-blue-500 sm:text-sm'}),
+        }
+
+    def clean_location(self):
+        return area_key(self.cleaned_data['location'])
@@ -0,0 +1,75 @@
+import heapq
+import itertools
+import time
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import Registry
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that counts statements, sums their wall time and
+    keeps the `keep` slowest ones. With `capture=True` every statement is kept,
+    which is what the query budget assertions use to explain a failure.
+    """
+
+    def __init__(self, keep=3, capture=False):
+        self.keep = keep
+        self.count = 0
+        self.duration = 0.0
+        self.statements = [] if capture else None
+        self._slowest = []
+        self._tiebreak = itertools.count()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, time.perf_counter() - start, context['connection'].alias)
+
+    def record(self, sql, duration, alias='default'):
+        self.count += 1
+        self.duration += duration
+        if self.statements is not None:
+            self.statements.append(sql)
+        entry = (duration, next(self._tiebreak), sql, alias)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif self.keep:
+            heapq.heappushpop(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        return [
+            {'sql': sql, 'ms': round(duration * 1000, 2), 'db': alias}
+            for duration, _, sql, alias in sorted(self._slowest, reverse=True)
+        ]
+
+
+@contextmanager
+def record_queries(keep=3, capture=False):
+    """Install a QueryRecorder on every configured database alias."""
+    recorder = QueryRecorder(keep=keep, capture=capture)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def server_timing(recorder, total):
+    """Render a Server-Timing header value for one request."""
+    return (
+        f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries", '
+        f'app;dur={total * 1000:.1f}'
+    )
+
+
+@lru_cache(maxsize=None)
+def metrics():
+    """This process's metrics registry (see housing.metrics), a no-op unless METRICS_ENABLED."""
+    return Registry(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL, enabled=settings.METRICS_ENABLED)
@@ -0,0 +1,158 @@
+import base64
+import random
+from datetime import timedelta
+from email.mime.base import MIMEBase
+
+from django.conf import settings
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """
+    Email backend that stores messages in the OutboundEmail table instead of
+    talking to a mail server, so send_mail() in a view costs one INSERT.
+    The `send_queued_mail` management command delivers them through
+    settings.EMAIL_DELIVERY_BACKEND.
+    """
+
+    def send_messages(self, email_messages):
+        rows = [serialize(message) for message in email_messages if message.recipients()]
+        OutboundEmail.objects.bulk_create(rows)
+        return len(rows)
+
+
+def serialize(message):
+    """
+    The OutboundEmail row for `message`. Attachments are stored base64-encoded
+    in the envelope; prebuilt MIME attachments cannot be queued and raise
+    ValueError.
+    """
+    attachments = []
+    for attachment in message.attachments:
+        if isinstance(attachment, MIMEBase):
+            raise ValueError('MIME attachments cannot be queued; attach (filename, content, mimetype) instead.')
+        filename, content, mimetype = attachment
+        if isinstance(content, str):
+            content = content.encode()
+        attachments.append([filename, base64.b64encode(content).decode('ascii'), mimetype])
+    return OutboundEmail(
+        subject=message.subject,
+        body=message.body,
+        from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+        envelope={
+            'to': list(message.to),
+            'cc': list(message.cc),
+            'bcc': list(message.bcc),
+            'reply_to': list(message.reply_to),
+            'headers': dict(message.extra_headers),
+            'alternatives': [
+                [content, mimetype] for content, mimetype in getattr(message, 'alternatives', [])
+            ],
+            'attachments': attachments,
+        },
+    )
+
+
+def deserialize(row):
+    envelope = row.envelope
+    message = EmailMultiAlternatives if envelope.get('alternatives') else EmailMessage
+    message = message(
+        subject=row.subject,
+        body=row.body,
+        from_email=row.from_email,
+        to=envelope.get('to'),
+        cc=envelope.get('cc'),
+        bcc=envelope.get('bcc'),
+        reply_to=envelope.get('reply_to'),
+        headers=envelope.get('headers'),
+    )
+    for content, mimetype in envelope.get('alternatives', []):
+        message.attach_alternative(content, mimetype)
+    for filename, content, mimetype in envelope.get('attachments', []):
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, capped at MAIL_QUEUE_MAX_BACKOFF seconds."""
+    delay = min(settings.MAIL_QUEUE_MAX_BACKOFF, settings.MAIL_QUEUE_BASE_BACKOFF * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_batch(batch_size, lease_seconds, max_attempts=None):
+    """
+    Atomically claim up to `batch_size` due messages for this worker. Messages
+    left in 'sending' by a worker that died become claimable again once their
+    lease runs out; the lost send counts as an attempt, so a message that
+    keeps killing its worker fails after `max_attempts` like any other.
+    """
+    max_attempts = max_attempts or settings.MAIL_QUEUE_MAX_ATTEMPTS
+    now = timezone.now()
+    due = Q(status='pending') | Q(status='sending')
+    with transaction.atomic():
+        due_rows = list(
+            OutboundEmail.objects.filter(due, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', 'status', 'attempts')[:batch_size]
+        )
+        expired = [(pk, attempts) for pk, status, attempts in due_rows if status == 'sending']
+        given_up = {pk for pk, attempts in expired if attempts + 1 >= max_attempts}
+        if expired:
+            OutboundEmail.objects.filter(id__in=[pk for pk, _ in expired]).update(
+                attempts=F('attempts') + 1, last_error='Lease expired while sending')
+            OutboundEmail.objects.filter(id__in=given_up).update(status='failed')
+        ids = [pk for pk, _, _ in due_rows if pk not in given_up]
+        if not ids:
+            return []
+        OutboundEmail.objects.filter(id__in=ids).update(
+            status='sending', next_attempt_at=now + timedelta(seconds=lease_seconds))
+    return list(OutboundEmail.objects.filter(id__in=ids).order_by('id'))
+
+
+def deliver_batch(rows, max_attempts, connection=None):
+    """
+    Send claimed rows over a single connection to the delivery backend and
+    record the outcome of each. Returns (sent, retried, failed) counts.
+    """
+    connection = connection or get_connection(settings.EMAIL_DELIVERY_BACKEND)
+    sent, retry, failed = [], [], []
+
+    def record_failure(row, error):
+        row.attempts += 1
+        row.last_error = f'{type(error).__name__}: {error}'
+        if row.attempts >= max_attempts:
+            row.status = 'failed'
+            failed.append(row)
+        else:
+            row.status = 'pending'
+            row.next_attempt_at = timezone.now() + retry_delay(row.attempts)
+            retry.append(row)
+
+    try:
+        connection.open()
+    except Exception as e:
+        for row in rows:
+            record_failure(row, e)
+    else:
+        try:
+            for row in rows:
+                try:
+                    connection.send_messages([deserialize(row)])
+                except Exception as e:
+                    record_failure(row, e)
+                else:
+                    sent.append(row.id)
+        finally:
+            connection.close()
+
+    OutboundEmail.objects.filter(id__in=sent).update(
+        status='sent', sent_at=timezone.now(), last_error='')
+    OutboundEmail.objects.bulk_update(
+        retry + failed, ['status', 'attempts', 'last_error', 'next_attempt_at'])
+    return len(sent), len(retry), len(failed)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from housing.chat import archive
+
+
+class Command(BaseCommand):
+    help = (f'Move read chat messages older than CHAT_ARCHIVE_AFTER_DAYS '
+            f'({settings.CHAT_ARCHIVE_AFTER_DAYS}) into the compressed ChatArchive table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.CHAT_ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        moved = archive(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} messages.'))
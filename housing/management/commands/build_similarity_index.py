@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from housing.similarity import DEFAULT_K, build
+
+
+class Command(BaseCommand):
+    help = 'Embed every listing and precompute its nearest "similar properties".'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=DEFAULT_K, help='neighbours kept per listing')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        listings, entries = build(k=options['k'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {listings} listings with {entries} neighbour entries.'))
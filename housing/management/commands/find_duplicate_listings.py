@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from housing.dedup import find_clusters, reindex_all
+from housing.models import Property
+
+
+class Command(BaseCommand):
+    help = 'List clusters of near-duplicate listings using the MinHash/LSH fingerprint index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reindex', action='store_true',
+                            help='Recompute every fingerprint before clustering.')
+        parser.add_argument('--images', action='store_true',
+                            help='With --reindex, also hash every stored photo.')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--limit', type=int, default=50, help='Clusters to print.')
+
+    def handle(self, *args, **options):
+        if options['reindex']:
+            count = reindex_all(chunk_size=options['chunk_size'], images=options['images'])
+            self.stdout.write(f'Fingerprinted {count} listings.')
+
+        clusters = find_clusters(chunk_size=options['chunk_size'])
+        shown = clusters[:options['limit']]
+        titles = dict(Property.objects.filter(
+            pk__in=[pk for cluster in shown for pk in cluster]).values_list('pk', 'title'))
+        for cluster in shown:
+            self.stdout.write(', '.join(f'#{pk} {titles.get(pk, "")!r}' for pk in cluster))
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(clusters)} clusters, {sum(map(len, clusters))} listings involved.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from housing.agent_stats import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute every agent dashboard rollup from listings, views, messages and ratings.'
+
+    def handle(self, *args, **options):
+        rows = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} agent daily rows.'))
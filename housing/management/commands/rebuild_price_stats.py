@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from housing.price_stats import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute every per-area price statistic from the Property table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        groups = rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt price statistics for {groups} groups.'))
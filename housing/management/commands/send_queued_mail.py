@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from housing.mail import claim_batch, deliver_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbound email (see housing.mail.QueuedEmailBackend).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.MAIL_QUEUE_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=settings.MAIL_QUEUE_MAX_ATTEMPTS)
+        parser.add_argument('--lease', type=int, default=300,
+                            help='seconds before an unfinished claim can be taken over')
+        parser.add_argument('--idle-sleep', type=float, default=2.0,
+                            help='seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='drain what is due now and exit instead of polling')
+
+    def handle(self, *args, **options):
+        while True:
+            rows = claim_batch(options['batch_size'], options['lease'], options['max_attempts'])
+            if not rows:
+                if options['once']:
+                    return
+                time.sleep(options['idle_sleep'])
+                continue
+            sent, retried, failed = deliver_batch(rows, options['max_attempts'])
+            self.stdout.write(f'sent={sent} retried={retried} failed={failed}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from housing.saved_searches import send_digests
+
+
+class Command(BaseCommand):
+    help = 'Email each user one digest of new listings matching their saved searches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-users', type=int, default=500,
+                            help='users per batch; batches repeat until nothing is pending')
+        parser.add_argument('--base-url', default='',
+                            help='site origin for links in the email, e.g. https://rwandahousing.com')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            sent, processed = send_digests(max_users=options['batch_users'], base_url=options['base_url'])
+            if not processed:
+                break
+            total += sent
+        self.stdout.write(self.style.SUCCESS(f'Queued {total} digest emails.'))
@@ -0,0 +1,203 @@
+"""
+Serving uploaded media: conditional requests, byte ranges, precompressed
+variants and cache headers.
+
+Uploads are stored under content-hashed names (`photo.3f2a9c1b0d4e.jpg`, see
+housing.storage). Such a URL never changes content, so it is served with a
+year-long `immutable` Cache-Control and the hash from the name as its ETag;
+no file has to be read to validate it. Older, unhashed names get a short
+max-age and an ETag derived from the file's size and mtime.
+
+A `.br` or `.gz` file next to a compressible original (SVG, JSON, text) is
+sent instead when the client accepts that encoding.
+
+`plan()` only decides what to send. The Django view (housing.views.serve_media)
+and the FastAPI route (api.app) turn the plan into a response, so this module
+only uses the standard library.
+"""
+import email.utils
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+from typing import NamedTuple, Optional
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_MAX_AGE = 3600
+
+HASH_LENGTH = 12
+_HASHED = re.compile(r'\.([0-9a-f]{%d})(?:\.[A-Za-z0-9]+)?$' % HASH_LENGTH)
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Encodings we look for next to compressible files, in order of preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_TYPES = {'image/svg+xml', 'application/json', 'application/javascript', 'application/xml'}
+
+
+def content_hash(chunks):
+    """Short hex digest of an iterable of byte chunks, as used in hashed names."""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(name, digest):
+    """
+    'properties/a.jpg' -> 'properties/a.<digest>.jpg'. A hash-like suffix in the
+    client's name is replaced, so a name can only ever carry its own content's hash.
+    """
+    match = _HASHED.search(name)
+    if match:
+        name = name[:match.start()] + name[match.end(1):]
+    root, ext = os.path.splitext(name)
+    return f'{root}.{digest}{ext}'
+
+
+def name_hash(name):
+    """The content hash embedded in a hashed name, or None."""
+    match = _HASHED.search(name)
+    return match.group(1) if match else None
+
+
+class Plan(NamedTuple):
+    status: int
+    headers: dict
+    path: Optional[str] = None  # file to send, or None for no body
+    offset: int = 0
+    length: int = 0
+
+
+def _accepts(accept_encoding, coding):
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        if token.strip().lower() == coding:
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def _etag_matches(header, etag):
+    if header is None:
+        return False
+    if header.strip() == '*':
+        return True
+    weak_free = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == weak_free for tag in header.split(','))
+
+
+def _byte_range(header, size):
+    """(start, end) inclusive for a single `bytes=` range, 'unsatisfiable', or None for the whole file."""
+    match = _RANGE.match(header.replace(' ', ''))
+    if not match:
+        return None  # malformed or multiple ranges: send everything
+    first, last = match.groups()
+    if not first:
+        if not last or int(last) == 0:
+            return 'unsatisfiable' if last else None
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if start >= size:
+        return 'unsatisfiable'
+    end = min(int(last), size - 1) if last else size - 1
+    if end < start:
+        return None
+    return start, end
+
+
+def resolve(root, name):
+    """Absolute path of `name` inside `root`, or None if it escapes it."""
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, name.lstrip('/')))
+    if os.path.commonpath([root, path]) != root:
+        return None
+    return path
+
+
+def plan(root, name, headers, max_age=DEFAULT_MAX_AGE):
+    """
+    Decide the response to a GET or HEAD for media file `name` under `root`.
+    `headers` maps lower-case request header names to values.
+    """
+    path = resolve(root, name)
+    try:
+        st = os.stat(path) if path else None
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
+        return Plan(404, {})
+
+    content_type, _ = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    digest = name_hash(name)
+    response_headers = {
+        'Content-Type': content_type,
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if digest else f'public, max-age={max_age}',
+        'Last-Modified': email.utils.formatdate(st.st_mtime, usegmt=True),
+    }
+    etag = digest or f'{st.st_mtime_ns:x}-{st.st_size:x}'
+
+    if content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES:
+        response_headers['Vary'] = 'Accept-Encoding'
+        for coding, suffix in ENCODINGS:
+            if not _accepts(headers.get('accept-encoding'), coding):
+                continue
+            try:
+                variant = os.stat(path + suffix)
+            except OSError:
+                continue
+            path, st, etag = path + suffix, variant, f'{etag}-{coding}'
+            response_headers['Content-Encoding'] = coding
+            break
+    response_headers['ETag'] = etag = f'"{etag}"'
+
+    if _etag_matches(headers.get('if-none-match'), etag):
+        return Plan(304, {k: v for k, v in response_headers.items() if k != 'Content-Type'})
+
+    size = st.st_size
+    requested = headers.get('range')
+    if_range = headers.get('if-range')
+    if requested and (if_range is None or if_range.strip() == etag):
+        byte_range = _byte_range(requested, size)
+        if byte_range == 'unsatisfiable':
+            return Plan(416, {**response_headers, 'Content-Range': f'bytes */{size}', 'Content-Length': '0'})
+        if byte_range is not None:
+            start, end = byte_range
+            response_headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response_headers['Content-Length'] = str(end - start + 1)
+            return Plan(206, response_headers, path, start, end - start + 1)
+
+    response_headers['Content-Length'] = str(size)
+    return Plan(200, response_headers, path, 0, size)
+
+
+class RangeFile:
+    """
+    A file object limited to `length` bytes from `offset`. `fileno()` and the
+    seek position are those of the real file, so WSGI servers that implement
+    wsgi.file_wrapper with sendfile() (e.g. gunicorn) still transfer the range
+    zero-copy, bounded by the Content-Length header.
+    """
+
+    def __init__(self, path, offset, length):
+        self._file = open(path, 'rb')
+        self._file.seek(offset)
+        self._remaining = length
+        self.name = path
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
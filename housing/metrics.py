@@ -0,0 +1,234 @@
+"""
+Counters, gauges and latency histograms in Prometheus text format, summed
+over every worker process.
+
+Recording only updates dicts in the current process. Every
+`flush_interval` seconds (checked at the end of each request) a process
+writes its cumulative totals to `<pid>-<start>.json` in the registry's
+directory, replacing its previous file. `collect` reads every file and adds
+them up. A dead process's counters and histograms are folded into
+`dead.json`, so totals never go backwards when workers are recycled. Its
+gauges, which described work in progress, are dropped.
+
+Scrapes therefore lag by up to one flush interval per process. Liveness
+is checked with kill(pid, 0), so the directory must be local to the host.
+
+This module only uses the standard library and filelock, so the Django site
+(housing.instrumentation) and the FastAPI backend (api.instrumentation) can
+both use it.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from filelock import FileLock
+
+# Upper bounds, in seconds, of the latency histogram buckets (plus +Inf).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'http_requests_total': 'Requests handled, by route, method and status.',
+    'http_request_duration_seconds': 'Request latency, by route and method.',
+    'http_requests_in_flight': 'Requests being handled.',
+    'db_queries_total': 'SQL statements run, by route.',
+    'db_query_duration_seconds_total': 'Time spent running SQL, by route.',
+    'db_connections_opened_total': 'Database connections opened.',
+    'db_connections_in_use': 'Pooled database connections checked out.',
+    'cache_requests_total': 'Cache lookups, by cache and result (hit or miss).',
+    'upload_bytes_total': 'Bytes of uploaded files received, by kind.',
+}
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_DEAD = 'dead.json'
+
+
+def method_label(method):
+    """The request method, or OTHER, so arbitrary methods cannot add label values."""
+    return method if method in METHODS else 'OTHER'
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    def __init__(self, directory, flush_interval=5.0, enabled=True):
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self._reset()
+        if enabled:
+            os.register_at_fork(after_in_child=self._reset)
+            atexit.register(self.flush)
+
+    def _reset(self):
+        # Also run in forked children: they start with their own empty totals and file.
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = defaultdict(float)
+        self._histograms = {}  # key -> [count per bucket..., +Inf count, sum]
+        self._path = None
+        self._flushed = time.monotonic()
+
+    def inc(self, name, value=1, **labels):
+        if self.enabled:
+            with self._lock:
+                self._counters[_key(name, labels)] += value
+
+    def add(self, name, delta, **labels):
+        if self.enabled:
+            with self._lock:
+                self._gauges[_key(name, labels)] += delta
+
+    def observe(self, name, value, **labels):
+        if self.enabled:
+            key = _key(name, labels)
+            with self._lock:
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+                histogram[bisect.bisect_left(BUCKETS, value)] += 1
+                histogram[-1] += value
+
+    def maybe_flush(self):
+        if self.enabled and time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write this process's totals to its file in `directory`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._flushed = time.monotonic()
+            if self._path is None and not (self._counters or self._gauges or self._histograms):
+                return
+            state = {
+                'pid': os.getpid(),
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self._gauges.items()],
+                'histograms': [[name, labels, values] for (name, labels), values in self._histograms.items()],
+            }
+            if self._path is None:
+                self._path = self.directory / f'{os.getpid()}-{time.time_ns()}.json'
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(state, separators=(',', ':')))
+        tmp.replace(self._path)
+
+    def collect(self):
+        """Every process's metrics, summed, in Prometheus text format."""
+        self.flush()
+        return collect(self.directory)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Totals:
+    def __init__(self, state=None):
+        self.counters = defaultdict(float)
+        self.gauges = defaultdict(float)
+        self.histograms = {}
+        if state:
+            self.add(state)
+
+    def add(self, state, gauges=True):
+        for name, labels, value in state.get('counters', ()):
+            self.counters[name, tuple(map(tuple, labels))] += value
+        if gauges:
+            for name, labels, value in state.get('gauges', ()):
+                self.gauges[name, tuple(map(tuple, labels))] += value
+        for name, labels, values in state.get('histograms', ()):
+            key = name, tuple(map(tuple, labels))
+            current = self.histograms.get(key)
+            self.histograms[key] = values if current is None else [a + b for a, b in zip(current, values)]
+
+    def state(self):
+        return {
+            'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+            'histograms': [[name, labels, values] for (name, labels), values in self.histograms.items()],
+        }
+
+
+def _read(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def collect(directory):
+    """Sum the files in `directory` (see Registry.flush) and render them."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    with FileLock(str(directory / 'collect.lock')):
+        dead = _Totals(_read(directory / _DEAD))
+        totals = _Totals(dead.state())
+        folded = False
+        for path in sorted(directory.glob('*-*.json')):
+            state = _read(path)
+            if state is None:
+                continue
+            if _alive(state['pid']):
+                totals.add(state)
+            else:
+                dead.add(state, gauges=False)
+                totals.add(state, gauges=False)
+                path.unlink(missing_ok=True)
+                folded = True
+        if folded:
+            tmp = directory / (_DEAD + '.tmp')
+            tmp.write_text(json.dumps(dead.state(), separators=(',', ':')))
+            tmp.replace(directory / _DEAD)
+    return render(totals)
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(totals):
+    lines = []
+    families = [('counter', totals.counters), ('gauge', totals.gauges), ('histogram', totals.histograms)]
+    for kind, series in families:
+        by_name = defaultdict(list)
+        for (name, labels), value in series.items():
+            by_name[name].append((labels, value))
+        for name in sorted(by_name):
+            if name in HELP:
+                lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(by_name[name]):
+                if kind != 'histogram':
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(value[-1])}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
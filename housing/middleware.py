@@ -0,0 +1,114 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from . import db_router, profiling
+from .instrumentation import metrics, record_queries, server_timing
+from .metrics import method_label
+
+sql_logger = logging.getLogger('housing.sql')
+
+PIN_COOKIE_NAME = 'pin_primary'
+UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class PrimaryPinningMiddleware:
+    """
+    Keeps a client's reads on the primary database while its own writes may not
+    have reached the replicas yet. Requests with an unsafe method are pinned for
+    their whole duration; any request that wrote sets a short-lived cookie that
+    pins the client's following requests for REPLICA_PIN_SECONDS. Unpinned
+    requests read from one replica, chosen when they start.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = request.method in UNSAFE_METHODS or PIN_COOKIE_NAME in request.COOKIES
+        pin_token = db_router.pin_to_primary() if pinned else None
+        write_token = db_router.reset_write_flag()
+        replica_token = db_router.choose_replica()
+        try:
+            response = self.get_response(request)
+            if db_router.wrote_to_primary() and db_router.replica_aliases():
+                response.set_cookie(
+                    PIN_COOKIE_NAME, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                    samesite='Lax',
+                )
+            return response
+        finally:
+            db_router.release_replica(replica_token)
+            db_router.restore_write_flag(write_token)
+            if pin_token is not None:
+                db_router.unpin(pin_token)
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Records the number of SQL statements, their total time and the slowest few
+    for each request. The totals go out as a `Server-Timing` header and each
+    request is logged as one JSON line on the `housing.sql` logger: at WARNING
+    when it took SQL_SLOW_REQUEST_MS or longer, at INFO otherwise. Latency,
+    in-flight requests and SQL totals per route also go to housing.metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.keep = getattr(settings, 'SQL_SLOWEST_STATEMENTS', 3)
+        self.slow = getattr(settings, 'SQL_SLOW_REQUEST_MS', 1000) / 1000
+
+    def __call__(self, request):
+        registry = metrics()
+        registry.add('http_requests_in_flight', 1)
+        start = time.perf_counter()
+        try:
+            with record_queries(keep=self.keep) as recorder:
+                response = self.get_response(request)
+        finally:
+            registry.add('http_requests_in_flight', -1)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = server_timing(recorder, total)
+        match = request.resolver_match
+        route = match.view_name if match else None
+        label, method = route or 'unmatched', method_label(request.method)
+        registry.inc('http_requests_total', route=label, method=method, status=str(response.status_code))
+        registry.observe('http_request_duration_seconds', total, route=label, method=method)
+        registry.inc('db_queries_total', recorder.count, route=label)
+        registry.inc('db_query_duration_seconds_total', recorder.duration, route=label)
+        registry.maybe_flush()
+        level = logging.WARNING if total >= self.slow else logging.INFO
+        if not sql_logger.isEnabledFor(level):
+            return response
+        sql_logger.log(level, json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'sql_ms': round(recorder.duration * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'slowest': recorder.slowest,
+        }))
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests that ask for it (see housing.profiling) when the user is
+    staff; everyone else's `?_profile=` is ignored.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = profiling.requested_mode(request)
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+        return profiling.profile(request, self.get_response, mode)
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('housing', '0008_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('area', models.CharField(max_length=100)),
+                ('property_type', models.CharField(choices=[('house', 'House'), ('flat', 'Flat'), ('apartment', 'Apartment'), ('bungalow', 'Bungalow')], max_length=20)),
+                ('listing_type', models.CharField(choices=[('sale', 'For Sale'), ('rent', 'For Rent')], max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+                ('mean', models.FloatField(blank=True, null=True)),
+                ('p25', models.FloatField(blank=True, null=True)),
+                ('median', models.FloatField(blank=True, null=True)),
+                ('p75', models.FloatField(blank=True, null=True)),
+                ('sketch', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('area', 'property_type', 'listing_type'), name='unique_price_statistic')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('housing', '0009_pricestatistic'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertySimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_entries', to='housing.property')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='housing.property')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['property', '-score'], name='property_similarity_idx')],
+                'constraints': [models.UniqueConstraint(fields=('property', 'similar'), name='unique_property_similarity')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('housing', '0010_propertysimilarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingFingerprint',
+            fields=[
+                ('property', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='housing.property')),
+                ('minhash', models.BinaryField()),
+                ('image_hashes', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ListingBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField()),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='housing.property')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('key', 'property'), name='unique_listing_bucket')],
+            },
+        ),
+    ]
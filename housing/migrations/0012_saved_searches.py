@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('housing', '0011_listing_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_type', models.CharField(blank=True, choices=[('sale', 'For Sale'), ('rent', 'For Rent')], max_length=10)),
+                ('property_type', models.CharField(blank=True, choices=[('house', 'House'), ('flat', 'Flat'), ('apartment', 'Apartment'), ('bungalow', 'Bungalow')], max_length=20)),
+                ('location', models.CharField(blank=True, max_length=100)),
+                ('price_band', models.CharField(blank=True, choices=[('0-200k', 'Under 200,000 FRW'), ('200k-500k', '200,000 - 500,000 FRW'), ('500k-1m', '500,000 - 1,000,000 FRW'), ('1m-20m', '1,000,000 - 20,000,000 FRW'), ('20m-100m', '20,000,000 - 100,000,000 FRW'), ('100m+', 'Over 100,000,000 FRW')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saved_searches', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SavedSearchMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='housing.property')),
+                ('search', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='housing.savedsearch')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='savedsearch',
+            index=models.Index(fields=['location', 'listing_type', 'property_type', 'price_band'], name='saved_search_criteria_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='savedsearchmatch',
+            index=models.Index(fields=['notified_at', 'created_at'], name='saved_search_pending_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='savedsearchmatch',
+            constraint=models.UniqueConstraint(fields=('search', 'property'), name='unique_saved_search_match'),
+        ),
+    ]
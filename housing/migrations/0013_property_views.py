@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('housing', '0012_saved_searches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='views',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='PropertyViewCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_views', to='housing.property')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('property', 'day'), name='unique_property_view_day')],
+            },
+        ),
+    ]
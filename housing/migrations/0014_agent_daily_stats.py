@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('housing', '0013_property_views'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('listings_added', models.PositiveIntegerField(db_default=0, default=0)),
+                ('listings_removed', models.PositiveIntegerField(db_default=0, default=0)),
+                ('views', models.PositiveIntegerField(db_default=0, default=0)),
+                ('chats_received', models.PositiveIntegerField(db_default=0, default=0)),
+                ('responses', models.PositiveIntegerField(db_default=0, default=0)),
+                ('response_seconds', models.FloatField(db_default=0, default=0)),
+                ('ratings', models.IntegerField(db_default=0, default=0)),
+                ('rating_total', models.IntegerField(db_default=0, default=0)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('agent', 'day'), name='unique_agent_daily_stat')],
+            },
+        ),
+    ]
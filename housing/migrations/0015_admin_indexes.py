@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('housing', '0014_agent_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='is_listed',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['is_read', 'receiver'], name='chat_message_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['listing_type', 'is_listed'], name='property_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['is_listed'], name='property_is_listed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['property_type'], name='property_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['user_type'], name='user_type_idx'),
+        ),
+    ]
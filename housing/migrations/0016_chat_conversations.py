@@ -0,0 +1,50 @@
+from django.db import migrations, models
+
+
+def fill_conversations(apps, schema_editor):
+    ChatMessage = apps.get_model('housing', 'ChatMessage')
+    pairs = ChatMessage.objects.values_list('sender_id', 'receiver_id').distinct()
+    for sender_id, receiver_id in pairs.iterator():
+        low, high = sorted((sender_id, receiver_id))
+        ChatMessage.objects.filter(sender_id=sender_id, receiver_id=receiver_id).update(
+            conversation=f'{low}-{high}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('housing', '0015_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='chatmessage',
+            options={},
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='conversation',
+            field=models.CharField(default='', editable=False, max_length=41),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_conversations, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['conversation', 'timestamp'], name='chat_conversation_idx'),
+        ),
+        migrations.CreateModel(
+            name='ChatArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation', models.CharField(max_length=41)),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('payload', models.BinaryField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['conversation', 'last_timestamp'],
+                                         name='chat_archive_conversation_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+import math
+import re
+
+from django.db import migrations
+
+# Frozen copy of housing.price_stats as of this migration, so later changes to
+# the live module cannot change what this migration writes.
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+
+def area_key(location):
+    return re.sub(r'\s*,\s*', ', ', re.sub(r'\s+', ' ', (location or '').strip().lower()))
+
+
+def bucket(value):
+    return math.ceil(math.log(max(float(value), 1.0)) / LOG_GAMMA)
+
+
+def quantile(bins, q):
+    rank = q * (sum(bins.values()) - 1)
+    seen = 0
+    for index in sorted(bins):
+        seen += bins[index]
+        if seen > rank:
+            break
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+
+def fill_price_statistics(apps, schema_editor):
+    Property = apps.get_model('housing', 'Property')
+    PriceStatistic = apps.get_model('housing', 'PriceStatistic')
+
+    groups = {}
+    rows = Property.objects.filter(is_listed=True).values_list(
+        'location', 'property_type', 'listing_type', 'price')
+    for location, property_type, listing_type, price in rows.iterator(chunk_size=5000):
+        key = (area_key(location), property_type, listing_type)
+        if not key[0] or not property_type or price is None:
+            continue
+        bins, totals = groups.setdefault(key, ({}, [0, 0.0]))
+        index = bucket(price)
+        bins[index] = bins.get(index, 0) + 1
+        totals[0] += 1
+        totals[1] += float(price)
+
+    stats = [
+        PriceStatistic(
+            area=area, property_type=property_type, listing_type=listing_type,
+            count=count, total=total, mean=total / count,
+            p25=quantile(bins, 0.25), median=quantile(bins, 0.5), p75=quantile(bins, 0.75),
+            sketch={str(index): n for index, n in sorted(bins.items())})
+        for (area, property_type, listing_type), (bins, (count, total)) in groups.items()
+    ]
+    PriceStatistic.objects.all().delete()
+    PriceStatistic.objects.bulk_create(stats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('housing', '0016_chat_conversations'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_price_statistics, migrations.RunPython.noop),
+    ]
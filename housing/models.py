@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
 class User(AbstractUser):
@@ -18,28 +19,78 @@ class User(AbstractUser):
     houses_rented = models.IntegerField(default=0)
     locations = models.CharField(max_length=255, blank=True, null=True, help_text="Locations where the agent has properties")
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['user_type'], name='user_type_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
+    def get_session_auth_hash(self):
+        # Users served by housing.auth_cache carry this hash instead of their
+        # password, which stays deferred until something actually reads it.
+        cached = getattr(self, '_session_auth_hash', None)
+        if cached is not None and 'password' in self.get_deferred_fields():
+            return cached
+        return super().get_session_auth_hash()
+
     def get_average_rating(self):
         ratings = self.received_ratings.all()
         if not ratings.exists():
             return 0
         return sum(r.score for r in ratings) / ratings.count()
 
+def conversation_key(user_id, other_id):
+    """Canonical id of the conversation between two users, the same from either side."""
+    return '{}-{}'.format(*sorted((int(user_id), int(other_id))))
+
+
 class ChatMessage(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
+    conversation = models.CharField(max_length=41, editable=False)
     message = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
     class Meta:
-        ordering = ['timestamp']
+        indexes = [
+            # One conversation's messages in order (housing.chat.history).
+            models.Index(fields=['conversation', 'timestamp'], name='chat_conversation_idx'),
+            # Unread counts, and the admin's is_read filter.
+            models.Index(fields=['is_read', 'receiver'], name='chat_message_unread_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.conversation:
+            self.conversation = conversation_key(self.sender_id, self.receiver_id)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"From {self.sender.username} to {self.receiver.username} at {self.timestamp}"
 
+
+class ChatArchive(models.Model):
+    """
+    Up to CHAT_ARCHIVE_CHUNK_SIZE read messages of one conversation, moved out
+    of ChatMessage by `manage.py archive_chat_messages` and stored as one
+    compressed blob (see housing.chat).
+    """
+    conversation = models.CharField(max_length=41)
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    payload = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'last_timestamp'], name='chat_archive_conversation_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.message_count} messages of {self.conversation} until {self.last_timestamp}"
+
 class AgentRating(models.Model):
     agent = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_ratings')
     rater = models.ForeignKey(User, on_delete=models.CASCADE, related_name='given_ratings')
@@ -75,6 +126,10 @@ class Property(models.Model):
     image = models.ImageField(upload_to='properties/', blank=True, null=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='properties')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Total detail-page views, flushed in batches by housing.counters.
+    views = models.PositiveIntegerField(default=0, editable=False)
+    # De-listed properties stay in the database but are hidden from everyone but their owner.
+    is_listed = models.BooleanField(default=True)
 
     def __str__(self):
         return self.title
@@ -88,8 +143,23 @@ class Property(models.Model):
             return self
         return None
 
+    def thumbnail_url(self):
+        """URL of the listing's thumbnail; uses prefetched `images` without querying again."""
+        images = list(self.images.all())
+        image = next((i for i in images if i.is_thumbnail), images[0] if images else None)
+        if image:
+            return image.image.url
+        elif self.image:
+            return self.image.url
+        return None
+
     class Meta:
         verbose_name_plural = "Properties"
+        indexes = [
+            models.Index(fields=['listing_type', 'is_listed'], name='property_listing_idx'),
+            models.Index(fields=['is_listed'], name='property_is_listed_idx'),
+            models.Index(fields=['property_type'], name='property_type_idx'),
+        ]
 
 class PropertyImage(models.Model):
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='images')
@@ -98,3 +168,184 @@ class PropertyImage(models.Model):
     
     def __str__(self):
         return f"Image for {self.property.title}"
+
+class PropertyViewCount(models.Model):
+    """Detail-page views of one listing on one day (see housing.counters)."""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='daily_views')
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'day'], name='unique_property_view_day'),
+        ]
+
+class OutboundEmail(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    # to/cc/bcc/reply_to/headers/alternatives of the original EmailMessage
+    envelope = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    # When the message is next due; while 'sending', when the worker's claim expires.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.envelope.get('to', []))} ({self.status})"
+
+class PriceStatistic(models.Model):
+    """
+    Running price aggregates for one (area, property_type, listing_type) group,
+    maintained incrementally by housing.price_stats as listings change.
+    """
+    area = models.CharField(max_length=100)
+    property_type = models.CharField(max_length=20, choices=Property.PROPERTY_TYPE_CHOICES)
+    listing_type = models.CharField(max_length=10, choices=Property.LISTING_TYPE_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0)
+    mean = models.FloatField(blank=True, null=True)
+    p25 = models.FloatField(blank=True, null=True)
+    median = models.FloatField(blank=True, null=True)
+    p75 = models.FloatField(blank=True, null=True)
+    # Log-bucketed quantile sketch: {bucket index: listings in bucket}
+    sketch = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['area', 'property_type', 'listing_type'], name='unique_price_statistic'),
+        ]
+
+    def __str__(self):
+        return f"{self.area} / {self.property_type} / {self.listing_type}: {self.count}"
+
+class PropertySimilarity(models.Model):
+    """Precomputed nearest neighbours of a listing (see housing.similarity)."""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='similar_entries')
+    similar = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'similar'], name='unique_property_similarity'),
+        ]
+        indexes = [
+            models.Index(fields=['property', '-score'], name='property_similarity_idx'),
+        ]
+
+class ListingFingerprint(models.Model):
+    """MinHash signature of a listing's text and dHashes of its photos (see housing.dedup)."""
+    property = models.OneToOneField(
+        Property, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    minhash = models.BinaryField()
+    # {PropertyImage id: 64-bit dHash}
+    image_hashes = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ListingBucket(models.Model):
+    """LSH band key -> listing, so duplicate candidates are found by exact lookup."""
+    key = models.BigIntegerField()
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'property'], name='unique_listing_bucket'),
+        ]
+
+
+class SavedSearch(models.Model):
+    """
+    A user's standing search. Blank criteria match anything. New and changed
+    listings are matched by index lookups on the criteria (see
+    housing.saved_searches), never by scanning every saved search.
+    """
+    PRICE_BAND_CHOICES = (
+        ('0-200k', 'Under 200,000 FRW'),
+        ('200k-500k', '200,000 - 500,000 FRW'),
+        ('500k-1m', '500,000 - 1,000,000 FRW'),
+        ('1m-20m', '1,000,000 - 20,000,000 FRW'),
+        ('20m-100m', '20,000,000 - 100,000,000 FRW'),
+        ('100m+', 'Over 100,000,000 FRW'),
+    )
+    # Lower bound of each band, in the order above.
+    PRICE_BAND_FLOORS = (0, 200000, 500000, 1000000, 20000000, 100000000)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_searches')
+    listing_type = models.CharField(max_length=10, choices=Property.LISTING_TYPE_CHOICES, blank=True)
+    property_type = models.CharField(max_length=20, choices=Property.PROPERTY_TYPE_CHOICES, blank=True)
+    # Normalized with housing.price_stats.area_key; matches any comma-separated part of a listing's location.
+    location = models.CharField(max_length=100, blank=True)
+    price_band = models.CharField(max_length=10, choices=PRICE_BAND_CHOICES, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['location', 'listing_type', 'property_type', 'price_band'],
+                         name='saved_search_criteria_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.location or 'anywhere'} {self.listing_type} {self.property_type} {self.price_band}"
+
+
+class SavedSearchMatch(models.Model):
+    """A listing that matched a saved search, waiting for (or already in) a digest."""
+    search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='matches')
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    notified_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['search', 'property'], name='unique_saved_search_match'),
+        ]
+        indexes = [
+            models.Index(fields=['notified_at', 'created_at'], name='saved_search_pending_idx'),
+        ]
+
+
+class AgentDailyStat(models.Model):
+    """
+    One agent's activity on one day, kept current by housing.agent_stats as
+    listings, views, messages and ratings arrive; `manage.py
+    rebuild_agent_stats` recomputes it from history. Counters carry database
+    defaults so raw batched upserts can touch a single column.
+    """
+    agent = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    listings_added = models.PositiveIntegerField(default=0, db_default=0)
+    listings_removed = models.PositiveIntegerField(default=0, db_default=0)
+    views = models.PositiveIntegerField(default=0, db_default=0)
+    chats_received = models.PositiveIntegerField(default=0, db_default=0)
+    # First replies to unanswered messages, and the total seconds they took.
+    responses = models.PositiveIntegerField(default=0, db_default=0)
+    response_seconds = models.FloatField(default=0, db_default=0)
+    # Net change in rating count and score sum that day (edits move the sum only).
+    ratings = models.IntegerField(default=0, db_default=0)
+    rating_total = models.IntegerField(default=0, db_default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['agent', 'day'], name='unique_agent_daily_stat'),
+        ]
+
+    def __str__(self):
+        return f"{self.agent.username} on {self.day}"
@@ -0,0 +1,105 @@
+"""
+Vectorized mortgage / affordability engine.
+
+Payments for many prices under many scenarios are computed in one NumPy
+broadcast: prices form the columns and scenarios the rows of the result.
+The annuity factor of a scenario (monthly payment per franc borrowed) is
+memoized, so the common scenarios cost one multiplication per listing.
+"""
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+
+class Scenario(NamedTuple):
+    rate: float             # annual interest rate, percent
+    deposit_percent: float  # share of the price paid up front, percent
+    term_years: int
+
+    @property
+    def months(self):
+        return int(round(self.term_years * 12))
+
+
+# Same defaults as the calculator on the tools page.
+DEFAULT_SCENARIO = Scenario(rate=16.0, deposit_percent=20.0, term_years=20)
+
+MAX_SCHEDULE_MONTHS = 40 * 12
+
+
+@lru_cache(maxsize=256)
+def payment_factor(rate, term_years):
+    """Monthly payment per unit of principal for an annual `rate` (percent)."""
+    months = int(round(term_years * 12))
+    if months <= 0:
+        return float('nan')
+    r = rate / 100 / 12
+    if r == 0:
+        return 1 / months
+    growth = (1 + r) ** months
+    return r * growth / (growth - 1)
+
+
+def principals(prices, scenarios):
+    """(len(scenarios), len(prices)) array of amounts borrowed."""
+    prices = np.asarray(prices, dtype=np.float64)
+    deposits = np.array([s.deposit_percent for s in scenarios], dtype=np.float64)
+    return np.clip(prices[np.newaxis, :] * (1 - deposits[:, np.newaxis] / 100), 0, None)
+
+
+def monthly_payments(prices, scenarios=(DEFAULT_SCENARIO,)):
+    """
+    Monthly repayment for every price under every scenario, as an array of
+    shape (len(scenarios), len(prices)).
+    """
+    factors = np.array([payment_factor(s.rate, s.term_years) for s in scenarios])
+    return principals(prices, scenarios) * factors[:, np.newaxis]
+
+
+def estimate_monthly_payments(prices, scenario=DEFAULT_SCENARIO):
+    """Default-scenario payment for each price, rounded to whole francs."""
+    if len(prices) == 0:
+        return []
+    return np.rint(monthly_payments(prices, (scenario,))[0]).astype(np.int64).tolist()
+
+
+def attach_monthly_payments(properties, scenario=DEFAULT_SCENARIO):
+    """
+    Set `monthly_payment` on every sale listing in `properties` with a single
+    vectorized call and return them as a list.
+    """
+    properties = list(properties)
+    for_sale = [p for p in properties if p.listing_type == 'sale']
+    payments = estimate_monthly_payments([p.price for p in for_sale], scenario)
+    for prop, payment in zip(for_sale, payments):
+        prop.monthly_payment = payment
+    return properties
+
+
+def amortization_schedules(prices, scenario):
+    """
+    Full month-by-month schedules for every price under one scenario.
+    Returns a dict of (len(prices), months) arrays: payment, interest,
+    principal and the balance remaining after each payment.
+    """
+    months = scenario.months
+    principal = principals(prices, (scenario,))[0][:, np.newaxis]
+    payment = principal * payment_factor(scenario.rate, scenario.term_years)
+    r = scenario.rate / 100 / 12
+    k = np.arange(1, months + 1)[np.newaxis, :]
+    if r == 0:
+        balance = principal - payment * k
+    else:
+        # Closed form of the balance after k payments; no month-by-month loop.
+        growth = (1 + r) ** k
+        balance = principal * growth - payment * (growth - 1) / r
+    balance = np.clip(balance, 0, None)
+    previous = np.concatenate([principal, balance[:, :-1]], axis=1)
+    interest = previous * r
+    return {
+        'payment': np.broadcast_to(payment, balance.shape),
+        'interest': interest,
+        'principal': previous - balance,
+        'balance': balance,
+    }
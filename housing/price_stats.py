@@ -0,0 +1,173 @@
+"""
+Per-area price statistics.
+
+Every (area, property_type, listing_type) group has one PriceStatistic row
+holding its count, mean and a mergeable log-bucketed quantile sketch (the
+DDSketch layout): a price lands in bucket ceil(log_gamma(price)), so any
+quantile read back from the buckets is within RELATIVE_ACCURACY of the true
+value. Buckets are plain counters, which makes removing a listing as cheap as
+adding one. Only listed properties count. The signal handlers in
+housing.signals keep the rows current; migration 0017 fills them for existing
+listings and `manage.py rebuild_price_stats` recomputes them from scratch
+(needed after bulk .update()s of prices or locations, which skip the signals).
+"""
+import math
+import re
+
+from django.db import transaction
+
+from .models import PriceStatistic, Property
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+
+def area_key(location):
+    """Normalize free-text locations so 'Kigali,  Kacyiru ' and 'kigali, kacyiru' match."""
+    return re.sub(r'\s*,\s*', ', ', re.sub(r'\s+', ' ', (location or '').strip().lower()))
+
+
+def group_key(prop):
+    """The listing's group, or None while it is not listed."""
+    if not prop.is_listed:
+        return None
+    return area_key(prop.location), prop.property_type, prop.listing_type
+
+
+class QuantileSketch:
+    def __init__(self, bins=None):
+        self.bins = {int(index): count for index, count in (bins or {}).items()}
+
+    @staticmethod
+    def bucket(value):
+        return math.ceil(math.log(max(float(value), 1.0)) / LOG_GAMMA)
+
+    @staticmethod
+    def bucket_value(index):
+        # Midpoint (in relative terms) of the bucket's (gamma^(i-1), gamma^i] range.
+        return 2 * GAMMA ** index / (GAMMA + 1)
+
+    def add(self, value):
+        index = self.bucket(value)
+        self.bins[index] = self.bins.get(index, 0) + 1
+
+    def remove(self, value):
+        index = self.bucket(value)
+        remaining = self.bins.get(index, 0) - 1
+        if remaining > 0:
+            self.bins[index] = remaining
+        else:
+            self.bins.pop(index, None)
+
+    @property
+    def count(self):
+        return sum(self.bins.values())
+
+    def quantile(self, q):
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return self.bucket_value(index)
+        return self.bucket_value(max(self.bins))
+
+    def rank(self, value):
+        """Share of listings priced at or below `value`."""
+        total = self.count
+        if not total:
+            return None
+        index = self.bucket(value)
+        return sum(count for i, count in self.bins.items() if i <= index) / total
+
+    def to_json(self):
+        return {str(index): count for index, count in sorted(self.bins.items())}
+
+
+def refresh(stat, sketch):
+    """Copy derived aggregates from `sketch` onto the row."""
+    stat.sketch = sketch.to_json()
+    stat.mean = stat.total / stat.count if stat.count else None
+    stat.p25, stat.median, stat.p75 = (sketch.quantile(q) for q in (0.25, 0.5, 0.75))
+
+
+def apply(key, price, delta):
+    """Add (delta=1) or remove (delta=-1) one listing price in the group `key`."""
+    apply_many(key, [price], delta)
+
+
+def apply_many(key, prices, delta):
+    """apply() for several prices of one group, as a single row update."""
+    if key is None:
+        return
+    area, property_type, listing_type = key
+    prices = [price for price in prices if price is not None]
+    if not area or not property_type or not prices:
+        return
+    with transaction.atomic():
+        stat, _ = PriceStatistic.objects.select_for_update().get_or_create(
+            area=area, property_type=property_type, listing_type=listing_type)
+        sketch = QuantileSketch(stat.sketch)
+        for price in prices:
+            if delta > 0:
+                sketch.add(price)
+            else:
+                sketch.remove(price)
+        stat.count = max(0, stat.count + delta * len(prices))
+        stat.total = stat.total + delta * sum(float(price) for price in prices) if stat.count else 0
+        refresh(stat, sketch)
+        stat.save()
+
+
+def lookup(prop):
+    """The statistics row for a listing's group, or None: one indexed query."""
+    area, property_type, listing_type = area_key(prop.location), prop.property_type, prop.listing_type
+    return PriceStatistic.objects.filter(
+        area=area, property_type=property_type, listing_type=listing_type).first()
+
+
+def describe(prop):
+    """Statistics for a listing's group plus where its own price falls in it."""
+    stat = lookup(prop)
+    if stat is None or not stat.count:
+        return None
+    return {
+        'area': stat.area,
+        'property_type': stat.property_type,
+        'listing_type': stat.listing_type,
+        'count': stat.count,
+        'mean': round(stat.mean) if stat.mean is not None else None,
+        'p25': round(stat.p25) if stat.p25 is not None else None,
+        'median': round(stat.median) if stat.median is not None else None,
+        'p75': round(stat.p75) if stat.p75 is not None else None,
+        'percentile': round(100 * QuantileSketch(stat.sketch).rank(prop.price)),
+    }
+
+
+def rebuild(chunk_size=5000):
+    """Recompute every group from the listed properties in one streaming pass."""
+    groups = {}
+    rows = Property.objects.filter(is_listed=True).values_list('location', 'property_type', 'listing_type', 'price')
+    for location, property_type, listing_type, price in rows.iterator(chunk_size=chunk_size):
+        key = (area_key(location), property_type, listing_type)
+        if not key[0] or not property_type or price is None:
+            continue
+        sketch, totals = groups.setdefault(key, (QuantileSketch(), [0, 0.0]))
+        sketch.add(price)
+        totals[0] += 1
+        totals[1] += float(price)
+
+    stats = []
+    for (area, property_type, listing_type), (sketch, (count, total)) in groups.items():
+        stat = PriceStatistic(area=area, property_type=property_type, listing_type=listing_type,
+                              count=count, total=total)
+        refresh(stat, sketch)
+        stats.append(stat)
+    with transaction.atomic():
+        PriceStatistic.objects.all().delete()
+        PriceStatistic.objects.bulk_create(stats, batch_size=1000)
+    return len(stats)
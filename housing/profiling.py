@@ -0,0 +1,139 @@
+"""
+Profiling single requests in production.
+
+A staff user adds `?_profile=1` (or the header `X-Profile: 1`) to any URL and
+that one request runs under cProfile; `?_profile=sample` uses a sampling
+profiler instead, which perturbs timings less. Each profiled request leaves
+in PROFILE_DIR:
+
+- `<name>.pstats` (load with pstats, snakeviz, ...) or `<name>.folded`
+  (collapsed stacks for flamegraph.pl or speedscope), and
+- `<name>.sql.json`, every SQL statement with its start offset and duration.
+
+The response names the artifacts in an `X-Profile` header. Other requests
+only pay for a header lookup and a substring test in ProfilingMiddleware.
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+PARAMETER = '_profile'
+HEADER = 'HTTP_X_PROFILE'
+MODES = ('cprofile', 'sample')
+
+
+def requested_mode(request):
+    """'cprofile', 'sample' or None, from the query parameter or header."""
+    # The substring test keeps the query string unparsed for everyone else.
+    value = request.META.get(HEADER) or (
+        PARAMETER in request.META.get('QUERY_STRING', '') and request.GET.get(PARAMETER))
+    if not value:
+        return None
+    return value if value in MODES else 'cprofile'
+
+
+class SQLTimeline:
+    """Execute wrapper keeping every statement's start offset and duration."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append({
+                'start_ms': round((start - self.origin) * 1000, 3),
+                'ms': round((time.perf_counter() - start) * 1000, 3),
+                'db': context['connection'].alias,
+                'sql': sql,
+            })
+
+
+class Sampler:
+    """Samples one thread's stack every `interval` seconds from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def profile(request, get_response, mode):
+    """Run `get_response(request)` under the `mode` profiler and write its artifacts."""
+    timeline = SQLTimeline()
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timeline))
+        if mode == 'sample':
+            sampler = stack.enter_context(Sampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL))
+            response = get_response(request)
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = get_response(request)
+            finally:
+                profiler.disable()
+    total = time.perf_counter() - start
+
+    directory = Path(settings.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    match = request.resolver_match
+    route = match.view_name if match else 'unmatched'
+    name = f"{timezone.now():%Y%m%dT%H%M%S}-{route.replace(':', '-')}-{uuid.uuid4().hex[:8]}"
+    if mode == 'sample':
+        artifact = f'{name}.folded'
+        (directory / artifact).write_text(sampler.folded())
+    else:
+        artifact = f'{name}.pstats'
+        profiler.dump_stats(directory / artifact)
+    (directory / f'{name}.sql.json').write_text(json.dumps({
+        'method': request.method,
+        'path': request.get_full_path(),
+        'route': route,
+        'status': response.status_code,
+        'total_ms': round(total * 1000, 2),
+        'sql_ms': round(sum(s['ms'] for s in timeline.statements), 2),
+        'queries': timeline.statements,
+    }, indent=2))
+    response['X-Profile'] = f'{artifact}, {name}.sql.json'
+    return response
@@ -0,0 +1,176 @@
+"""
+Token-bucket rate limiting with state shared between worker processes.
+
+Buckets live in a small SQLite file next to the application (not the main
+database, so throttling never queues behind application writes). Each check
+is a single UPSERT ... RETURNING that refills the bucket for the time elapsed
+since its last use and takes the tokens if there are enough, atomically
+across every process using the same file.
+
+This module only uses the standard library so both the Django site
+(housing.throttle) and the FastAPI backend (api.app) can use it. Both take
+their limits from LIMITS and their bucket keys from bucket_checks: IP buckets
+are shared by the two apps, account buckets are namespaced per app because
+their user ids and usernames come from different tables.
+"""
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Per scope, 'capacity/seconds' per client IP and per account.
+LIMITS = {
+    'login': {'ip': '30/300'},
+    # Failed passwords per account; checked before hashing, spent only on failure.
+    'login_failures': {'account': '10/900'},
+    'register': {'ip': '10/3600'},
+    'listing_write': {'ip': '120/3600', 'account': '60/3600'},
+}
+
+# Buckets untouched for this long are full again and can be forgotten.
+IDLE_SECONDS = 24 * 3600
+PRUNE_PROBABILITY = 0.001
+# After a failure the store is left alone (every request allowed) for this long.
+RETRY_SECONDS = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    allowed INTEGER NOT NULL
+) WITHOUT ROWID
+"""
+
+# Parameters: key, capacity, rate, cost, now
+_TAKE = """
+INSERT INTO buckets (key, tokens, updated, allowed)
+VALUES (:key, :capacity - :cost, :now, :capacity >= :cost)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = CASE WHEN min(:capacity, tokens + (:now - updated) * :rate) >= :cost
+                  THEN min(:capacity, tokens + (:now - updated) * :rate) - :cost
+                  ELSE min(:capacity, tokens + (:now - updated) * :rate) END,
+    allowed = min(:capacity, tokens + (:now - updated) * :rate) >= :cost,
+    updated = :now
+RETURNING tokens, allowed
+"""
+
+
+class Limit(NamedTuple):
+    """`capacity` requests, refilled evenly over `period` seconds."""
+    capacity: float
+    period: float
+
+    @property
+    def rate(self):
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, value):
+        """'10/60' -> Limit(10, 60); tuples pass through."""
+        if isinstance(value, str):
+            capacity, period = value.split('/')
+            return cls(float(capacity), float(period))
+        return cls(*value)
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    retry_after: int  # whole seconds until the request would be allowed
+
+
+class TokenBucketStore:
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        self._retry_at = None  # monotonic time of the next attempt while unavailable
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _apply(self, key, limit, cost, now):
+        """Refill `key`'s bucket, take `cost` tokens if present; returns (tokens left, taken)."""
+        now = time.time() if now is None else now
+        retry_at = self._retry_at
+        if retry_at is not None and time.monotonic() < retry_at:
+            return limit.capacity, True
+        try:
+            connection = self._connection()
+            tokens, allowed = connection.execute(_TAKE, {
+                'key': key, 'capacity': limit.capacity, 'rate': limit.rate, 'cost': cost, 'now': now,
+            }).fetchone()
+            if random.random() < PRUNE_PROBABILITY:
+                connection.execute('DELETE FROM buckets WHERE updated < ?', (now - IDLE_SECONDS,))
+        except (sqlite3.Error, OSError):
+            # Throttling is a safety net; never take the site down with it, and
+            # don't retry (or log) on every request while the store is down.
+            if retry_at is None:
+                logger.exception('Rate limit store %s unavailable; allowing requests, retrying every %ds',
+                                 self.path, RETRY_SECONDS)
+            self._retry_at = time.monotonic() + RETRY_SECONDS
+            return limit.capacity, True
+        if retry_at is not None:
+            logger.warning('Rate limit store %s available again', self.path)
+            self._retry_at = None
+        return tokens, bool(allowed)
+
+    @staticmethod
+    def _decision(tokens, allowed, limit, cost):
+        if allowed:
+            return Decision(True, 0)
+        return Decision(False, max(1, math.ceil((cost - tokens) / limit.rate)))
+
+    def take(self, key, limit, cost=1.0, now=None):
+        """Take `cost` tokens from `key`'s bucket if it has them."""
+        tokens, allowed = self._apply(key, limit, cost, now)
+        return self._decision(tokens, allowed, limit, cost)
+
+    def peek(self, key, limit, cost=1.0, now=None):
+        """Whether `key`'s bucket holds `cost` tokens, without taking them."""
+        tokens, _ = self._apply(key, limit, 0, now)
+        return self._decision(tokens, tokens >= cost, limit, cost)
+
+    def reset(self, key=None):
+        if key is None:
+            self._connection().execute('DELETE FROM buckets')
+        else:
+            self._connection().execute('DELETE FROM buckets WHERE key = ?', (key,))
+
+
+def bucket_checks(limits, scope, namespace, ip=None, account=None):
+    """[(key, Limit)] for a request in `scope`; `namespace` names the app the account belongs to."""
+    scoped = limits.get(scope, {})
+    checks = []
+    if ip is not None and 'ip' in scoped:
+        checks.append((f'{scope}:ip:{ip}', Limit.parse(scoped['ip'])))
+    if account is not None and 'account' in scoped:
+        checks.append((f'{namespace}:{scope}:account:{str(account).lower()}', Limit.parse(scoped['account'])))
+    return checks
+
+
+def check(store, checks, now=None):
+    """
+    Take one token from each (key, limit) in `checks`, stopping at the first
+    bucket that is empty. Returns the first refusal, or an allowing Decision.
+    """
+    for key, limit in checks:
+        decision = store.take(key, limit, now=now)
+        if not decision.allowed:
+            return decision
+    return Decision(True, 0)
@@ -0,0 +1,124 @@
+"""
+Saved searches and new-listing digests.
+
+A SavedSearch is a row of exact-match criteria where blank means "any". To
+match a listing we enumerate the few criteria tuples it satisfies - its
+listing type or any, its property type or any, each part of its location or
+any, its price band or any - and look them all up in one query against the
+composite saved_search_criteria_idx. The work is proportional to the number of
+searches that actually match, however many searches exist.
+
+Matches queue up as SavedSearchMatch rows; `manage.py send_search_digests`
+turns each user's pending matches into one email through the mail queue.
+Matching runs on the background thread after the listing's save commits.
+Only listed homes are matched; matches of homes de-listed before the digest
+goes out wait, unsent and uncounted, until the home is listed again.
+"""
+from bisect import bisect_right
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Property, SavedSearch, SavedSearchMatch, User
+from .price_stats import area_key
+
+MATCH_BATCH_SIZE = 1000
+DIGEST_MAX_LISTINGS = 20
+
+
+def price_band(price):
+    if price is None:
+        return None
+    index = bisect_right(SavedSearch.PRICE_BAND_FLOORS, float(price)) - 1
+    return SavedSearch.PRICE_BAND_CHOICES[max(index, 0)][0]
+
+
+def location_terms(location):
+    """'Kigali, Kacyiru' -> {'kigali, kacyiru', 'kigali', 'kacyiru'}"""
+    key = area_key(location)
+    if not key:
+        return set()
+    return {key} | {part for part in key.split(', ') if part}
+
+
+def matching_searches(prop):
+    """Saved searches `prop` satisfies (excluding its owner's)."""
+    return SavedSearch.objects.filter(
+        location__in=sorted(location_terms(prop.location)) + [''],
+        listing_type__in=[prop.listing_type, ''],
+        property_type__in=[prop.property_type, ''],
+        price_band__in=[price_band(prop.price), ''],
+    ).exclude(user_id=prop.owner_id)
+
+
+def match_listing(prop):
+    """Queue `prop` for every saved search it matches; returns how many matched."""
+    if not prop.is_listed:
+        return 0
+    matched = 0
+    ids = matching_searches(prop).values_list('id', flat=True)
+    batch = []
+    for search_id in ids.iterator(MATCH_BATCH_SIZE):
+        batch.append(SavedSearchMatch(search_id=search_id, property_id=prop.pk))
+        if len(batch) >= MATCH_BATCH_SIZE:
+            matched += len(SavedSearchMatch.objects.bulk_create(batch, ignore_conflicts=True))
+            batch = []
+    if batch:
+        matched += len(SavedSearchMatch.objects.bulk_create(batch, ignore_conflicts=True))
+    return matched
+
+
+def match_stored_listing(pk):
+    """Background task: match listing `pk` as it is now, if it still exists."""
+    prop = Property.objects.filter(pk=pk).first()
+    return match_listing(prop) if prop is not None else 0
+
+
+def pending_digests(max_users=500):
+    """{user: [properties]} for up to `max_users` users with unsent matches."""
+    pending = (SavedSearchMatch.objects.filter(notified_at__isnull=True, property__is_listed=True)
+               .order_by('search__user_id', 'created_at')
+               .values_list('id', 'search__user_id', 'property_id'))
+    users, match_ids = {}, []
+    for match_id, user_id, property_id in pending.iterator(MATCH_BATCH_SIZE):
+        if user_id not in users and len(users) >= max_users:
+            break
+        users.setdefault(user_id, {})[property_id] = None
+        match_ids.append(match_id)
+    return {user_id: list(listings) for user_id, listings in users.items()}, match_ids
+
+
+def send_digests(max_users=500, base_url=''):
+    """Email one digest per user with pending matches; returns (digests queued, users processed)."""
+    users, match_ids = pending_digests(max_users)
+    if not users:
+        return 0, 0
+    wanted = {pk for listings in users.values() for pk in listings[:DIGEST_MAX_LISTINGS]}
+    properties = Property.objects.filter(is_listed=True).in_bulk(wanted)
+    recipients = User.objects.in_bulk(users.keys())
+
+    messages = []
+    for user_id, listing_ids in users.items():
+        user = recipients.get(user_id)
+        listings = [properties[pk] for pk in listing_ids[:DIGEST_MAX_LISTINGS] if pk in properties]
+        if user is None or not user.email or not listings:
+            continue
+        body = render_to_string('housing/emails/search_digest.html', {
+            'user': user,
+            'listings': listings,
+            'more': len(listing_ids) - len(listings),
+            'base_url': base_url,
+        })
+        subject = f'{len(listing_ids)} new listing{"s" if len(listing_ids) != 1 else ""} match your saved searches'
+        messages.append((subject, body, settings.DEFAULT_FROM_EMAIL, [user.email]))
+
+    with transaction.atomic():
+        send_mass_mail(messages)
+        now = timezone.now()
+        for start in range(0, len(match_ids), MATCH_BATCH_SIZE):
+            SavedSearchMatch.objects.filter(
+                id__in=match_ids[start:start + MATCH_BATCH_SIZE]).update(notified_at=now)
+    return len(messages), len(users)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Property
+from .models import ChatMessage, Property, PropertyImage
+from .mortgage import DEFAULT_SCENARIO, MAX_SCHEDULE_MONTHS, attach_monthly_payments
 
 User = get_user_model()
 
@@ -23,20 +24,123 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
+class AgentSerializer(serializers.ModelSerializer):
+    """An agent with the aggregates annotated by AgentViewSet.get_queryset()."""
+    avg_rating = serializers.FloatField(read_only=True)
+    rating_count = serializers.IntegerField(read_only=True)
+    active_listings = serializers.IntegerField(read_only=True)
+    service_areas = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name', 'user_type', 'phone', 'whatsapp',
+                  'profile_picture', 'bio', 'houses_sold', 'houses_rented', 'avg_rating',
+                  'rating_count', 'active_listings', 'service_areas')
+
+    def get_service_areas(self, obj):
+        return [area.strip() for area in (obj.locations or '').split(',') if area.strip()]
+
+
+class PropertyListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        data = data.all() if hasattr(data, 'all') else data
+        return super().to_representation(attach_monthly_payments(data))
+
+
+class PropertyOwnerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name', 'user_type', 'email', 'phone', 'whatsapp',
+                  'profile_picture')
+
+
+class PropertyImageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PropertyImage
+        fields = ('id', 'image', 'is_thumbnail')
+
+
 class PropertySerializer(serializers.ModelSerializer):
+    """
+    A listing. `expand` adds related data (see EXPANSIONS) and `fields`
+    limits the output to the named fields plus the expansions; PropertyViewSet
+    takes both from the query string and fetches what they need up front.
+    """
+    EXPANSIONS = ('owner', 'images', 'ratings')
+
     owner_name = serializers.ReadOnlyField(source='owner.username')
     thumbnail = serializers.SerializerMethodField()
+    estimated_monthly_payment = serializers.SerializerMethodField()
     
     class Meta:
         model = Property
         fields = '__all__'
         read_only_fields = ('owner', 'created_at')
+        list_serializer_class = PropertyListSerializer
+
+    def __init__(self, *args, expand=(), fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'owner' in expand:
+            self.fields['owner'] = PropertyOwnerSerializer(read_only=True)
+        if 'images' in expand:
+            self.fields['images'] = PropertyImageSerializer(many=True, read_only=True)
+        if 'ratings' in expand:
+            self.fields['ratings'] = serializers.SerializerMethodField()
+        if fields:
+            for name in set(self.fields) - set(fields) - set(expand):
+                self.fields.pop(name)
+
+    def get_estimated_monthly_payment(self, obj):
+        if obj.listing_type != 'sale':
+            return None
+        if not hasattr(obj, 'monthly_payment'):
+            attach_monthly_payments([obj])
+        return obj.monthly_payment
         
     def get_thumbnail(self, obj):
-        if obj.images.filter(is_thumbnail=True).exists():
-            return obj.images.filter(is_thumbnail=True).first().image.url
-        elif obj.images.exists():
-            return obj.images.first().image.url
-        elif obj.image:
-            return obj.image.url
-        return None
+        # One query per listing, or none when PropertyViewSet prefetched the images.
+        return obj.thumbnail_url()
+
+    def get_ratings(self, obj):
+        """The owner's rating, annotated by PropertyViewSet."""
+        return {'average': obj.owner_avg_rating, 'count': obj.owner_rating_count}
+
+
+class MortgageScenarioSerializer(serializers.Serializer):
+    rate = serializers.FloatField(min_value=0, max_value=100, default=DEFAULT_SCENARIO.rate)
+    deposit_percent = serializers.FloatField(
+        min_value=0, max_value=100, default=DEFAULT_SCENARIO.deposit_percent)
+    term_years = serializers.IntegerField(min_value=1, max_value=100, default=DEFAULT_SCENARIO.term_years)
+
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChatMessage
+        fields = ('id', 'sender', 'receiver', 'message', 'timestamp', 'is_read')
+
+
+class MortgageQuoteSerializer(serializers.Serializer):
+    prices = serializers.ListField(
+        child=serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0),
+        required=False, max_length=10000)
+    property_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, max_length=10000)
+    scenarios = MortgageScenarioSerializer(many=True, required=False, max_length=20)
+    schedule = serializers.BooleanField(default=False)
+
+    MAX_SCHEDULES = 50
+
+    def validate(self, attrs):
+        if not attrs.get('prices') and not attrs.get('property_ids'):
+            raise serializers.ValidationError('Provide prices or property_ids.')
+        if not attrs.get('scenarios'):
+            attrs['scenarios'] = [DEFAULT_SCENARIO._asdict()]
+        loans = (len(attrs.get('prices', [])) + len(attrs.get('property_ids', []))) \
+            * len(attrs['scenarios'])
+        if attrs['schedule'] and loans > self.MAX_SCHEDULES:
+            raise serializers.ValidationError(
+                f'Full schedules are limited to {self.MAX_SCHEDULES} loans per request.')
+        if attrs['schedule'] and any(s['term_years'] * 12 > MAX_SCHEDULE_MONTHS for s in attrs['scenarios']):
+            raise serializers.ValidationError(
+                f'Full schedules are limited to terms of {MAX_SCHEDULE_MONTHS // 12} years.')
+        return attrs
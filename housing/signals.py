@@ -0,0 +1,214 @@
+from django.contrib.auth.signals import user_logged_in
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import (
+    agent_stats, auth_cache, autocomplete, background, catalog, counters, dedup, price_stats, saved_searches,
+    similarity,
+)
+from .instrumentation import metrics
+from .models import AgentRating, ChatMessage, Property, PropertyImage, User
+
+
+@receiver(pre_save, sender=Property)
+def remember_previous_listing(sender, instance, **kwargs):
+    # Derived indexes need the values a listing had before this save.
+    instance._previous = None
+    if instance.pk:
+        instance._previous = Property.objects.filter(pk=instance.pk).values(
+            'location', 'property_type', 'listing_type', 'price', 'is_listed', 'created_at',
+            'title', 'description').first()
+
+
+@receiver(post_save, sender=Property)
+def update_price_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    new_key = price_stats.group_key(instance)
+    if previous is not None:
+        old_key = (price_stats.area_key(previous['location']), previous['property_type'],
+                   previous['listing_type']) if previous['is_listed'] else None
+        if old_key == new_key and previous['price'] == instance.price:
+            return
+        price_stats.apply(old_key, previous['price'], -1)
+    price_stats.apply(new_key, instance.price, 1)
+
+
+@receiver(post_delete, sender=Property)
+def update_price_stats_on_delete(sender, instance, **kwargs):
+    price_stats.apply(price_stats.group_key(instance), instance.price, -1)
+
+
+@receiver(post_save, sender=Property)
+def update_similarity_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is not None and all(
+            previous[field] == getattr(instance, field) for field in similarity.EMBEDDED_FIELDS):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: background.submit(similarity.reindex_listing, pk))
+
+
+@receiver(post_delete, sender=Property)
+def update_similarity_on_delete(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: background.submit(similarity.remove_listing, pk))
+
+
+@receiver(post_save, sender=Property)
+def publish_catalog_change_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is not None and all(previous[field] == getattr(instance, field) for field in previous):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: catalog.publish(pk))
+
+
+@receiver(post_delete, sender=Property)
+def publish_catalog_change_on_delete(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: catalog.publish(pk))
+
+
+@receiver(post_save, sender=Property)
+def update_autocomplete_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    autocomplete.listing_moved(previous['location'] if previous and previous['is_listed'] else None,
+                               instance.location if instance.is_listed else None)
+
+
+@receiver(post_delete, sender=Property)
+def update_autocomplete_on_delete(sender, instance, **kwargs):
+    if instance.is_listed:
+        autocomplete.listing_moved(instance.location, None)
+
+
+@receiver(post_save, sender=Property)
+def match_saved_searches_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is not None and all(
+            previous[field] == getattr(instance, field)
+            for field in ('location', 'property_type', 'listing_type', 'price', 'is_listed')):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: background.submit(saved_searches.match_stored_listing, pk))
+
+
+@receiver(post_save, sender=Property)
+def update_fingerprint_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is not None and all(
+            previous[field] == getattr(instance, field)
+            for field in ('title', 'description', 'location', 'is_listed')):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: background.submit(dedup.reindex_listing, pk))
+
+
+@receiver(post_save, sender=PropertyImage)
+def update_fingerprint_on_image_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        pk = instance.pk
+        transaction.on_commit(lambda: background.submit(dedup.reindex_image, pk))
+
+
+@receiver(post_delete, sender=PropertyImage)
+def update_fingerprint_on_image_delete(sender, instance, **kwargs):
+    transaction.on_commit(lambda: background.submit(dedup.unindex_image, instance))
+
+
+@receiver(post_save, sender=Property)
+def update_agent_stats_on_listing(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        agent_stats.bump(instance.owner_id, timezone.localdate(instance.created_at), listings_added=1)
+
+
+def deleting_user(origin, user_id):
+    """Whether this delete cascades from removing `user_id` (or a batch of users)."""
+    if isinstance(origin, User):
+        return origin.pk == user_id
+    return getattr(origin, 'model', None) is User
+
+
+@receiver(post_delete, sender=Property)
+def update_agent_stats_on_listing_delete(sender, instance, origin=None, **kwargs):
+    if not deleting_user(origin, instance.owner_id):
+        agent_stats.bump(instance.owner_id, listings_removed=1)
+
+
+@receiver(post_save, sender=ChatMessage)
+def update_agent_stats_on_message(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        agent_stats.record_message(instance)
+
+
+@receiver(pre_save, sender=AgentRating)
+def remember_previous_score(sender, instance, **kwargs):
+    instance._previous_score = None
+    if instance.pk:
+        instance._previous_score = AgentRating.objects.filter(pk=instance.pk).values_list(
+            'score', flat=True).first()
+
+
+@receiver(post_save, sender=AgentRating)
+def update_agent_stats_on_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_score', None)
+    if created or previous is None:
+        agent_stats.bump(instance.agent_id, ratings=1, rating_total=instance.score)
+    elif previous != instance.score:
+        agent_stats.bump(instance.agent_id, rating_total=instance.score - previous)
+
+
+@receiver(post_delete, sender=AgentRating)
+def update_agent_stats_on_rating_delete(sender, instance, origin=None, **kwargs):
+    if not deleting_user(origin, instance.agent_id):
+        agent_stats.bump(instance.agent_id, ratings=-1, rating_total=-instance.score)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    pk = instance.pk
+    auth_cache.invalidate_user(pk)
+    transaction.on_commit(lambda: auth_cache.invalidate_user(pk))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    key = instance.key
+    auth_cache.invalidate_token(key)
+    transaction.on_commit(lambda: auth_cache.invalidate_token(key))
+
+
+@receiver(user_logged_in)
+def cache_logged_in_user(sender, request, user, **kwargs):
+    # Runs after django.contrib.auth's update_last_login, whose save has just invalidated it.
+    auth_cache.cache_user(user)
+
+
+@receiver(connection_created)
+def count_database_connection(sender, connection, **kwargs):
+    metrics().inc('db_connections_opened_total', db=connection.alias)
+
+
+@receiver(request_finished)
+def flush_view_counters(sender, **kwargs):
+    counters.views.maybe_flush()
@@ -0,0 +1,429 @@
+"""
+"Similar properties" nearest-neighbour index.
+
+Each listing is embedded as one L2-normalized vector made of:
+  * a soft one-hot of its log price, so nearby prices overlap,
+  * one-hots of property type and (hashed) normalized area,
+  * a TF-IDF vector of title + description, feature-hashed to a fixed width.
+Cosine similarity is then a dot product. `manage.py build_similarity_index`
+embeds the whole catalog with NumPy, finds every listing's top-k neighbours of
+the same listing type with blocked matrix products and stores them in
+PropertySimilarity, so a detail page needs one indexed query.
+
+The vectors, the IDF weights and every listing's k-th best score are kept in
+SIMILARITY_INDEX_DIR. When a listing's embedded fields change after a build,
+its vector is computed against that state and compared with the catalog in a
+single matrix-vector product, on the background thread (housing.background)
+once the save commits. Its own neighbour list is replaced, and so is the list
+of every listing it enters (it beats their k-th score) or leaves (its old
+vector reached their k-th score), each with one more matrix-vector product, so
+the stored lists stay what a rebuild would produce. Each change is appended as
+one fixed-size record (vector and k-th score) to a delta log next to the
+memory-mapped base matrix; once the log holds SIMILARITY_DELTA_MAX_RECORDS
+records it is folded into the base files, so neither the log nor the cost of a
+save grows between builds.
+"""
+import json
+import re
+import zlib
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from filelock import FileLock
+
+from .models import Property, PropertySimilarity
+from .price_stats import area_key
+
+TEXT_DIMENSIONS = 256
+AREA_DIMENSIONS = 64
+PRICE_BINS = 24
+PROPERTY_TYPES = [code for code, _ in Property.PROPERTY_TYPE_CHOICES]
+LISTING_TYPES = [code for code, _ in Property.LISTING_TYPE_CHOICES]
+
+# Relative weight of each feature group in the combined vector.
+WEIGHTS = {'price': 1.0, 'type': 0.7, 'area': 1.0, 'text': 1.0}
+
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has have in is it of on or the this to with'.split())
+TOKEN = re.compile(r'[a-z]{2,}')
+
+DEFAULT_K = 8
+# Rows per blocked matrix product, bounded so one score block stays around 64 MB.
+MAX_BLOCK_SIZE = 1024
+BLOCK_CELLS = 16 * 1024 * 1024
+
+DELTA_LOG = 'delta.log'
+# Listing fields the embedding is computed from; saves that change none of them skip the index.
+EMBEDDED_FIELDS = ('listing_type', 'price', 'property_type', 'location', 'title', 'description')
+
+
+def index_dir():
+    return Path(settings.SIMILARITY_INDEX_DIR)
+
+
+def _bucket(token, dimensions):
+    return zlib.crc32(token.encode()) % dimensions
+
+
+def term_buckets(text):
+    """Hashed term frequencies of a listing's text."""
+    counts = {}
+    for token in TOKEN.findall((text or '').lower()):
+        if token not in STOPWORDS:
+            bucket = _bucket(token, TEXT_DIMENSIONS)
+            counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+def listing_text(prop):
+    return f'{prop.title} {prop.description}'
+
+
+class Embedder:
+    """Turns listings into vectors given IDF weights and the price range of a build."""
+
+    def __init__(self, idf, log_price_min, log_price_max):
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.log_price_min = log_price_min
+        self.log_price_max = max(log_price_max, log_price_min + 1e-6)
+        self.dimensions = PRICE_BINS + len(PROPERTY_TYPES) + AREA_DIMENSIONS + TEXT_DIMENSIONS
+
+    @classmethod
+    def fit(cls, texts, prices):
+        document_frequency = np.zeros(TEXT_DIMENSIONS, dtype=np.float64)
+        for counts in texts:
+            document_frequency[list(counts)] += 1
+        idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+        log_prices = np.log(np.clip(np.asarray(prices, dtype=np.float64), 1, None))
+        if not len(log_prices):
+            return cls(idf, 0.0, 1.0)
+        return cls(idf, float(log_prices.min()), float(log_prices.max()))
+
+    def to_json(self):
+        return {'idf': self.idf.tolist(), 'log_price_min': self.log_price_min,
+                'log_price_max': self.log_price_max}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['idf'], data['log_price_min'], data['log_price_max'])
+
+    def embed(self, rows):
+        """
+        rows: iterable of (price, property_type, location, term_buckets).
+        Returns an (n, dimensions) float32 matrix of unit vectors.
+        """
+        rows = list(rows)
+        matrix = np.zeros((len(rows), self.dimensions), dtype=np.float32)
+        if not rows:
+            return matrix
+        prices, types, locations, texts = zip(*rows)
+
+        # Price: Gaussian bump over PRICE_BINS positions of the log-price range.
+        log_prices = np.log(np.clip(np.asarray(prices, dtype=np.float64), 1, None))
+        position = (log_prices - self.log_price_min) / (self.log_price_max - self.log_price_min)
+        centres = np.linspace(0, 1, PRICE_BINS)
+        price = np.exp(-((position[:, None] - centres[None, :]) * PRICE_BINS / 2) ** 2)
+        matrix[:, :PRICE_BINS] = WEIGHTS['price'] * _normalize(price)
+
+        offset = PRICE_BINS
+        type_index = np.array([PROPERTY_TYPES.index(t) if t in PROPERTY_TYPES else -1 for t in types])
+        known = type_index >= 0
+        matrix[np.flatnonzero(known), offset + type_index[known]] = WEIGHTS['type']
+
+        offset += len(PROPERTY_TYPES)
+        area_index = np.array([_bucket(area_key(location), AREA_DIMENSIONS) for location in locations])
+        matrix[np.arange(len(rows)), offset + area_index] = WEIGHTS['area']
+
+        offset += AREA_DIMENSIONS
+        text = np.zeros((len(rows), TEXT_DIMENSIONS), dtype=np.float32)
+        for i, counts in enumerate(texts):
+            if counts:
+                buckets = np.fromiter(counts.keys(), dtype=np.int64)
+                tf = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32))
+                text[i, buckets] = tf * self.idf[buckets]
+        matrix[:, offset:] = WEIGHTS['text'] * _normalize(text)
+
+        return _normalize(matrix)
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(np.float32)
+
+
+def listing_code(listing_type):
+    return LISTING_TYPES.index(listing_type) if listing_type in LISTING_TYPES else -1
+
+
+def top_k(scores, k):
+    """Indices of the k best scores per row, best first."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, best, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(best, order, axis=1)
+
+
+def build(k=DEFAULT_K, chunk_size=5000):
+    """Embed the whole catalog and store every listing's top-k neighbours."""
+    ids, codes, prices, types, locations, texts = [], [], [], [], [], []
+    rows = Property.objects.order_by('id').values_list(
+        'id', 'listing_type', 'price', 'property_type', 'location', 'title', 'description')
+    for pk, listing_type, price, property_type, location, title, description in rows.iterator(chunk_size):
+        ids.append(pk)
+        codes.append(listing_code(listing_type))
+        prices.append(float(price))
+        types.append(property_type)
+        locations.append(location)
+        texts.append(term_buckets(f'{title} {description}'))
+
+    embedder = Embedder.fit(texts, prices)
+    vectors = embedder.embed(zip(prices, types, locations, texts))
+    ids = np.asarray(ids, dtype=np.int64)
+    codes = np.asarray(codes, dtype=np.int8)
+    kth = np.full(len(ids), -np.inf, dtype=np.float32)
+
+    entries = []
+    block_size = max(1, min(MAX_BLOCK_SIZE, BLOCK_CELLS // max(1, len(ids))))
+    for start in range(0, len(ids), block_size):
+        stop = min(start + block_size, len(ids))
+        scores = vectors[start:stop] @ vectors.T
+        scores[codes[start:stop, None] != codes[None, :]] = -np.inf
+        scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        best = top_k(scores, k)
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        for row in range(stop - start):
+            valid = np.isfinite(best_scores[row])
+            if valid.any():
+                kth[start + row] = best_scores[row][valid].min() if valid.sum() >= k else -np.inf
+            for neighbour, score in zip(best[row][valid], best_scores[row][valid]):
+                entries.append(PropertySimilarity(
+                    property_id=int(ids[start + row]), similar_id=int(ids[neighbour]),
+                    score=float(score)))
+
+    directory = index_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    with FileLock(str(directory / '.lock')):
+        with transaction.atomic():
+            PropertySimilarity.objects.all().delete()
+            PropertySimilarity.objects.bulk_create(entries, batch_size=5000)
+        _save_array(directory / 'vectors.npy', vectors)
+        np.savez(directory / 'base.npz', ids=ids, codes=codes, kth=kth)
+        _write_json(directory / 'model.json', {'k': k, 'embedder': embedder.to_json()})
+        (directory / DELTA_LOG).unlink(missing_ok=True)
+    return len(ids), len(entries)
+
+
+def record_dtype(dimensions):
+    """One delta log record: a listing's current vector, or its removal."""
+    return np.dtype([('id', '<i8'), ('code', 'i1'), ('removed', '?'), ('kth', '<f4'),
+                     ('vector', '<f4', (dimensions,))])
+
+
+class IndexState:
+    """Base (memory-mapped) vectors of the last build plus its delta log, as one catalog."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        model = json.loads((directory / 'model.json').read_text())
+        self.k = model['k']
+        self.embedder = Embedder.from_json(model['embedder'])
+        base = np.load(directory / 'base.npz')
+        self.base_vectors = np.load(directory / 'vectors.npy', mmap_mode='r')
+        self.base_ids, self.base_codes, self.base_kth = base['ids'], base['codes'], base['kth']
+        self.dtype = record_dtype(self.embedder.dimensions)
+
+        records = self._read_log()
+        self.log_length = len(records)
+        # The last record of a listing wins; any record hides the listing's base row.
+        _, last = np.unique(records['id'][::-1], return_index=True)
+        latest = records[len(records) - 1 - last]
+        live = latest[~latest['removed']]
+        self.delta_ids, self.delta_vectors = live['id'], live['vector']
+        self.delta_codes, self.delta_kth = live['code'], live['kth']
+        self.tombstones = np.unique(records['id'])
+
+    def _read_log(self):
+        path = self.directory / DELTA_LOG
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return np.empty(0, dtype=self.dtype)
+        # A record torn by a crash mid-append is ignored.
+        return np.fromfile(path, dtype=self.dtype, count=size // self.dtype.itemsize)
+
+    def scores(self, vector, code):
+        """Scores of `vector` against every live listing with listing type `code`."""
+        base = np.asarray(self.base_vectors @ vector)
+        base[self.base_codes != code] = -np.inf
+        if len(self.tombstones):
+            base[np.isin(self.base_ids, self.tombstones)] = -np.inf
+        delta = self.delta_vectors @ vector if len(self.delta_ids) else np.empty(0, dtype=np.float32)
+        delta[self.delta_codes != code] = -np.inf
+        return (np.concatenate([self.base_ids, self.delta_ids]),
+                np.concatenate([base, delta]),
+                np.concatenate([self.base_kth, self.delta_kth]))
+
+    def lookup(self, pk):
+        """(vector, code) of live listing `pk`, or None."""
+        hit = np.flatnonzero(self.delta_ids == pk)
+        if len(hit):
+            return self.delta_vectors[hit[0]], int(self.delta_codes[hit[0]])
+        if pk in self.tombstones:
+            return None
+        # Base ids are sorted: build() reads them in id order and compact() sorts them.
+        i = int(np.searchsorted(self.base_ids, pk))
+        if i < len(self.base_ids) and self.base_ids[i] == pk:
+            return np.asarray(self.base_vectors[i]), int(self.base_codes[i])
+        return None
+
+    def hide(self, pk):
+        """Leave listing `pk` out of scores() (in memory only)."""
+        self.tombstones = np.union1d(self.tombstones, [pk])
+        keep = self.delta_ids != pk
+        self.delta_ids, self.delta_vectors = self.delta_ids[keep], self.delta_vectors[keep]
+        self.delta_codes, self.delta_kth = self.delta_codes[keep], self.delta_kth[keep]
+
+    def put(self, pk, vector, code):
+        """Make scores() see listing `pk` with `vector` (in memory only)."""
+        self.hide(pk)
+        self.delta_ids = np.append(self.delta_ids, pk)
+        self.delta_vectors = np.concatenate([self.delta_vectors.reshape(-1, len(vector)), vector[None, :]])
+        self.delta_codes = np.append(self.delta_codes, code)
+        self.delta_kth = np.append(self.delta_kth, np.float32(-np.inf))
+
+    def append(self, pk, vector=None, code=-1, kth=-np.inf):
+        """Record listing `pk`'s current vector, or its removal when `vector` is None."""
+        record = np.zeros(1, dtype=self.dtype)
+        record['id'], record['code'], record['kth'] = pk, code, kth
+        if vector is None:
+            record['removed'] = True
+        else:
+            record['vector'] = vector
+        with open(self.directory / DELTA_LOG, 'ab') as log:
+            log.write(record.tobytes())
+        self.log_length += 1
+        if self.log_length >= settings.SIMILARITY_DELTA_MAX_RECORDS:
+            self.compact()
+
+    def compact(self):
+        """Fold the delta log into the base files."""
+        state = IndexState(self.directory)
+        keep = ~np.isin(state.base_ids, state.tombstones)
+        ids = np.concatenate([state.base_ids[keep], state.delta_ids])
+        order = np.argsort(ids, kind='stable')
+        vectors = np.concatenate([state.base_vectors[keep], state.delta_vectors])[order]
+        codes = np.concatenate([state.base_codes[keep], state.delta_codes])[order]
+        kth = np.concatenate([state.base_kth[keep], state.delta_kth])[order]
+        _save_array(self.directory / 'vectors.npy', vectors)
+        tmp = self.directory / 'base.tmp.npz'
+        np.savez(tmp, ids=ids[order], codes=codes, kth=kth)
+        tmp.replace(self.directory / 'base.npz')
+        (self.directory / DELTA_LOG).unlink()
+        self.log_length = 0
+
+
+def _index_ready(directory):
+    return (directory / 'model.json').exists()
+
+
+def _neighbour_list(state, pk, vector, code):
+    """Listing `pk`'s top-k as PropertySimilarity rows, and its k-th score (-inf below k)."""
+    ids, scores, _ = state.scores(vector, code)
+    scores[ids == pk] = -np.inf
+    best = top_k(scores[None, :], state.k)[0]
+    best = best[np.isfinite(scores[best])]
+    rows = [PropertySimilarity(property_id=pk, similar_id=int(ids[i]), score=float(scores[i])) for i in best]
+    return rows, float(scores[best].min()) if len(best) >= state.k else -np.inf
+
+
+def _reindex(state, pk, vector, code, old=None):
+    """
+    Store listing `pk`'s list (or drop it when `vector` is None) and recompute
+    the lists it enters with `vector` or leaves with its `old` (vector, code).
+    """
+    touched = set()
+    for candidate in (old, (vector, code) if vector is not None else None):
+        if candidate is not None:
+            ids, scores, kth = state.scores(*candidate)
+            touched.update(ids[np.isfinite(scores) & (scores >= kth)].tolist())
+    touched.discard(pk)
+
+    rows, records = [], []
+    if vector is not None:
+        own, own_kth = _neighbour_list(state, pk, vector, code)
+        rows += own
+        records.append((pk, vector, code, own_kth))
+    for other in sorted(touched):
+        found = state.lookup(other)
+        if found is None:
+            continue
+        other_rows, other_kth = _neighbour_list(state, other, *found)
+        rows += other_rows
+        records.append((other, found[0], found[1], other_kth))
+
+    with transaction.atomic():
+        PropertySimilarity.objects.filter(property_id__in=[pk, *touched]).delete()
+        PropertySimilarity.objects.filter(similar_id=pk).delete()
+        PropertySimilarity.objects.bulk_create(rows, batch_size=1000)
+    if vector is None:
+        state.append(pk)
+    for record in records:
+        state.append(*record)
+
+
+def update_listing(prop):
+    """Re-index one saved listing against the last build. No-op before the first build."""
+    directory = index_dir()
+    if not _index_ready(directory):
+        return
+    with FileLock(str(directory / '.lock')):
+        state = IndexState(directory)
+        vector = state.embedder.embed(
+            [(float(prop.price), prop.property_type, prop.location, term_buckets(listing_text(prop)))])[0]
+        old = state.lookup(prop.pk)
+        state.put(prop.pk, vector, listing_code(prop.listing_type))
+        _reindex(state, prop.pk, vector, listing_code(prop.listing_type), old)
+
+
+def reindex_listing(pk):
+    """Background task: update_listing() for listing `pk` as it is now, if it still exists."""
+    prop = Property.objects.filter(pk=pk).first()
+    if prop is not None:
+        update_listing(prop)
+
+
+def remove_listing(pk):
+    """Background task: drop listing `pk` and refill the lists it was in."""
+    directory = index_dir()
+    if not _index_ready(directory):
+        return
+    with FileLock(str(directory / '.lock')):
+        state = IndexState(directory)
+        old = state.lookup(pk)
+        state.hide(pk)
+        _reindex(state, pk, None, None, old)
+
+
+def similar_listings(prop, k=6):
+    """Top-k similar listings of `prop`, best first: one query."""
+    return [
+        entry.similar for entry in
+        PropertySimilarity.objects.filter(property=prop, similar__is_listed=True).select_related('similar').order_by('-score')[:k]
+    ]
+
+
+def _save_array(path, array):
+    tmp = path.with_suffix('.tmp.npy')
+    np.save(tmp, array)
+    tmp.replace(path)
+
+
+def _write_json(path, data):
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(data))
+    tmp.replace(path)
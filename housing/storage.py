@@ -0,0 +1,27 @@
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+from .instrumentation import metrics
+from .mediafiles import content_hash, hashed_name
+
+
+class HashedMediaStorage(FileSystemStorage):
+    """
+    Stores uploads as `name.<content hash>.ext` so their URLs can be cached
+    forever (see housing.mediafiles). Identical uploads share one file; a
+    stored file is only reused once its own content is found to hash the same.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        metrics().inc('upload_bytes_total', content.size, kind=name.split('/')[0] if '/' in name else 'other')
+        digest = content_hash(content.chunks())
+        name = hashed_name(name, digest)
+        if self.exists(name):
+            with self.open(name, 'rb') as stored:
+                if content_hash(stored.chunks()) == digest:
+                    return name
+        return super().save(name, content, max_length=max_length)
@@ -0,0 +1,31 @@
+from contextlib import contextmanager
+
+from .instrumentation import record_queries
+from .urls import QUERY_BUDGETS
+
+
+@contextmanager
+def query_budget(route_name, budgets=QUERY_BUDGETS):
+    """
+    Fail with the captured statements if the block runs more SQL than the
+    budget declared for `route_name` in housing.urls.QUERY_BUDGETS.
+    """
+    if route_name not in budgets:
+        raise AssertionError(f'No query budget declared for route {route_name!r}')
+    budget = budgets[route_name]
+    with record_queries(capture=True) as recorder:
+        yield recorder
+    if recorder.count > budget:
+        statements = '\n'.join(
+            f'{i}. {sql}' for i, sql in enumerate(recorder.statements, start=1))
+        raise AssertionError(
+            f'{route_name} ran {recorder.count} queries, budget is {budget}:\n{statements}')
+
+
+class QueryBudgetMixin:
+    """TestCase mixin: request a route and enforce its declared query budget."""
+
+    def assertWithinQueryBudget(self, route_name, url, method='get', **kwargs):
+        with query_budget(route_name):
+            response = getattr(self.client, method)(url, **kwargs)
+        return response
@@ -1,3 +1,1354 @@
-from django.test import TestCase
+import datetime
+import gzip
+import importlib
+import io
+import json
+import os
+import pstats
+import subprocess
+import sys
+import tempfile
+from email.mime.text import MIMEText
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+
+from django.apps import apps as django_apps
+from django.core import mail
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from django.utils.connection import ConnectionDoesNotExist
+from rest_framework.authtoken.models import Token
+
+from . import (
+    agent_stats, auth_cache, autocomplete, catalog, chat, counters, db_router, dedup, instrumentation, mediafiles,
+    metrics, mortgage, price_stats, ratelimit, similarity, throttle,
+)
+from . import mail as mail_queue
+from .models import (
+    AgentDailyStat, AgentRating, ChatArchive, ChatMessage, ListingBucket, OutboundEmail, PriceStatistic,
+    Property, PropertyImage, PropertySimilarity, SavedSearch, SavedSearchMatch, User, conversation_key,
+)
+from .saved_searches import send_digests
+from .testing import QueryBudgetMixin
+from .urls import QUERY_BUDGETS, urlpatterns
+
+
+@mock.patch.object(db_router, 'replica_aliases', return_value=['replica_1', 'replica_2', 'replica_3'])
+class PrimaryReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = db_router.PrimaryReplicaRouter()
+        token = db_router.reset_write_flag()
+        self.addCleanup(db_router.restore_write_flag, token)
+
+    def test_a_request_reads_from_one_replica(self, aliases):
+        for _ in range(5):
+            token = db_router.choose_replica()
+            reads = {self.router.db_for_read(Property) for _ in range(20)}
+            db_router.release_replica(token)
+            self.assertEqual(len(reads), 1)
+            self.assertIn(reads.pop(), aliases.return_value)
+
+    def test_reads_follow_writes_to_the_primary(self, aliases):
+        token = db_router.choose_replica()
+        self.addCleanup(db_router.release_replica, token)
+        self.assertNotEqual(self.router.db_for_read(Property), 'default')
+        self.assertEqual(self.router.db_for_write(Property), 'default')
+        self.assertEqual(self.router.db_for_read(Property), 'default')
+
+    def test_pinned_requests_and_missing_replicas_read_the_primary(self, aliases):
+        token = db_router.pin_to_primary()
+        self.assertEqual(self.router.db_for_read(Property), 'default')
+        db_router.unpin(token)
+        aliases.return_value = []
+        token = db_router.choose_replica()
+        self.addCleanup(db_router.release_replica, token)
+        self.assertEqual(self.router.db_for_read(Property), 'default')
+
+    def test_writes_pin_the_clients_next_requests(self, aliases):
+        agent = User.objects.create_user('agent', 'agent@example.com', 'pass12345', user_type='agent')
+        buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345', user_type='buyer')
+        self.client.force_login(buyer)
+        response = self.client.post(reverse('rate_agent', args=[agent.pk]), {'score': 5})
+        self.assertEqual(response.cookies['pin_primary']['max-age'], 5)
+        # The replicas are not configured, so reads only succeed while pinned to the primary.
+        self.assertEqual(self.client.get(reverse('inbox')).status_code, 200)
+        del self.client.cookies['pin_primary']
+        with self.assertRaises(ConnectionDoesNotExist):
+            self.client.get(reverse('inbox'))
+
+
+@override_settings(VIEW_COUNTER_FLUSH_INTERVAL=3600)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every route in housing/urls.py must stay within its declared query budget."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user(
+            'agent@example.com', 'agent@example.com', 'pass12345', user_type='agent')
+        cls.buyer = User.objects.create_user(
+            'buyer@example.com', 'buyer@example.com', 'pass12345', user_type='buyer')
+        for i in range(5):
+            for listing_type in ('sale', 'rent'):
+                prop = Property.objects.create(
+                    title=f'House {i}', location='Kigali, Kacyiru', price=100000 + i,
+                    property_type='house', listing_type=listing_type,
+                    description='Three bedrooms', owner=cls.agent)
+                for n in range(3):
+                    PropertyImage.objects.create(
+                        property=prop, image=f'property_images/{prop.pk}_{n}.jpg',
+                        is_thumbnail=(n == 1))
+        cls.property = prop
+        AgentRating.objects.create(agent=cls.agent, rater=cls.buyer, score=4)
+        for i in range(3):
+            ChatMessage.objects.create(sender=cls.buyer, receiver=cls.agent, message=f'Hi {i}')
+            ChatMessage.objects.create(sender=cls.agent, receiver=cls.buyer, message=f'Hello {i}')
+
+    def setUp(self):
+        autocomplete._index = None
+        catalog.reset()
+        self.addCleanup(catalog.reset)
+        cache.clear()
+
+    def read_routes(self):
+        return {
+            'index': (reverse('index'), None),
+            'listing_cards': (reverse('listing_cards') + '?page=2', None),
+            'buy_properties': (reverse('buy_properties'), None),
+            'rent_properties': (reverse('rent_properties'), None),
+            'agent_list': (reverse('agent_list'), self.buyer),
+            'sell_landing': (reverse('sell_landing'), None),
+            'tools_landing': (reverse('tools_landing'), None),
+            'register': (reverse('register'), None),
+            'login': (reverse('login'), None),
+            'add_property': (reverse('add_property'), self.agent),
+            'property_detail': (reverse('property_detail', args=[self.property.pk]), self.agent),
+            'edit_property': (reverse('edit_property', args=[self.property.pk]), self.agent),
+            'edit_profile': (reverse('edit_profile'), self.agent),
+            'agent_profile': (reverse('agent_profile', args=[self.agent.username]), None),
+            'chat_view': (reverse('chat_view', args=[self.agent.username]), self.buyer),
+            'inbox': (reverse('inbox'), self.buyer),
+            'agent_dashboard': (reverse('agent_dashboard'), self.agent),
+            'saved_searches': (reverse('saved_searches'), self.buyer),
+            'password_reset': (reverse('password_reset'), None),
+            'password_reset_done': (reverse('password_reset_done'), None),
+            'password_reset_complete': (reverse('password_reset_complete'), None),
+            'property-list': (reverse('property-list'), None),
+            'property-detail': (reverse('property-detail', args=[self.property.pk]), None),
+            'user-list': (reverse('user-list'), None),
+            'agent-list': (reverse('agent-list'), None),
+            'agent-detail': (reverse('agent-detail', args=[self.agent.pk]), None),
+            'property-price-stats': (reverse('property-price-stats', args=[self.property.pk]), None),
+            'property-daily-views': (reverse('property-daily-views', args=[self.property.pk]), self.agent),
+            'location_autocomplete': (reverse('location_autocomplete') + '?q=kac', None),
+            'conversation_messages': (reverse('conversation_messages', args=[self.agent.username]), self.buyer),
+            'metrics': (reverse('metrics'), None),
+        }
+
+    def test_every_route_declares_a_budget(self):
+        names = {p.name for p in urlpatterns if isinstance(p, URLPattern) and p.name}
+        self.assertEqual(sorted(names - set(QUERY_BUDGETS)), [])
+
+    def test_read_routes_within_budget(self):
+        for route_name, (url, user) in self.read_routes().items():
+            with self.subTest(route=route_name):
+                if user is not None:
+                    self.client.force_login(user)
+                response = self.assertWithinQueryBudget(route_name, url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Server-Timing', response)
+                self.client.logout()
+
+    def test_write_routes_within_budget(self):
+        self.client.force_login(self.buyer)
+        self.assertWithinQueryBudget(
+            'rate_agent', reverse('rate_agent', args=[self.agent.pk]), method='post',
+            data={'score': 5, 'comment': 'Great'})
+        self.assertWithinQueryBudget(
+            'chat_view', reverse('chat_view', args=[self.agent.username]), method='post',
+            data={'message': 'Is it still available?'})
+        self.assertWithinQueryBudget(
+            'saved_searches', reverse('saved_searches'), method='post',
+            data={'listing_type': 'sale', 'location': 'Kigali'})
+        search = SavedSearch.objects.get(user=self.buyer)
+        self.assertWithinQueryBudget(
+            'delete_saved_search', reverse('delete_saved_search', args=[search.pk]), method='post')
+        self.assertWithinQueryBudget(
+            'mortgage_quote', reverse('mortgage_quote'), method='post',
+            data={'property_ids': [self.property.pk], 'prices': [50000000]},
+            content_type='application/json')
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('mail server down')
+
+
+@override_settings(MAIL_QUEUE_MAX_ATTEMPTS=3)
+class MailQueueTests(TestCase):
+    def queue(self):
+        message = EmailMessage('Hello', 'Body', to=['buyer@example.com'])
+        with override_settings(EMAIL_BACKEND='housing.mail.QueuedEmailBackend'):
+            message.send()
+        return OutboundEmail.objects.latest('pk')
+
+    def test_queued_mail_is_delivered_with_its_attachments(self):
+        message = EmailMultiAlternatives('Hello', 'Body', to=['buyer@example.com'], cc=['agent@example.com'])
+        message.attach_alternative('<p>Body</p>', 'text/html')
+        message.attach('plan.pdf', b'%PDF-\x00\xff', 'application/pdf')
+        message.attach('notes.txt', 'Near the market', 'text/plain')
+        with override_settings(EMAIL_BACKEND='housing.mail.QueuedEmailBackend'):
+            message.send()
+        self.assertEqual(mail.outbox, [])
+        rows = mail_queue.claim_batch(10, lease_seconds=300)
+        self.assertEqual(mail_queue.deliver_batch(rows, 3, connection=get_connection()), (1, 0, 0))
+        [sent] = mail.outbox
+        self.assertEqual((sent.to, sent.cc), (['buyer@example.com'], ['agent@example.com']))
+        self.assertEqual(sent.alternatives[0][0], '<p>Body</p>')
+        self.assertEqual([tuple(a) for a in sent.attachments], [
+            ('plan.pdf', b'%PDF-\x00\xff', 'application/pdf'),
+            ('notes.txt', 'Near the market', 'text/plain'),
+        ])
+        self.assertEqual(OutboundEmail.objects.get().status, 'sent')
+
+    def test_mime_attachments_are_refused(self):
+        message = EmailMessage('Hello', 'Body', to=['buyer@example.com'])
+        message.attach(MIMEText('inline'))
+        with self.assertRaises(ValueError):
+            mail_queue.serialize(message)
+
+    def test_failures_back_off_then_give_up(self):
+        row = self.queue()
+        for attempt in (1, 2):
+            [claimed] = mail_queue.claim_batch(10, lease_seconds=300)
+            self.assertEqual(mail_queue.deliver_batch([claimed], 3, connection=FailingEmailBackend()), (0, 1, 0))
+            row.refresh_from_db()
+            self.assertEqual((row.status, row.attempts), ('pending', attempt))
+            self.assertIn('mail server down', row.last_error)
+            self.assertEqual(mail_queue.claim_batch(10, lease_seconds=300), [])  # not due yet
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        [claimed] = mail_queue.claim_batch(10, lease_seconds=300)
+        self.assertEqual(mail_queue.deliver_batch([claimed], 3, connection=FailingEmailBackend()), (0, 0, 1))
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('failed', 3))
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        delays = [mail_queue.retry_delay(attempts).total_seconds() for attempts in (1, 2, 3, 20)]
+        for delay, expected in zip(delays, (30, 60, 120, 3600)):
+            self.assertGreaterEqual(delay, expected * 0.8)
+            self.assertLessEqual(delay, expected * 1.2)
+
+    def test_expired_leases_count_as_attempts(self):
+        row = self.queue()
+        self.assertEqual(len(mail_queue.claim_batch(10, lease_seconds=300)), 1)
+        self.assertEqual(mail_queue.claim_batch(10, lease_seconds=300), [])  # still leased
+        for attempts in (1, 2):
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())  # the worker died
+            [claimed] = mail_queue.claim_batch(10, lease_seconds=300)
+            self.assertEqual(claimed.attempts, attempts)
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(mail_queue.claim_batch(10, lease_seconds=300), [])
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('failed', 3))
+
+
+class MortgageTests(TestCase):
+    def test_payments(self):
+        scenarios = [
+            mortgage.Scenario(rate=6.0, deposit_percent=0, term_years=30),
+            mortgage.Scenario(rate=0.0, deposit_percent=20, term_years=10),
+            mortgage.Scenario(rate=16.0, deposit_percent=100, term_years=20),
+        ]
+        payments = mortgage.monthly_payments([100000, 240000], scenarios)
+        np.testing.assert_allclose(payments[0], [599.55, 1438.92], atol=0.01)  # published annuity tables
+        np.testing.assert_allclose(payments[1], [100000 * 0.8 / 120, 240000 * 0.8 / 120])
+        np.testing.assert_array_equal(payments[2], [0, 0])
+        self.assertEqual(mortgage.estimate_monthly_payments([]), [])
+
+    def test_schedules_repay_the_principal(self):
+        for scenario in (mortgage.Scenario(rate=16.0, deposit_percent=20, term_years=20),
+                         mortgage.Scenario(rate=0.0, deposit_percent=0, term_years=5)):
+            with self.subTest(scenario=scenario):
+                schedule = mortgage.amortization_schedules([50000000, 1000000], scenario)
+                borrowed = mortgage.principals([50000000, 1000000], (scenario,))[0]
+                self.assertEqual(schedule['balance'].shape, (2, scenario.months))
+                np.testing.assert_allclose(schedule['principal'].sum(axis=1), borrowed)
+                np.testing.assert_allclose(schedule['balance'][:, -1], 0, atol=1e-4)
+                np.testing.assert_allclose(schedule['interest'] + schedule['principal'], schedule['payment'])
+
+    def test_quotes_skip_delisted_properties(self):
+        agent = User.objects.create_user('agent', 'agent@example.com', 'pass12345', user_type='agent')
+        listed, delisted = [
+            Property.objects.create(title='House', location='Kigali', price=1000000, property_type='house',
+                                    description='', owner=agent, is_listed=is_listed)
+            for is_listed in (True, False)
+        ]
+        response = self.client.post(reverse('mortgage_quote'), {'property_ids': [listed.pk, delisted.pk]},
+                                     content_type='application/json')
+        self.assertEqual([loan['property_id'] for loan in response.json()['results']], [listed.pk])
+        long_term = {'prices': [1000000], 'scenarios': [{'term_years': 50}]}
+        self.assertEqual(self.client.post(reverse('mortgage_quote'), long_term,
+                                          content_type='application/json').status_code, 200)
+        self.assertEqual(self.client.post(reverse('mortgage_quote'), dict(long_term, schedule=True),
+                                          content_type='application/json').status_code, 400)
+
+
+class PriceStatisticsTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user('agent', 'agent@example.com', 'pass12345', user_type='agent')
+
+    def rows(self):
+        return list(PriceStatistic.objects.order_by('area', 'property_type', 'listing_type').values_list(
+            'area', 'property_type', 'listing_type', 'count', 'total', 'p25', 'median', 'p75', 'sketch'))
+
+    def test_quantiles_are_within_the_relative_accuracy(self):
+        prices = np.random.default_rng(7).lognormal(mean=17, sigma=1, size=5000).round()
+        sketch = price_stats.QuantileSketch()
+        for price in prices:
+            sketch.add(price)
+        ordered = np.sort(prices)
+        for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact) / exact, price_stats.RELATIVE_ACCURACY + 1e-9)
+        for price in prices[:2500]:
+            sketch.remove(price)
+        self.assertEqual(sketch.count, 2500)
+
+    def test_incremental_updates_match_a_rebuild(self):
+        listings = [
+            Property.objects.create(title='House', location=location, price=price, property_type='house',
+                                    description='', owner=self.agent)
+            for location, price in [('Kigali, Kacyiru', 300000), ('kigali,  kacyiru', 500000),
+                                    ('Huye', 150000), ('Kigali, Kacyiru', 900000)]
+        ]
+        listings[0].price = 350000
+        listings[0].save()
+        listings[1].location = 'Huye'
+        listings[1].save()
+        listings[2].is_listed = False
+        listings[2].save()
+        listings[3].delete()
+        Property.objects.create(title='Flat', location='Huye', price=80000, property_type='flat',
+                                listing_type='rent', description='', owner=self.agent, is_listed=False)
+
+        incremental = self.rows()
+        self.assertEqual([row[:5] for row in incremental], [
+            ('huye', 'house', 'sale', 1, 500000.0),
+            ('kigali, kacyiru', 'house', 'sale', 1, 350000.0),
+        ])
+        price_stats.rebuild()
+        self.assertEqual(self.rows(), incremental)
+        backfill = importlib.import_module('housing.migrations.0017_fill_price_statistics')
+        backfill.fill_price_statistics(django_apps, None)
+        self.assertEqual(self.rows(), incremental)
+        listings[2].is_listed = True
+        listings[2].save()
+        self.assertEqual(PriceStatistic.objects.get(area='huye').count, 2)
+
+
+class SimilarityIndexTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(SIMILARITY_INDEX_DIR=self.directory, SIMILARITY_DELTA_MAX_RECORDS=3)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.agent = User.objects.create_user('agent', 'agent@example.com', 'pass12345', user_type='agent')
+        words = ['garden', 'pool', 'garage', 'balcony', 'view', 'quiet', 'modern', 'furnished']
+        self.listings = [
+            Property.objects.create(
+                title=f'{words[i % 8]} house', description=f'{words[(i * 3) % 8]} {words[(i * 5) % 8]}',
+                location=['Kigali, Kacyiru', 'Huye', 'Musanze'][i % 3], price=100000 + 37000 * i,
+                property_type=['house', 'flat'][i % 2], listing_type='rent' if i % 4 == 0 else 'sale',
+                owner=self.agent)
+            for i in range(24)
+        ]
+        similarity.build(k=3)
+
+    def neighbours(self, prop):
+        """Stored (neighbour id, score) pairs, best first."""
+        return list(PropertySimilarity.objects.filter(property=prop).order_by('-score')
+                    .values_list('similar_id', 'score'))
+
+    def assertSameNeighbours(self, stored, expected):
+        # Near-equal scores may come back in either order, so ties are compared by score.
+        self.assertEqual(len(stored), len(expected))
+        np.testing.assert_allclose([score for _, score in stored], [score for _, score in expected], atol=1e-5)
+
+    def test_build_stores_the_exact_top_k(self):
+        state = similarity.IndexState(self.directory)
+        vectors = dict(zip(state.base_ids.tolist(), np.asarray(state.base_vectors)))
+        for prop in self.listings:
+            scores = sorted(((float(vectors[p.pk] @ vectors[prop.pk]), p.pk) for p in self.listings
+                             if p.listing_type == prop.listing_type and p.pk != prop.pk), reverse=True)
+            stored = self.neighbours(prop)
+            self.assertSameNeighbours(stored, [(pk, score) for score, pk in scores[:3]])
+            for pk, score in stored:
+                self.assertAlmostEqual(score, float(vectors[pk] @ vectors[prop.pk]), places=5)
+
+    def all_neighbours(self):
+        return {prop.pk: self.neighbours(prop) for prop in Property.objects.all()}
+
+    def assertMatchesRebuild(self):
+        incremental = self.all_neighbours()
+        similarity.build(k=3)
+        rebuilt = self.all_neighbours()
+        self.assertEqual(incremental.keys(), rebuilt.keys())
+        for pk, stored in incremental.items():
+            self.assertSameNeighbours(stored, rebuilt[pk])
+
+    def test_updates_match_a_rebuild(self):
+        # Prices stay inside the built range and texts are unchanged, so a rebuild embeds the same way.
+        changed = self.listings[5]
+        for price in (300000, 500000, 200000, 400000):
+            changed.price = price
+            with self.captureOnCommitCallbacks(execute=True):
+                changed.save()
+            self.assertLess(similarity.IndexState(self.directory).log_length, 3)
+        self.assertMatchesRebuild()
+
+    def test_neighbour_lists_stay_at_k_and_refill_after_a_removal(self):
+        for prop, price in ((self.listings[2], 150000), (self.listings[7], 900000)):
+            prop.price = price
+            with self.captureOnCommitCallbacks(execute=True):
+                prop.save()
+        self.assertTrue(all(len(stored) == 3 for stored in self.all_neighbours().values()))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[9].delete()
+        # A rebuild would refit the IDF weights without the removed listing, so
+        # compare with the exact top-k under the index's current vectors instead.
+        state = similarity.IndexState(self.directory)
+        for pk, stored in self.all_neighbours().items():
+            ids, scores, _ = state.scores(*state.lookup(pk))
+            scores[ids == pk] = -np.inf
+            self.assertEqual(len(stored), 3)
+            self.assertSameNeighbours(stored, [(None, score) for score in sorted(scores, reverse=True)[:3]])
+
+    def test_delta_log_is_compacted(self):
+        removed = self.listings[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            removed.delete()
+        for prop in self.listings[2:4]:
+            prop.title = 'Garden cottage'
+            with self.captureOnCommitCallbacks(execute=True):
+                prop.save()
+        self.assertFalse((self.directory / similarity.DELTA_LOG).exists())
+        state = similarity.IndexState(self.directory)
+        self.assertEqual(state.base_ids.tolist(), sorted(p.pk for p in self.listings if p is not removed))
+        prop = self.listings[3]
+        vector = state.embedder.embed([(float(prop.price), prop.property_type, prop.location,
+                                        similarity.term_buckets(similarity.listing_text(prop)))])[0]
+        np.testing.assert_allclose(state.base_vectors[state.base_ids.tolist().index(prop.pk)], vector)
+
+
+class DuplicateDetectionTests(TestCase):
+    description = ('Four bedrooms and two bathrooms with a large garden, parking for two cars and a '
+                   'water tank, a short walk from Kacyiru market and the main road into town.')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(MEDIA_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.agent = User.objects.create_user('agent', 'agent@example.com', 'pass12345', user_type='agent')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing = Property.objects.create(
+                title='Family house with garden', description=self.description, location='Kigali, Kacyiru',
+                price=90000000, property_type='house', owner=self.agent)
+
+    def photo(self, flip=False, size=(240, 160), format='PNG'):
+        pixels = np.fromfunction(lambda y, x: (x * 3 + (y // 20) * 25 + (x // 40) * 60) % 256, (160, 240))
+        image = Image.fromarray(pixels.astype(np.uint8)).convert('RGB').resize(size)
+        if flip:
+            image = image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+        buffer = io.BytesIO()
+        image.save(buffer, format=format)
+        buffer.seek(0)
+        return buffer
+
+    def duplicates(self, title, description, location, photos=()):
+        return [(prop.pk, reason) for prop, reason in dedup.find_duplicates(title, description, location, photos)]
+
+    def test_reworded_listings_match_and_distinct_ones_do_not(self):
+        reworded = self.description.replace('two cars', 'three cars')
+        [(pk, reason)] = self.duplicates('Family house with garden', reworded, 'Kigali, Kacyiru')
+        self.assertEqual(pk, self.listing.pk)
+        self.assertIn('similar description', reason)
+        self.assertEqual(self.duplicates('Studio flat', 'One room above a shop in the town centre with a '
+                                         'shared kitchen and a bus stop outside.', 'Huye'), [])
+
+    def test_crowded_buckets_are_not_evidence(self):
+        exact = ('Family house with garden', self.description, 'Kigali, Kacyiru')
+        with mock.patch.object(dedup, 'MAX_BUCKET_SIZE', 1):
+            self.assertEqual(self.duplicates(*exact), [(self.listing.pk, '100% similar description')])
+        with mock.patch.object(dedup, 'MAX_BUCKET_SIZE', 0):
+            self.assertEqual(self.duplicates(*exact), [])
+
+    def test_the_same_photo_matches_after_resizing_and_recompression(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            PropertyImage.objects.create(property=self.listing, image=ContentFile(self.photo().read(), 'front.png'))
+        other_text = ('Studio flat', 'One room above a shop in the town centre.', 'Huye')
+        self.assertEqual(self.duplicates(*other_text, [self.photo(size=(120, 80), format='JPEG')]),
+                         [(self.listing.pk, 'same photo')])
+        self.assertEqual(self.duplicates(*other_text, [self.photo(flip=True)]), [])
+
+    def test_fingerprints_are_updated_after_commit(self):
+        self.listing.title = 'Renovated family house'
+        self.listing.description = 'Completely different words now describe this listing for the test.'
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.listing.save()
+        self.assertTrue(self.duplicates('Family house with garden', self.description, 'Kigali, Kacyiru'))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.duplicates('Family house with garden', self.description, 'Kigali, Kacyiru'), [])
+
+
+class LocationAutocompleteTests(TestCase):
+    def setUp(self):
+        autocomplete._index = None
+        self.agent = User.objects.create_user(
+            'agent@example.com', 'agent@example.com', 'pass12345', user_type='agent',
+            locations='Musanze, Rubavu')
+        for location in ['Kigali, Kacyiru', 'kigali,  kacyiru', 'Kigali, Kimihurura']:
+            Property.objects.create(title='House', location=location, price=100000,
+                                    property_type='house', description='', owner=self.agent)
+
+    def suggest(self, q):
+        response = self.client.get(reverse('location_autocomplete'), {'q': q})
+        return [(r['location'], r['count']) for r in response.json()['results']]
+
+    def test_matches_any_word_weighted_by_listings(self):
+        self.assertEqual(self.suggest('ki'), [('Kigali, Kacyiru', 2), ('Kigali, Kimihurura', 1)])
+        self.assertEqual(self.suggest('kim'), [('Kigali, Kimihurura', 1)])
+        self.assertEqual(self.suggest('rub'), [('Rubavu', 1)])
+        self.assertEqual(self.suggest(''), [])
+
+    def test_prefixes_rank_by_weight_then_name(self):
+        index = autocomplete.LocationIndex()
+        for location, weight in [('Kigali, Kacyiru', 3), ('kigali,kacyiru', 1), ('Kigali, Kimihurura', 4),
+                                 ('Kicukiro', 4), ('Huye', 9), ('Kigali/Remera', 2)]:
+            index.add(location, weight)
+        self.assertEqual(index.search('KI'), [('Kicukiro', 4), ('Kigali, Kacyiru', 4),
+                                              ('Kigali, Kimihurura', 4), ('Kigali/Remera', 2)])
+        self.assertEqual(index.search('ki', limit=2), [('Kicukiro', 4), ('Kigali, Kacyiru', 4)])
+        self.assertEqual(index.search('kigali, k'), [('Kigali, Kacyiru', 4), ('Kigali, Kimihurura', 4)])
+        self.assertEqual(index.search('rem'), [('Kigali/Remera', 2)])
+        self.assertEqual(index.search('igali'), [])
+        index.add('Kigali, Kacyiru', -3)
+        self.assertEqual(index.search('kac'), [('kigali, kacyiru', 1)])  # the remaining spelling
+        index.add('kigali,kacyiru', -1)
+        self.assertEqual(index.search('kac'), [])
+
+    def test_delisted_properties_are_not_suggested(self):
+        prop = Property.objects.get(location='Kigali, Kimihurura')
+        prop.is_listed = False
+        prop.save()
+        self.assertEqual(self.suggest('kim'), [])
+        prop.is_listed = True
+        prop.save()
+        self.assertEqual(self.suggest('kim'), [('Kigali, Kimihurura', 1)])
+
+    @override_settings(BACKGROUND_TASKS_INLINE=False)
+    def test_a_stale_index_is_served_while_a_new_one_is_built(self):
+        stale = autocomplete.get_index()
+        stale.built_at -= 3600
+        with mock.patch.object(autocomplete.background, 'submit') as submit, self.assertNumQueries(0):
+            self.assertEqual(self.suggest('hu'), [])
+            self.assertEqual(self.suggest('ki'), [('Kigali, Kacyiru', 2), ('Kigali, Kimihurura', 1)])
+        submit.assert_called_once_with(autocomplete._refresh)
+        Property.objects.create(title='House', location='Huye', price=1, property_type='house',
+                                description='', owner=self.agent)
+        autocomplete._refresh()
+        self.assertIsNot(autocomplete.get_index(), stale)
+        self.assertEqual(self.suggest('hu'), [('Huye', 1)])
+
+    def test_index_follows_listing_changes(self):
+        self.suggest('ki')
+        with self.assertNumQueries(0):
+            self.suggest('ki')
+        prop = Property.objects.get(location='Kigali, Kimihurura')
+        prop.location = 'Huye'
+        prop.save()
+        self.assertEqual(self.suggest('kim'), [])
+        self.assertEqual(self.suggest('hu'), [('Huye', 1)])
+        prop.delete()
+        self.assertEqual(self.suggest('hu'), [])
+
+
+class SavedSearchTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user(
+            'agent@example.com', 'agent@example.com', 'pass12345', user_type='agent')
+        self.buyer = User.objects.create_user(
+            'buyer@example.com', 'buyer@example.com', 'pass12345', user_type='buyer')
+
+    def search(self, **criteria):
+        return SavedSearch.objects.create(user=self.buyer, **criteria)
+
+    def list_property(self, **fields):
+        fields = {'title': 'House', 'location': 'Kigali, Kacyiru', 'price': 300000,
+                  'property_type': 'house', 'listing_type': 'rent', 'description': '',
+                  'owner': self.agent, **fields}
+        with self.captureOnCommitCallbacks(execute=True):
+            return Property.objects.create(**fields)
+
+    def test_new_listing_matches_by_criteria(self):
+        anywhere = self.search()
+        kacyiru_rentals = self.search(listing_type='rent', location='kacyiru', price_band='200k-500k')
+        houses_for_sale = self.search(listing_type='sale', property_type='house')
+        musanze = self.search(location='musanze')
+        prop = self.list_property()
+        matched = set(SavedSearchMatch.objects.filter(property=prop).values_list('search_id', flat=True))
+        self.assertEqual(matched, {anywhere.pk, kacyiru_rentals.pk})
+        self.assertNotIn(houses_for_sale.pk, matched)
+        self.assertNotIn(musanze.pk, matched)
+
+    def test_owner_is_not_matched_against_own_listing(self):
+        SavedSearch.objects.create(user=self.agent)
+        self.list_property()
+        self.assertFalse(SavedSearchMatch.objects.exists())
+
+    def test_digest_sends_one_email_per_user(self):
+        self.search()
+        self.search(location='kigali')
+        self.list_property(title='First')
+        self.list_property(title='Second')
+        self.assertEqual(send_digests(), (1, 1))
+        [email] = mail.outbox
+        self.assertEqual(email.to, ['buyer@example.com'])
+        self.assertIn('First', email.body)
+        self.assertIn('Second', email.body)
+        self.assertEqual(send_digests(), (0, 0))
+
+    def test_digest_leaves_out_delisted_homes(self):
+        self.search()
+        self.list_property(title='Still listed')
+        gone = self.list_property(title='Gone')
+        with self.captureOnCommitCallbacks(execute=True):
+            Property.objects.filter(pk=gone.pk).update(is_listed=False)
+        self.assertEqual(send_digests(), (1, 1))
+        [email] = mail.outbox
+        self.assertIn('1 new listing', email.subject)
+        self.assertNotIn('Gone', email.body)
+        self.assertNotIn('more', email.body)
+
+
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user(
+            'agent@example.com', 'agent@example.com', 'pass12345', user_type='agent')
+        self.property = Property.objects.create(
+            title='House', location='Kigali', price=100000, property_type='house',
+            description='', owner=self.agent)
+        counters.views.flush()
+
+    @override_settings(VIEW_COUNTER_FLUSH_INTERVAL=3600)
+    def test_views_are_buffered_then_flushed_in_batches(self):
+        url = reverse('property_detail', args=[self.property.pk])
+        for _ in range(3):
+            response = self.client.get(url)
+        self.assertEqual(response.context['view_count'], 3)
+        self.property.refresh_from_db()
+        self.assertEqual(self.property.views, 0)
+
+        # Three batched statements inside a savepoint.
+        with self.assertNumQueries(5):
+            self.assertEqual(counters.views.flush(), 3)
+        counters.views.increment(self.property.pk, 2)
+        counters.views.flush()
+        self.property.refresh_from_db()
+        self.assertEqual(self.property.views, 5)
+        self.assertEqual(counters.daily_views(1, property__owner=self.agent)[-1][1], 5)
+
+    @override_settings(VIEW_COUNTER_FLUSH_INTERVAL=3600)
+    def test_any_request_flushes_an_expired_buffer(self):
+        self.client.get(reverse('property_detail', args=[self.property.pk]))
+        self.client.get(reverse('index'))
+        self.assertEqual(counters.views.pending(self.property.pk), 1)
+
+        counters.views._last_flush -= 3600
+        self.client.get(reverse('index'))
+        self.assertEqual(counters.views.pending(self.property.pk), 0)
+        self.property.refresh_from_db()
+        self.assertEqual(self.property.views, 1)
+
+    def test_owner_views_are_not_counted(self):
+        self.client.force_login(self.agent)
+        self.client.get(reverse('property_detail', args=[self.property.pk]))
+        self.assertEqual(counters.views.pending(self.property.pk), 0)
+
+
+class AgentStatsTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user(
+            'agent@example.com', 'agent@example.com', 'pass12345', user_type='agent')
+        self.buyer = User.objects.create_user(
+            'buyer@example.com', 'buyer@example.com', 'pass12345', user_type='buyer')
+
+    def rows(self):
+        return list(AgentDailyStat.objects.order_by('agent_id', 'day').values(*agent_stats.COUNTERS))
+
+    def test_incremental_rollups_match_rebuild(self):
+        prop = Property.objects.create(title='House', location='Kigali', price=100000,
+                                       property_type='house', description='', owner=self.agent)
+        Property.objects.create(title='Flat', location='Huye', price=50000,
+                                property_type='flat', description='', owner=self.agent)
+        ChatMessage.objects.create(sender=self.buyer, receiver=self.agent, message='Hi')
+        ChatMessage.objects.create(sender=self.buyer, receiver=self.agent, message='Still there?')
+        ChatMessage.objects.create(sender=self.agent, receiver=self.buyer, message='Yes')
+        ChatMessage.objects.create(sender=self.agent, receiver=self.buyer, message='Come and visit')
+        rating = AgentRating.objects.create(agent=self.agent, rater=self.buyer, score=2)
+        rating.score = 4
+        rating.save()
+        counters.views.increment(prop.pk, 3)
+        counters.views.flush()
+
+        incremental = self.rows()
+        self.assertEqual(len(incremental), 1)
+        row = incremental[0]
+        self.assertEqual((row['listings_added'], row['views'], row['chats_received'], row['responses'],
+                          row['ratings'], row['rating_total']), (2, 3, 2, 1, 1, 4))
+        agent_stats.rebuild()
+        self.assertEqual(self.rows(), incremental)
+
+    def test_dashboard(self):
+        Property.objects.create(title='House', location='Kigali', price=100000,
+                                property_type='house', description='', owner=self.agent)
+        AgentRating.objects.create(agent=self.agent, rater=self.buyer, score=5)
+        self.client.force_login(self.agent)
+        response = self.client.get(reverse('agent_dashboard'))
+        self.assertEqual(response.context['listing_count'], 1)
+        self.assertEqual(response.context['rating'], 5)
+        self.assertEqual(len(response.context['series']), 30)
+        self.assertEqual(response.context['series'][-1]['listings_added'], 1)
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            RATE_LIMIT_STORE=Path(directory.name) / 'ratelimit.sqlite3',
+            RATE_LIMITS={'login': {'ip': '3/60'}, 'login_failures': {'account': '2/60'},
+                         'listing_write': {'ip': '1/60', 'account': '1/60'}})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(
+            'agent@example.com', 'agent@example.com', 'pass12345', user_type='agent')
+
+    def login(self, password, ip='10.0.0.1'):
+        return self.client.post(reverse('login'), {'username': 'agent@example.com', 'password': password},
+                                REMOTE_ADDR=ip)
+
+    def test_failed_passwords_lock_the_account_not_the_network(self):
+        self.assertEqual(self.login('wrong').status_code, 200)
+        self.assertEqual(self.login('wrong', ip='10.0.0.2').status_code, 200)
+        response = self.login('pass12345', ip='10.0.0.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_ip_bucket_refuses_before_hashing(self):
+        for n in range(3):
+            self.client.post(reverse('login'), {'username': f'guess{n}@example.com', 'password': 'x'},
+                             REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(self.login('pass12345', ip='10.0.0.9').status_code, 429)
+        self.assertEqual(self.login('pass12345', ip='10.0.0.10').status_code, 302)
+
+    def test_api_listing_writes_are_throttled(self):
+        self.client.force_login(self.user)
+        data = {'title': 'House', 'location': 'Kigali', 'price': 1000, 'property_type': 'house',
+                'listing_type': 'sale', 'description': 'A house'}
+        self.assertEqual(self.client.post(reverse('property-list'), data).status_code, 201)
+        response = self.client.post(reverse('property-list'), dict(data, title='Another', location='Huye'))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.client.get(reverse('property-list')).status_code, 200)
+
+    def test_ip_buckets_are_shared_with_the_api_but_account_buckets_are_not(self):
+        site = [key for key, _ in throttle.bucket_checks('listing_write', ip='10.0.0.1', account=7)]
+        api = [key for key, _ in ratelimit.bucket_checks(ratelimit.LIMITS, 'listing_write', 'api', '10.0.0.1', 7)]
+        self.assertEqual(site[0], api[0])
+        self.assertNotEqual(site[1], api[1])
+
+    def test_an_unavailable_store_allows_requests_and_logs_once(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        blocker = Path(directory.name) / 'read-only'
+        blocker.write_text('')
+        store = ratelimit.TokenBucketStore(blocker / 'ratelimit.sqlite3')
+        limit = ratelimit.Limit(1, 60)
+        with self.assertLogs('housing.ratelimit') as logs:
+            decisions = [store.take('key', limit) for _ in range(3)]
+        self.assertTrue(all(d.allowed for d in decisions))
+        self.assertEqual(len(logs.records), 1)
+        self.assertTrue(store.take('key', limit).allowed)
+
+        store.path = str(Path(directory.name) / 'ratelimit.sqlite3')
+        with mock.patch.object(ratelimit.time, 'monotonic', return_value=store._retry_at), \
+                self.assertLogs('housing.ratelimit', 'WARNING'):
+            self.assertTrue(store.take('key', limit).allowed)
+            self.assertFalse(store.take('key', limit).allowed)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(MEDIA_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.root = Path(directory.name)
+        self.name = default_storage.save('property_images/house.jpg', ContentFile(b'0123456789' * 10))
+
+    def get(self, name, **headers):
+        return self.client.get('/media/' + name, headers=headers)
+
+    def test_uploads_get_hashed_names_and_immutable_caching(self):
+        self.assertRegex(self.name, r'^property_images/house\.[0-9a-f]{12}\.jpg$')
+        self.assertEqual(default_storage.save('property_images/house.jpg', ContentFile(b'0123456789' * 10)),
+                         self.name)
+        response = self.get(self.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789' * 10)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['ETag'], '"%s"' % self.name.split('.')[-2])
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(self.get(self.name, if_none_match=response['ETag']).status_code, 304)
+
+    def test_client_names_cannot_claim_another_files_hash(self):
+        digest = self.name.split('.')[-2]
+        name = default_storage.save(f'property_images/house.{digest}.jpg', ContentFile(b'forged'))
+        self.assertNotEqual(name, self.name)
+        self.assertEqual(name.split('.')[-2], mediafiles.content_hash([b'forged']))
+        with default_storage.open(self.name) as f:
+            self.assertEqual(f.read(), b'0123456789' * 10)
+
+        # A file already stored under the hash, but not holding that content, is not reused.
+        forged = self.root / f'property_images/plan.{mediafiles.content_hash([b"real"])}.png'
+        forged.write_bytes(b'forged')
+        name = default_storage.save('property_images/plan.png', ContentFile(b'real'))
+        self.assertNotEqual(name, str(forged.relative_to(self.root)))
+        with default_storage.open(name) as f:
+            self.assertEqual(f.read(), b'real')
+
+    def test_byte_ranges(self):
+        response = self.get(self.name, range='bytes=5-14')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 5-14/100')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), b'5678901234')
+        self.assertEqual(b''.join(self.get(self.name, range='bytes=-3').streaming_content), b'789')
+        self.assertEqual(self.get(self.name, range='bytes=100-').status_code, 416)
+        self.assertEqual(self.get(self.name, range='bytes=0-1', if_range='"stale"').status_code, 200)
+
+    def test_precompressed_variant_and_unhashed_files(self):
+        (self.root / 'plan.svg').write_bytes(b'<svg/>')
+        (self.root / 'plan.svg.gz').write_bytes(gzip.compress(b'<svg/>'))
+        response = self.get('plan.svg', accept_encoding='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b'<svg/>')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertNotIn('Content-Encoding', self.get('plan.svg'))
+
+    def test_paths_outside_media_root_are_not_served(self):
+        self.assertEqual(self.get('../manage.py').status_code, 404)
+        self.assertEqual(self.get('property_images/').status_code, 404)
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        catalog.reset()
+        self.addCleanup(catalog.reset)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        self.agent = User.objects.create_user('agent', 'agent@example.com', 'pass12345', user_type='agent')
+        for i in range(3):
+            Property.objects.create(title=f'House {i}', location='Kigali', price=1000, property_type='house',
+                                    description='A house', owner=self.agent)
+        self.client.force_login(self.admin)
+
+    def test_change_lists_render(self):
+        for model in ('user', 'property', 'propertyimage', 'agentrating', 'chatmessage'):
+            response = self.client.get(reverse(f'admin:housing_{model}_changelist'))
+            self.assertEqual(response.status_code, 200, model)
+
+    def test_delisting_a_users_properties_is_one_update(self):
+        data = {'action': 'delist_properties', '_selected_action': [self.agent.pk]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('admin:housing_user_changelist'), data)
+        self.assertEqual(response.status_code, 302)
+        writes = [q['sql'] for q in queries if 'housing_property' in q['sql'] and q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(writes), 1)
+        self.assertFalse(Property.objects.filter(is_listed=True).exists())
+        self.assertNotContains(self.client.get(reverse('buy_properties')), 'House 0')
+
+    def test_delisting_and_relisting_refresh_the_derived_stores(self):
+        price_stats.rebuild()
+        dedup.reindex_all()
+        autocomplete._index = None
+        self.addCleanup(setattr, autocomplete, '_index', None)
+        buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345', user_type='buyer')
+        SavedSearch.objects.create(user=buyer, location='kigali')
+        ids = list(Property.objects.order_by('pk').values_list('pk', flat=True))[:2]
+        changelist = reverse('admin:housing_property_changelist')
+
+        def stored():
+            return (PriceStatistic.objects.get(area='kigali').count, autocomplete.suggest('kig')[0]['count'],
+                    ListingBucket.objects.filter(property_id__in=ids).values('property_id').distinct().count())
+
+        self.assertEqual(stored(), (3, 3, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(changelist, {'action': 'delist', '_selected_action': ids})
+        self.assertEqual(stored(), (1, 1, 0))
+        duplicates = dedup.find_duplicates('House 0', 'A house', 'Kigali', owner=self.agent)
+        self.assertFalse({prop.pk for prop, _ in duplicates} & set(ids))
+        self.assertEqual(send_digests(), (0, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(changelist, {'action': 'relist', '_selected_action': ids})
+        self.assertEqual(stored(), (3, 3, 2))
+        self.assertEqual(SavedSearchMatch.objects.filter(property_id__in=ids).count(), 2)
+
+
+class AgentDirectoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345', user_type='buyer')
+        self.agents = [
+            User.objects.create_user(f'agent{i}', f'agent{i}@example.com', 'pass12345', user_type='agent',
+                                     locations='Kigali, Musanze')
+            for i in range(3)
+        ]
+        for i in range(2):
+            Property.objects.create(title=f'House {i}', location='Kigali', price=1000, property_type='house',
+                                    description='A house', owner=self.agents[1], is_listed=(i == 0))
+        AgentRating.objects.create(agent=self.agents[1], rater=buyer, score=4)
+        AgentRating.objects.create(agent=self.agents[2], rater=buyer, score=2)
+
+    def test_page_is_one_query_with_aggregates(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('agent-list'), {'page_size': 2})
+        data = response.json()
+        self.assertEqual([a['username'] for a in data['results']], ['agent1', 'agent2'])
+        first = data['results'][0]
+        self.assertEqual((first['avg_rating'], first['rating_count'], first['active_listings']), (4.0, 1, 1))
+        self.assertEqual(first['service_areas'], ['Kigali', 'Musanze'])
+        self.assertIsNone(data['previous'])
+        page_two = self.client.get(data['next']).json()
+        self.assertEqual([a['username'] for a in page_two['results']], ['agent0'])
+        self.assertIsNone(page_two['next'])
+        self.assertEqual(page_two['results'][0]['rating_count'], 0)
+
+    def test_pages_are_cached(self):
+        response = self.client.get(reverse('agent-list'))
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('agent-list'))
+
+
+class PropertyExpansionTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user('agent', 'agent@example.com', 'pass12345', user_type='agent',
+                                              phone='0788000000')
+        buyers = [User.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'pass12345') for i in range(2)]
+        for i in range(5):
+            prop = Property.objects.create(title=f'House {i}', location='Kigali', price=1000, property_type='house',
+                                           description='A house', owner=self.agent)
+            for n in range(3):
+                PropertyImage.objects.create(property=prop, image=f'property_images/{prop.pk}_{n}.jpg',
+                                             is_thumbnail=(n == 2))
+        for buyer, score in zip(buyers, (5, 2)):
+            AgentRating.objects.create(agent=self.agent, rater=buyer, score=score)
+
+    def test_expansions_cost_a_fixed_number_of_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('property-list'), {'expand': 'owner,images,ratings'})
+        listing = response.json()[0]
+        self.assertEqual(listing['owner']['phone'], '0788000000')
+        self.assertEqual(len(listing['images']), 3)
+        self.assertEqual(listing['ratings'], {'average': 3.5, 'count': 2})
+        self.assertTrue(listing['thumbnail'].endswith('_2.jpg'))
+
+    def test_sparse_fieldsets(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('property-list'), {'fields': 'id,title,price'})
+        self.assertEqual(set(response.json()[0]), {'id', 'title', 'price'})
+        response = self.client.get(reverse('property-list'), {'fields': 'id', 'expand': 'ratings'})
+        self.assertEqual(set(response.json()[0]), {'id', 'ratings'})
+        self.assertEqual(self.client.get(reverse('property-list'), {'expand': 'agent'}).status_code, 400)
+
+
+class HomepageListingTests(TestCase):
+    def setUp(self):
+        agent = User.objects.create_user('agent', 'agent@example.com', 'pass12345', user_type='agent')
+        for i in range(15):
+            Property.objects.create(title=f'Listing {i:02d}', location='Kigali' if i % 2 else 'Huye', price=1000 * i,
+                                    property_type='house', description='A house', owner=agent)
+
+    def test_first_page_is_rendered_into_the_homepage(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Listing 14')
+        self.assertNotContains(response, 'Listing 02')
+        self.assertContains(response, 'data-next-page="%s?page=2"' % reverse('listing_cards'))
+
+    def test_fragment_pages_and_filters(self):
+        response = self.client.get(reverse('listing_cards'), {'page': 2})
+        self.assertContains(response, 'Listing 00')
+        self.assertNotContains(response, 'data-next-page')
+        self.assertNotContains(response, '<html')
+        response = self.client.get(reverse('listing_cards'), {'q': 'huye', 'price': '0-4000'})
+        self.assertEqual(response.content.count(b'href="/property/'), 3)
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(CATALOG_SNAPSHOT_DIR=Path(directory.name))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        catalog.reset()
+        self.addCleanup(catalog.reset)
+        self.agent = User.objects.create_user('agent', 'agent@example.com', 'pass12345', user_type='agent')
+        self.listings = [self.create(i) for i in range(6)]
+
+    def create(self, i, **fields):
+        fields = {'title': f'House {i}', 'location': 'Kigali, Kacyiru' if i % 2 else 'Huye',
+                  'price': 1000 * (6 - i), 'property_type': 'house', 'description': 'A house',
+                  'listing_type': 'sale' if i < 4 else 'rent', 'owner': self.agent, **fields}
+        with self.captureOnCommitCallbacks(execute=True):
+            return Property.objects.create(**fields)
+
+    def ids(self, offset=0, limit=10, **filters):
+        return catalog.page(offset, limit, **filters)
+
+    def test_filters_sorting_and_paging(self):
+        pks = [p.pk for p in self.listings]
+        self.assertEqual(self.ids(limit=2, listing_type='sale'), ([pks[3], pks[2]], 4))
+        self.assertEqual(self.ids(location='kacyiru', ordering='price'), ([pks[5], pks[3], pks[1]], 3))
+        self.assertEqual(self.ids(min_price=3000, max_price=5000, ordering='-price')[0], pks[1:4])
+        self.assertEqual(catalog.current().version, 6)
+
+    def test_committed_changes_patch_the_snapshot(self):
+        snapshot = catalog.current()
+        listing = self.listings[0]
+        listing.is_listed = False
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.save()
+        extra = self.create(6, listing_type='rent')
+        patched = catalog.current()
+        self.assertIsNot(patched, snapshot)
+        self.assertEqual(patched.version, snapshot.version + 2)
+        self.assertEqual(self.ids(listing_type='rent')[0], [extra.pk, self.listings[5].pk, self.listings[4].pk])
+        self.assertNotIn(listing.pk, self.ids()[0])
+
+    def test_publishes_within_one_mtime_tick_are_seen(self):
+        state = catalog._root() / 'state.json'
+        stamp = os.stat(state).st_mtime_ns
+        self.assertEqual(catalog.current().version, 6)
+        # A bulk change published within the same tick, leaving the same mtime and size.
+        state.write_text(state.read_text().replace('"version": 6', '"version": 7'))
+        os.utime(state, ns=(stamp, stamp))
+        self.assertEqual(catalog.current().version, 7)
+
+        settled = stamp - 2 * catalog.STAMP_RESOLUTION_NS
+        os.utime(state, ns=(settled, settled))
+        snapshot = catalog.current()
+        with mock.patch.object(catalog, '_read_state') as read_state:
+            self.assertIs(catalog.current(), snapshot)
+        read_state.assert_not_called()
+
+    @override_settings(CATALOG_SNAPSHOT_SHARED=True)
+    def test_shared_snapshots_are_memory_mapped(self):
+        snapshot = catalog.current()
+        self.assertIsInstance(snapshot.columns['ids'], np.memmap)
+        catalog.reset()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(catalog.current()), 6)
+
+    def test_api_pages_come_from_the_snapshot(self):
+        catalog.current()
+        with self.assertNumQueries(2):  # the page's rows and their images
+            response = self.client.get(reverse('property-list'),
+                                       {'limit': 2, 'listing_type': 'sale', 'ordering': 'price'})
+        data = response.json()
+        self.assertEqual(data['count'], 4)
+        self.assertEqual([p['id'] for p in data['results']], [self.listings[3].pk, self.listings[2].pk])
+        self.assertIn('offset=2', data['next'])
+        self.assertEqual(self.client.get(reverse('property-list'), {'limit': 2, 'ordering': 'x'}).status_code, 400)
+        self.assertIsInstance(self.client.get(reverse('property-list')).json(), list)
+
+
+class AuthCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345', user_type='buyer')
+
+    def test_logged_in_requests_skip_session_and_user_queries(self):
+        self.client.force_login(self.user)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('edit_profile'))
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_saves_invalidate_the_cached_user(self):
+        self.client.force_login(self.user)
+        self.user.first_name = 'Aline'
+        self.user.save()
+        self.assertEqual(auth_cache.cached_user(self.user.pk).first_name, 'Aline')
+        self.user.set_password('new-pass12345')
+        self.user.save()
+        # The session's password hash no longer matches, so it is logged out.
+        self.assertEqual(self.client.get(reverse('edit_profile')).status_code, 302)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_the_cache_holds_no_password_and_cached_users_save_safely(self):
+        self.client.force_login(self.user)
+        entry = cache.get(auth_cache._user_key(self.user.pk))
+        self.assertNotIn('password', entry['fields'])
+        self.assertNotIn(self.user.password, json.dumps(entry, default=str))
+
+        user = auth_cache.cached_user(self.user.pk)
+        user.first_name = 'Aline'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Aline')
+        self.assertTrue(self.user.check_password('pass12345'))
+
+    def test_sessions_of_the_stock_backend_stay_logged_in(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('edit_profile')).status_code, 200)
+
+    def test_a_wrong_password_is_hashed_once(self):
+        with mock.patch.object(User, 'check_password', autospec=True, return_value=False) as check:
+            self.client.post(reverse('login'), {'username': 'buyer', 'password': 'wrong'})
+        self.assertEqual(check.call_count, 1)
+
+    def test_token_lookups_are_cached_until_the_token_is_deleted(self):
+        token = Token.objects.create(user=self.user)
+        headers = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        with self.assertNumQueries(3):  # token, user, the page
+            self.assertEqual(self.client.get(reverse('user-list'), **headers).status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('user-list'), **headers).status_code, 200)
+        token.delete()
+        self.assertEqual(self.client.get(reverse('user-list'), **headers).status_code, 401)
+
+
+@override_settings(CHAT_PAGE_SIZE=4)
+class ChatArchiveTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user('agent', 'agent@example.com', 'pass12345', user_type='agent')
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345', user_type='buyer')
+        self.messages = []
+        long_ago = timezone.now() - datetime.timedelta(days=200)
+        for i in range(10):
+            sender, receiver = (self.buyer, self.agent) if i % 2 == 0 else (self.agent, self.buyer)
+            message = ChatMessage.objects.create(sender=sender, receiver=receiver, message=f'Message {i}')
+            if i < 7:
+                ChatMessage.objects.filter(pk=message.pk).update(
+                    timestamp=long_ago + datetime.timedelta(minutes=i), is_read=(i != 2))
+            self.messages.append(message)
+        self.conversation = conversation_key(self.agent.pk, self.buyer.pk)
+
+    def page_through(self, limit):
+        ids, before = [], None
+        while True:
+            page = chat.history(self.conversation, before, limit)
+            ids += [m.pk for m in page]
+            if len(page) < limit:
+                return ids
+            before = (page[-1].timestamp, page[-1].pk)
+
+    def test_old_read_messages_move_to_the_archive_in_batches(self):
+        self.assertEqual(self.conversation, conversation_key(self.buyer.pk, self.agent.pk))
+        self.assertEqual(set(ChatMessage.objects.values_list('conversation', flat=True)), {self.conversation})
+        agent_stats.rebuild()
+        before = list(AgentDailyStat.objects.values_list('day', 'chats_received', 'responses'))
+
+        self.assertEqual(chat.archive(batch_size=3), 6)
+        self.assertEqual(list(ChatArchive.objects.values_list('message_count', flat=True)), [6])
+        live = list(ChatMessage.objects.order_by('pk').values_list('message', flat=True))
+        self.assertEqual(live, ['Message 2', 'Message 7', 'Message 8', 'Message 9'])  # unread or recent
+
+        agent_stats.rebuild()
+        self.assertEqual(list(AgentDailyStat.objects.values_list('day', 'chats_received', 'responses')), before)
+
+    @override_settings(CHAT_ARCHIVE_CHUNK_SIZE=4)
+    def test_later_runs_fill_the_last_chunk_up_to_the_cap(self):
+        self.assertEqual(chat.archive(batch_size=2), 6)
+        ChatMessage.objects.filter(message='Message 2').update(is_read=True)
+        self.assertEqual(chat.archive(), 1)
+        chunks = ChatArchive.objects.order_by('pk')
+        self.assertEqual([c.message_count for c in chunks], [4, 3])
+        self.assertEqual([[m.message for m in chat._unpack(c)] for c in chunks],
+                         [['Message 0', 'Message 1', 'Message 3', 'Message 4'],
+                          ['Message 2', 'Message 5', 'Message 6']])
+
+    @override_settings(CHAT_ARCHIVE_CHUNK_SIZE=2)
+    def test_history_pages_through_live_and_archived_messages(self):
+        chat.archive(batch_size=3)
+        self.assertEqual(ChatArchive.objects.count(), 3)
+        newest_first = [m.pk for m in reversed(self.messages)]
+        for limit in (1, 3, 4, 20):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.page_through(limit), newest_first)
+        with self.assertNumQueries(1):  # recent enough that the archive is not consulted
+            chat.history(self.conversation, limit=2)
+
+    def test_api_pages_into_the_archive(self):
+        chat.archive(batch_size=3)
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('conversation_messages', args=[self.agent.username])).json()
+        self.assertEqual([m['message'] for m in response['results']],
+                         ['Message 9', 'Message 8', 'Message 7', 'Message 6'])
+        older = self.client.get(response['next']).json()
+        self.assertEqual([m['message'] for m in older['results']],
+                         ['Message 5', 'Message 4', 'Message 3', 'Message 2'])
+        self.assertEqual(len(self.client.get(older['next']).json()['results']), 2)
+        bad = self.client.get(reverse('conversation_messages', args=[self.agent.username]), {'before': 'x'})
+        self.assertEqual(bad.status_code, 400)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(METRICS_DIR=self.directory, METRICS_ENABLED=True, METRICS_TOKEN='s3cret')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        instrumentation.metrics.cache_clear()
+        self.addCleanup(instrumentation.metrics.cache_clear)
+        self.addCleanup(lambda: setattr(instrumentation.metrics(), 'enabled', False))
+
+    def test_totals_are_summed_across_processes(self):
+        subprocess.run([sys.executable, '-c', (
+            'from housing.metrics import Registry\n'
+            f'r = Registry({str(self.directory)!r})\n'
+            'r.inc("http_requests_total", 2, route="index", method="GET", status="200")\n'
+            'r.observe("http_request_duration_seconds", 0.2, route="index", method="GET")\n'
+            'r.add("http_requests_in_flight", 1)\n'
+        )], cwd=Path(__file__).resolve().parent.parent, check=True)
+        registry = metrics.Registry(self.directory)
+        registry.inc('http_requests_total', route='index', method='GET', status='200')
+        registry.observe('http_request_duration_seconds', 0.02, route='index', method='GET')
+        registry.add('http_requests_in_flight', 1)
+        for _ in range(2):  # the second time, the exited process's totals come from dead.json
+            text = registry.collect()
+            self.assertIn('http_requests_total{method="GET",route="index",status="200"} 3\n', text)
+            self.assertIn('http_request_duration_seconds_bucket{method="GET",route="index",le="0.025"} 1\n', text)
+            self.assertIn('http_request_duration_seconds_bucket{method="GET",route="index",le="0.25"} 2\n', text)
+            self.assertIn('http_request_duration_seconds_count{method="GET",route="index"} 2\n', text)
+            self.assertIn('http_requests_in_flight 1\n', text)  # only live processes
+        self.assertTrue((self.directory / 'dead.json').exists())
+        self.assertEqual(len(list(self.directory.glob('*-*.json'))), 1)
+        registry.enabled = False
+
+    def test_endpoint_reports_requests_to_allowed_clients(self):
+        self.client.get(reverse('sell_landing'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        text = response.content.decode()
+        self.assertIn('http_requests_total{method="GET",route="sell_landing",status="200"} 1\n', text)
+        self.assertIn('db_queries_total{route="sell_landing"} 0\n', text)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 404)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1',
+                                         HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(PROFILE_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'pass12345', is_staff=True)
+        self.listing = Property.objects.create(title='House', location='Kigali', price=1000, property_type='house',
+                                               description='A house', owner=self.staff)
+        for n in range(15):
+            PropertyImage.objects.create(property=self.listing, image=f'property_images/{n}.jpg')
+        self.url = reverse('property_detail', args=[self.listing.pk])
+
+    def artifacts(self, response):
+        return [self.directory / name for name in response['X-Profile'].split(', ')]
+
+    def test_staff_can_profile_a_request(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, {'_profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        stats_path, sql_path = self.artifacts(response)
+        stats = pstats.Stats(str(stats_path))
+        self.assertTrue(any(name == 'property_detail' for _, _, name in stats.stats))
+        timeline = json.loads(sql_path.read_text())
+        self.assertEqual(timeline['route'], 'property_detail')
+        self.assertTrue(timeline['queries'])
+        self.assertEqual(sorted(q['start_ms'] for q in timeline['queries']),
+                         [q['start_ms'] for q in timeline['queries']])
+
+    def test_sampling_writes_collapsed_stacks(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, HTTP_X_PROFILE='sample')
+        folded, _ = self.artifacts(response)
+        self.assertEqual(folded.suffix, '.folded')
+        for line in folded.read_text().splitlines():
+            self.assertRegex(line, r'^\S.* \d+$')
+
+    def test_other_users_are_not_profiled(self):
+        self.staff.is_staff = False
+        self.staff.save()
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, {'_profile': '1'})
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+
+class ColdStartTests(SimpleTestCase):
+    root = Path(__file__).resolve().parent.parent
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.env = dict(os.environ, VAR_DIR=directory.name, DATABASE_URL=f'sqlite:///{directory.name}/api.db')
+
+    def test_api_import_defers_request_time_dependencies(self):
+        deferred = ('housing.metrics', 'housing.ratelimit', 'jwt', 'passlib')
+        result = subprocess.run([sys.executable, '-c', (
+            'import json, sys\n'
+            'import api.index\n'
+            f'print(json.dumps([m for m in {deferred!r} if m in sys.modules]))\n'
+        )], cwd=self.root, env=self.env, capture_output=True, text=True, check=True)
+        self.assertEqual(json.loads(result.stdout.splitlines()[-1]), [])
+
+    def test_benchmark_reports_medians_and_enforces_budgets(self):
+        def run(*args):
+            return subprocess.run([sys.executable, 'scripts/cold_start.py', '--runs', '2', *args],
+                                  cwd=self.root, env=self.env, capture_output=True, text=True)
+
+        result = run('--output', str(self.directory / 'report.json'))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads((self.directory / 'report.json').read_text())
+        self.assertEqual(report['statuses'], [200])
+        self.assertLessEqual(report['import_ms']['median'], report['first_response_ms']['median'])
+
+        result = run('--budget-import-ms', '0')
+        self.assertEqual(result.returncode, 1)
+        self.assertIn('FAIL: import_ms median', result.stderr)
@@ -0,0 +1,78 @@
+"""
+Django and DRF glue for housing.ratelimit.
+
+Limits are configured per scope in settings.RATE_LIMITS (housing.ratelimit.LIMITS
+by default) as {'ip': 'capacity/seconds', 'account': 'capacity/seconds'}; each request takes
+a token from its IP bucket and, when the account is known, its account bucket.
+"""
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from . import ratelimit
+from .ratelimit import Decision, TokenBucketStore, check
+
+_stores = {}
+
+
+def store():
+    path = str(settings.RATE_LIMIT_STORE)
+    if path not in _stores:
+        _stores[path] = TokenBucketStore(path)
+    return _stores[path]
+
+
+def client_ip(request):
+    """REMOTE_ADDR, or the address our RATE_LIMIT_PROXY_COUNT trusted proxies saw."""
+    proxies = settings.RATE_LIMIT_PROXY_COUNT
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(',')]
+        return hops[max(len(hops) - proxies, 0)]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def bucket_checks(scope, ip=None, account=None):
+    return ratelimit.bucket_checks(settings.RATE_LIMITS, scope, 'django', ip, account)
+
+
+def hit(scope, ip=None, account=None):
+    """Take a token for this request from each configured bucket."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return Decision(True, 0)
+    return check(store(), bucket_checks(scope, ip, account))
+
+
+def peek(scope, account):
+    """Whether `account` has a token left in `scope`, without taking it."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return Decision(True, 0)
+    for key, limit in bucket_checks(scope, account=account):
+        decision = store().peek(key, limit)
+        if not decision.allowed:
+            return decision
+    return Decision(True, 0)
+
+
+def too_many_requests(response, decision):
+    response.status_code = 429
+    response['Retry-After'] = str(decision.retry_after)
+    return response
+
+
+class ScopedTokenBucketThrottle(BaseThrottle):
+    """DRF throttle for unsafe methods, keyed by client IP and authenticated user."""
+    scope = None
+
+    def allow_request(self, request, view):
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return True
+        account = request.user.pk if request.user and request.user.is_authenticated else None
+        self.decision = hit(self.scope, ip=client_ip(request), account=account)
+        return self.decision.allowed
+
+    def wait(self):
+        return self.decision.retry_after
+
+
+class ListingWriteThrottle(ScopedTokenBucketThrottle):
+    scope = 'listing_write'
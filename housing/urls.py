@@ -2,20 +2,27 @@ from django.urls import path, include
 from django.contrib.auth import views as auth_views
 from rest_framework.routers import DefaultRouter
 from .views import (
-    PropertyViewSet, UserViewSet, IndexView, buy_properties, rent_properties, 
+    AgentViewSet, PropertyViewSet, UserViewSet, IndexView, buy_properties, rent_properties, 
     agent_list, sell_landing, tools_landing, register_view, login_view, 
     logout_view, add_property, property_detail, set_thumbnail, edit_property, 
     delete_image, activate_view, rate_agent, agent_profile, edit_profile, 
-    chat_view, inbox
+    chat_view, inbox, mortgage_quote, location_autocomplete, saved_searches,
+    delete_saved_search, agent_dashboard, listing_cards, conversation_messages, metrics_view
 )
 
 router = DefaultRouter()
 router.register(r'properties', PropertyViewSet)
 router.register(r'users', UserViewSet)
+router.register(r'agents', AgentViewSet, basename='agent')
 
 urlpatterns = [
+    path('api/mortgage/', mortgage_quote, name='mortgage_quote'),
+    path('api/conversations/<str:username>/messages/', conversation_messages, name='conversation_messages'),
+    path('api/locations/autocomplete/', location_autocomplete, name='location_autocomplete'),
     path('api/', include(router.urls)),
+    path('metrics/', metrics_view, name='metrics'),
     path('', IndexView.as_view(), name='index'),
+    path('listings/cards/', listing_cards, name='listing_cards'),
     path('buy/', buy_properties, name='buy_properties'),
     path('rent/', rent_properties, name='rent_properties'),
     path('agents/', agent_list, name='agent_list'),
@@ -35,6 +42,9 @@ urlpatterns = [
     path('profile/@<str:username>/', agent_profile, name='agent_profile'),
     path('chat/@<str:username>/', chat_view, name='chat_view'),
     path('inbox/', inbox, name='inbox'),
+    path('dashboard/', agent_dashboard, name='agent_dashboard'),
+    path('searches/', saved_searches, name='saved_searches'),
+    path('searches/<int:pk>/delete/', delete_saved_search, name='delete_saved_search'),
     
     # Password Reset
     path('password-reset/', auth_views.PasswordResetView.as_view(template_name='registration/password_reset_form.html'), name='password_reset'),
@@ -42,3 +52,51 @@ urlpatterns = [
     path('reset/<uidb64>/<token>/', auth_views.PasswordResetConfirmView.as_view(template_name='registration/password_reset_confirm.html'), name='password_reset_confirm'),
     path('reset/done/', auth_views.PasswordResetCompleteView.as_view(template_name='registration/password_reset_complete.html'), name='password_reset_complete'),
 ]
+
+# Maximum SQL statements per request for each named route, enforced by
+# housing.tests.QueryBudgetTests against its seeded fixture (10 listings with
+# 3 images each). Lower a budget when a route gets cheaper; never raise one
+# without understanding why the route got more expensive. Logged-in routes are
+# measured with the session and user already cached, as they are after login.
+QUERY_BUDGETS = {
+    'index': 2,
+    'listing_cards': 2,
+    'buy_properties': 3,
+    'rent_properties': 3,
+    'agent_list': 1,
+    'sell_landing': 0,
+    'tools_landing': 0,
+    'register': 0,
+    'activate': 4,
+    'login': 0,
+    'logout': 2,
+    'add_property': 0,
+    'property_detail': 9,
+    'edit_property': 4,
+    'set_thumbnail': 6,
+    'delete_image': 6,
+    'rate_agent': 7,
+    'edit_profile': 0,
+    'agent_profile': 4,
+    'chat_view': 4,
+    'inbox': 2,
+    'agent_dashboard': 3,
+    'saved_searches': 1,
+    'delete_saved_search': 3,
+    'password_reset': 0,
+    'password_reset_done': 0,
+    'password_reset_confirm': 2,
+    'password_reset_complete': 0,
+    # API (router) routes
+    'property-list': 2,
+    'property-detail': 2,
+    'property-price-stats': 2,
+    'property-daily-views': 2,
+    'user-list': 1,
+    'agent-list': 1,
+    'agent-detail': 1,
+    'mortgage_quote': 1,
+    'conversation_messages': 3,
+    'metrics': 0,
+    'location_autocomplete': 2,
+}
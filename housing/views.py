@@ -1,15 +1,36 @@
+import hmac
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate
 from django.db import IntegrityError
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .forms import PropertyForm, AgentRatingForm, UserProfileForm, ChatForm
-from .models import Property, PropertyImage, AgentRating, ChatMessage
-from django.db.models import Avg, Q
+from .forms import PropertyForm, AgentRatingForm, UserProfileForm, ChatForm, SavedSearchForm
+from .models import Property, PropertyImage, AgentRating, ChatMessage, SavedSearch, conversation_key
+from django.db.models import Avg, Count, F, Max, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_page
 from django.views.generic import TemplateView
 from rest_framework import viewsets, permissions, filters
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from .models import Property, ChatMessage
-from .serializers import PropertySerializer, UserSerializer
+from .instrumentation import metrics
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .throttle import ListingWriteThrottle
+from .pagination import PeekPageNumberPagination
+from .serializers import (
+    AgentSerializer, ChatMessageSerializer, PropertySerializer, UserSerializer, MortgageQuoteSerializer,
+)
+from . import agent_stats, autocomplete, catalog, chat, counters, dedup, mediafiles, price_stats, similarity, throttle
+from .mortgage import Scenario, attach_monthly_payments, amortization_schedules, monthly_payments
 from django.contrib.auth import get_user_model
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
@@ -20,16 +41,84 @@ from django.contrib.sites.shortcuts import get_current_site
 
 User = get_user_model()
 
+def listing_page(request, page_size=12):
+    """
+    One page of listed properties, newest first, filtered by ?q=, ?property_type=
+    and ?price=min-max; returns (properties, next page URL or None). Images are
+    prefetched for the thumbnails and one extra row is fetched instead of a COUNT(*).
+    """
+    properties = Property.objects.filter(is_listed=True)
+    q = request.GET.get('q', '').strip()
+    if q:
+        properties = properties.filter(Q(location__icontains=q) | Q(title__icontains=q))
+    if request.GET.get('property_type'):
+        properties = properties.filter(property_type=request.GET['property_type'])
+    low, _, high = request.GET.get('price', '').partition('-')
+    if low.isdigit():
+        properties = properties.filter(price__gte=low)
+    if high.isdigit():
+        properties = properties.filter(price__lte=high)
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    offset = (page - 1) * page_size
+    properties = list(properties.order_by('-created_at', '-pk').prefetch_related(
+        Prefetch('images', queryset=PropertyImage.objects.order_by('pk')))[offset:offset + page_size + 1])
+    next_url = None
+    if len(properties) > page_size:
+        params = request.GET.copy()
+        params['page'] = page + 1
+        next_url = f"{reverse('listing_cards')}?{params.urlencode()}"
+    return properties[:page_size], next_url
+
+
 class IndexView(TemplateView):
+    """Homepage with the first page of listings rendered in; listing_cards serves the rest."""
     template_name = 'housing/index.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['properties'], context['next_url'] = listing_page(self.request)
+        return context
+
+
+@require_GET
+def listing_cards(request):
+    """A page of homepage listing cards as an HTML fragment, for infinite scroll and search."""
+    properties, next_url = listing_page(request)
+    return render(request, 'housing/partials/listing_cards.html', {
+        'properties': properties, 'next_url': next_url})
+
+CATALOG_PAGE_SIZE = 24
+
+
+def catalog_page(request, listing_type):
+    """One page of the buy/rent catalog: filtered and paged in housing.catalog, then hydrated."""
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    ids, total = catalog.page((page - 1) * CATALOG_PAGE_SIZE, CATALOG_PAGE_SIZE, listing_type=listing_type)
+    properties = catalog.hydrate(ids, Property.objects.prefetch_related(
+        Prefetch('images', queryset=PropertyImage.objects.order_by('pk'))))
+    return properties, {
+        'number': page,
+        'num_pages': max((total + CATALOG_PAGE_SIZE - 1) // CATALOG_PAGE_SIZE, 1),
+        'previous': page - 1 if page > 1 else None,
+        'next': page + 1 if page * CATALOG_PAGE_SIZE < total else None,
+        'total': total,
+    }
+
 def buy_properties(request):
-    properties = Property.objects.filter(listing_type='sale')
-    return render(request, 'housing/buy.html', {'properties': properties})
+    properties, page = catalog_page(request, 'sale')
+    return render(request, 'housing/buy.html', {
+        'properties': attach_monthly_payments(properties), 'page': page})
 
 def rent_properties(request):
-    properties = Property.objects.filter(listing_type='rent')
-    return render(request, 'housing/rent.html', {'properties': properties})
+    properties, page = catalog_page(request, 'rent')
+    return render(request, 'housing/rent.html', {'properties': properties, 'page': page})
 
 def agent_list(request):
     agents = User.objects.filter(user_type='agent').annotate(
@@ -65,6 +154,11 @@ def tools_landing(request):
 
 def register_view(request):
     if request.method == 'POST':
+        decision = throttle.hit('register', ip=throttle.client_ip(request))
+        if not decision.allowed:
+            return throttle.too_many_requests(render(request, 'housing/register.html', {
+                'error': f'Too many sign-ups from your network. Try again in {decision.retry_after} seconds.'}),
+                decision)
         # Simple manual validation for speed, ideal world use forms.py
         data = request.POST
         password = data.get('password')
@@ -125,13 +219,23 @@ def login_view(request):
         data = request.POST
         username = data.get('username')
         password = data.get('password')
-        
+
+        # Refuse before hashing: per client, and per account once it has had too many wrong passwords.
+        decision = throttle.hit('login', ip=throttle.client_ip(request))
+        if decision.allowed:
+            decision = throttle.peek('login_failures', account=username)
+        if not decision.allowed:
+            return throttle.too_many_requests(render(request, 'housing/login.html', {
+                'error': f'Too many sign-in attempts. Try again in {decision.retry_after} seconds.'}),
+                decision)
+
         user = authenticate(request, username=username, password=password)
         
         if user is not None:
             login(request, user)
             return redirect('index')
         else:
+            throttle.hit('login_failures', account=username)
             # Check if user exists but is inactive
             user_exists = User.objects.filter(username=username).first()
             if user_exists and not user_exists.is_active:
@@ -154,6 +258,12 @@ def add_property(request):
         return render(request, 'housing/index.html', {'error': 'You must be a Seller or Agent to add properties.'})
 
     if request.method == 'POST':
+        decision = throttle.hit('listing_write', ip=throttle.client_ip(request), account=request.user.pk)
+        if not decision.allowed:
+            form = PropertyForm(request.POST)
+            form.add_error(None, f'You are adding listings too quickly. Try again in {decision.retry_after} seconds.')
+            return throttle.too_many_requests(
+                render(request, 'housing/add_property.html', {'form': form}), decision)
         form = PropertyForm(request.POST, request.FILES)
         files = request.FILES.getlist('images')
         
@@ -162,7 +272,16 @@ def add_property(request):
                 # Add error to form (non-field error or special)
                 form.add_error(None, 'You can upload a maximum of 15 images.')
                 return render(request, 'housing/add_property.html', {'form': form})
-                
+
+            duplicates = dedup.find_duplicates(
+                form.cleaned_data['title'], form.cleaned_data['description'],
+                form.cleaned_data['location'], files, owner=request.user)
+            if duplicates:
+                existing, reason = duplicates[0]
+                form.add_error(None, f'This looks like a duplicate of your listing "{existing.title}" '
+                                     f'(#{existing.pk}, {reason}). Edit that listing instead.')
+                return render(request, 'housing/add_property.html', {'form': form})
+
             property = form.save(commit=False)
             property.owner = request.user
             property.save()
@@ -180,7 +299,16 @@ def add_property(request):
 
 def property_detail(request, pk):
     property = get_object_or_404(Property, pk=pk)
-    return render(request, 'housing/property_detail.html', {'property': property})
+    if not property.is_listed and property.owner_id != request.user.pk:
+        raise Http404('No Property matches the given query.')
+    if property.owner_id != request.user.pk:
+        counters.views.increment(property.pk)
+    return render(request, 'housing/property_detail.html', {
+        'property': property,
+        'view_count': property.views + counters.views.pending(property.pk),
+        'price_stats': price_stats.describe(property),
+        'similar_properties': similarity.similar_listings(property),
+    })
 
 @login_required
 def set_thumbnail(request, image_id):
@@ -240,20 +368,254 @@ def delete_image(request, image_id):
     return redirect('edit_property', pk=property_id)
 
 
+def _per_agent(queryset, field, aggregate, outer='pk'):
+    """Correlated subquery computing `aggregate` over the outer agent's rows of `queryset`."""
+    rows = queryset.filter(**{field: OuterRef(outer)}).order_by().values(field)
+    return Subquery(rows.annotate(value=aggregate).values('value'))
+
+
 class PropertyViewSet(viewsets.ModelViewSet):
     queryset = Property.objects.all().order_by('-created_at')
     serializer_class = PropertySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [filters.SearchFilter]
     search_fields = ['location', 'title', 'property_type', 'description']
+    throttle_classes = [ListingWriteThrottle]
+
+    def field_selection(self):
+        """(fields, expand) requested with ?fields=a,b and ?expand=owner,images,ratings on reads."""
+        if self.action not in ('list', 'retrieve'):
+            return None, ()
+        params = self.request.query_params
+        fields = {name for name in params.get('fields', '').split(',') if name}
+        expand = {name for name in params.get('expand', '').split(',') if name}
+        unknown = expand - set(PropertySerializer.EXPANSIONS)
+        if unknown:
+            raise ValidationError({'expand': [
+                f"Unknown expansion {', '.join(sorted(unknown))}; "
+                f"choose from {', '.join(PropertySerializer.EXPANSIONS)}."]})
+        return fields or None, expand
+
+    def get_queryset(self):
+        visible = Q(is_listed=True)
+        if self.request.user.is_authenticated:
+            visible |= Q(owner=self.request.user)
+        queryset = super().get_queryset().filter(visible)
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+
+        # Fetch exactly what the requested fields and expansions will read.
+        fields, expand = self.field_selection()
+        wanted = (fields or {'owner_name', 'thumbnail'}) | expand
+        if {'owner', 'owner_name'} & wanted:
+            queryset = queryset.select_related('owner')
+        if {'images', 'thumbnail'} & wanted:
+            queryset = queryset.prefetch_related(
+                Prefetch('images', queryset=PropertyImage.objects.order_by('pk')))
+        if 'ratings' in expand:
+            queryset = queryset.annotate(
+                owner_avg_rating=_per_agent(AgentRating.objects, 'agent', Avg('score'), outer='owner'),
+                owner_rating_count=Coalesce(
+                    _per_agent(AgentRating.objects, 'agent', Count('id'), outer='owner'), 0),
+            )
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.field_selection()
+        return super().get_serializer(*args, fields=fields, expand=expand, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        """
+        With ?limit= (and optionally offset, listing_type, property_type, location,
+        min_price, max_price, ordering) the page is selected from the catalog
+        snapshot and only its rows are loaded. Searches, unpaged lists and owners
+        with de-listed properties go through the database as before.
+        """
+        params = request.query_params
+        if 'limit' not in params or params.get('search') or (
+                request.user.is_authenticated
+                and Property.objects.filter(owner=request.user, is_listed=False).exists()):
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = min(max(int(params['limit']), 1), 100)
+            offset = max(int(params.get('offset', 0)), 0)
+            filters = catalog.filters_from(params)
+        except ValueError as error:
+            raise ValidationError({'detail': str(error)})
+        ids, total = catalog.page(offset, limit, **filters)
+        serializer = self.get_serializer(catalog.hydrate(ids, self.get_queryset()), many=True)
+        url = request.build_absolute_uri()
+        return Response({
+            'count': total,
+            'next': replace_query_param(url, 'offset', offset + limit) if offset + limit < total else None,
+            'previous': replace_query_param(url, 'offset', max(offset - limit, 0)) if offset else None,
+            'results': serializer.data,
+        })
 
     def perform_create(self, serializer):
+        data = serializer.validated_data
+        duplicates = dedup.find_duplicates(
+            data.get('title', ''), data.get('description', ''), data.get('location', ''),
+            owner=self.request.user)
+        if duplicates:
+            existing, reason = duplicates[0]
+            raise ValidationError({'non_field_errors': [
+                f'Duplicate of listing {existing.pk} ({reason}).']})
         serializer.save(owner=self.request.user)
 
+    @action(detail=True, url_path='price-stats', url_name='price-stats')
+    def price_statistics(self, request, pk=None):
+        return Response(price_stats.describe(self.get_object()))
+
+    @action(detail=True, url_path='daily-views', url_name='daily-views',
+            permission_classes=[permissions.IsAuthenticated])
+    def daily_views(self, request, pk=None):
+        property = self.get_object()
+        if property.owner_id != request.user.pk:
+            raise PermissionDenied('Only the owner can see view statistics.')
+        try:
+            days = min(max(int(request.query_params.get('days', 30)), 1), 365)
+        except ValueError:
+            days = 30
+        return Response([{'day': day, 'views': n}
+                         for day, n in counters.daily_views(days, property=property)])
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def conversation_messages(request, username):
+    """
+    The conversation with `username`, newest first, CHAT_PAGE_SIZE messages a
+    page. `next` pages back through older messages, archived ones included.
+    """
+    other = get_object_or_404(User, username=username)
+    try:
+        before = chat.decode_cursor(request.query_params['before']) if request.query_params.get('before') else None
+    except ValueError:
+        raise ValidationError({'before': 'Not a valid cursor.'})
+    limit = settings.CHAT_PAGE_SIZE
+    page = chat.history(conversation_key(request.user.pk, other.pk), before, limit + 1)
+    next_url = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_url = replace_query_param(request.build_absolute_uri(), 'before', chat.encode_cursor(page[-1]))
+    return Response({'next': next_url, 'results': ChatMessageSerializer(page, many=True).data})
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def mortgage_quote(request):
+    """
+    Monthly payments (and optionally full amortization schedules) for a batch
+    of prices or listings under one or more rate/deposit/term scenarios.
+    """
+    serializer = MortgageQuoteSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+
+    loans = [{'price': float(price)} for price in data.get('prices', [])]
+    if data.get('property_ids'):
+        listed = dict(Property.objects.filter(id__in=data['property_ids'], is_listed=True)
+                      .values_list('id', 'price'))
+        loans += [{'property_id': pk, 'price': float(listed[pk])}
+                  for pk in data['property_ids'] if pk in listed]
+
+    scenarios = [Scenario(**s) for s in data['scenarios']]
+    prices = [loan['price'] for loan in loans]
+    payments = monthly_payments(prices, scenarios).round(2)
+    for i, loan in enumerate(loans):
+        loan['monthly_payments'] = payments[:, i].tolist()
+        loan['total_interest'] = [
+            round(payments[j, i] * s.months - (loan['price'] * (1 - s.deposit_percent / 100)), 2)
+            for j, s in enumerate(scenarios)
+        ]
+
+    if data['schedule']:
+        for loan in loans:
+            loan['schedules'] = []
+        for scenario in scenarios:
+            schedule = amortization_schedules(prices, scenario)
+            columns = {key: values.round(2).tolist() for key, values in schedule.items()}
+            for i, loan in enumerate(loans):
+                loan['schedules'].append([
+                    {'month': month, 'payment': payment, 'interest': interest,
+                     'principal': principal, 'balance': balance}
+                    for month, payment, interest, principal, balance in zip(
+                        range(1, scenario.months + 1), columns['payment'][i],
+                        columns['interest'][i], columns['principal'][i], columns['balance'][i])
+                ])
+
+    return Response({
+        'scenarios': [s._asdict() for s in scenarios],
+        'results': loans,
+    })
+
+@require_GET
+def location_autocomplete(request):
+    """Location suggestions for the search box, served from the in-process prefix index."""
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    response = JsonResponse({'results': autocomplete.suggest(request.GET.get('q', ''), limit)})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+@require_http_methods(['GET', 'HEAD'])
+def serve_media(request, path):
+    """Uploaded media with ETags, byte ranges, precompressed variants and long-lived caching."""
+    headers = {key: request.headers.get(key)
+               for key in ('accept-encoding', 'if-none-match', 'if-range', 'range')}
+    plan = mediafiles.plan(settings.MEDIA_ROOT, path, headers, max_age=settings.MEDIA_MAX_AGE)
+    if plan.status == 404:
+        raise Http404(path)
+    if plan.path is None or request.method == 'HEAD':
+        response = HttpResponse(status=plan.status)
+    else:
+        response = FileResponse(mediafiles.RangeFile(plan.path, plan.offset, plan.length), status=plan.status)
+    for header, value in plan.headers.items():
+        response[header] = value
+    return response
+
+@require_GET
+def metrics_view(request):
+    """Prometheus metrics summed over every worker; only for METRICS_ALLOWED_IPS or METRICS_TOKEN."""
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    allowed = throttle.client_ip(request) in settings.METRICS_ALLOWED_IPS or (
+        settings.METRICS_TOKEN and hmac.compare_digest(token, settings.METRICS_TOKEN))
+    if not allowed or not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(metrics().collect(), content_type=METRICS_CONTENT_TYPE)
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny] # Allow registration
+
+
+@method_decorator(cache_page(settings.AGENT_DIRECTORY_CACHE_SECONDS), name='dispatch')
+class AgentViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Public agent directory. Each page is one query: ratings and active
+    listings are correlated subqueries on indexed foreign keys, so there is
+    no join fan-out and no COUNT(*) (see PeekPageNumberPagination). Responses
+    are anonymous and cached per URL, i.e. per page.
+    """
+    serializer_class = AgentSerializer
+    pagination_class = PeekPageNumberPagination
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get_queryset(self):
+        queryset = User.objects.filter(user_type__in=agent_stats.AGENT_TYPES, is_active=True).annotate(
+            avg_rating=_per_agent(AgentRating.objects, 'agent', Avg('score')),
+            rating_count=Coalesce(_per_agent(AgentRating.objects, 'agent', Count('id')), 0),
+            active_listings=Coalesce(_per_agent(Property.objects.filter(is_listed=True), 'owner', Count('id')), 0),
+        )
+        user_type = self.request.query_params.get('type')
+        if user_type:
+            queryset = queryset.filter(user_type=user_type)
+        return queryset.order_by(F('avg_rating').desc(nulls_last=True), '-rating_count', 'pk')
+
+
 @login_required
 def edit_profile(request):
     if request.method == 'POST':
@@ -266,13 +628,21 @@ def edit_profile(request):
         form = UserProfileForm(instance=request.user)
     return render(request, 'housing/edit_profile.html', {'form': form})
 
+@login_required
+def agent_dashboard(request):
+    if request.user.user_type not in agent_stats.AGENT_TYPES:
+        return redirect('index')
+    return render(request, 'housing/agent_dashboard.html', agent_stats.dashboard(request.user))
+
 def agent_profile(request, username):
     agent = get_object_or_404(User, username=username)
     # Annotate with avg rating
     agent_annotated = User.objects.filter(pk=agent.pk).annotate(
         avg_rating=Avg('received_ratings__score')
     ).first()
-    properties = Property.objects.filter(owner=agent)
+    properties = Property.objects.filter(owner=agent).prefetch_related('images')
+    if agent != request.user:
+        properties = properties.filter(is_listed=True)
     return render(request, 'housing/agent_profile.html', {
         'agent': agent_annotated or agent,
         'properties': properties
@@ -296,43 +666,64 @@ def chat_view(request, username):
     else:
         form = ChatForm()
     
-    messages_list = ChatMessage.objects.filter(
-        (Q(sender=request.user) & Q(receiver=receiver)) |
-        (Q(sender=receiver) & Q(receiver=request.user))
-    ).order_by('timestamp')
-    
+    try:
+        before = chat.decode_cursor(request.GET['before']) if request.GET.get('before') else None
+    except ValueError:
+        before = None
+    limit = settings.CHAT_PAGE_SIZE
+    page = chat.history(conversation_key(request.user.pk, receiver.pk), before, limit + 1)
+    older = chat.encode_cursor(page[limit - 1]) if len(page) > limit else None
+
     # Mark messages as read
     ChatMessage.objects.filter(sender=receiver, receiver=request.user, is_read=False).update(is_read=True)
     
     return render(request, 'housing/chat.html', {
         'receiver': receiver,
-        'messages_list': messages_list,
+        'messages_list': page[:limit][::-1],
+        'older': older,
         'form': form
     })
 
 @login_required
 def inbox(request):
-    # Get all users the current user has chatted with
-    sent_to = ChatMessage.objects.filter(sender=request.user).values_list('receiver', flat=True)
-    received_from = ChatMessage.objects.filter(receiver=request.user).values_list('sender', flat=True)
-    
-    chat_user_ids = set(list(sent_to) + list(received_from))
-    chat_users = User.objects.filter(id__in=chat_user_ids)
-    
+    # The newest message of every conversation the user is in, and unread counts per sender
+    mine = ChatMessage.objects.filter(Q(sender=request.user) | Q(receiver=request.user))
+    latest = mine.values('conversation').annotate(last=Max('pk')).values('last')
+    last_messages = ChatMessage.objects.filter(pk__in=latest).select_related('sender', 'receiver').order_by('-timestamp')
+    unread = dict(ChatMessage.objects.filter(receiver=request.user, is_read=False)
+                  .values('sender').annotate(n=Count('pk')).values_list('sender', 'n'))
+
     conversations = []
-    for user in chat_users:
-        last_message = ChatMessage.objects.filter(
-            (Q(sender=request.user) & Q(receiver=user)) |
-            (Q(sender=user) & Q(receiver=request.user))
-        ).last()
-        unread_count = ChatMessage.objects.filter(sender=user, receiver=request.user, is_read=False).count()
+    for message in last_messages:
+        user = message.receiver if message.sender_id == request.user.pk else message.sender
         conversations.append({
             'user': user,
-            'last_message': last_message,
-            'unread_count': unread_count
+            'last_message': message,
+            'unread_count': unread.get(user.pk, 0)
         })
     
-    # Sort by last message timestamp
-    conversations.sort(key=lambda x: x['last_message'].timestamp if x['last_message'] else 0, reverse=True)
-    
     return render(request, 'housing/inbox.html', {'conversations': conversations})
+
+@login_required
+def saved_searches(request):
+    if request.method == 'POST':
+        form = SavedSearchForm(request.POST)
+        if form.is_valid():
+            search = form.save(commit=False)
+            search.user = request.user
+            search.save()
+            messages.success(request, "Search saved. We'll email you when new listings match it.")
+            return redirect('saved_searches')
+    else:
+        form = SavedSearchForm(initial={
+            'listing_type': request.GET.get('listing_type', ''),
+            'location': request.GET.get('location', ''),
+        })
+    searches = request.user.saved_searches.order_by('-created_at')
+    return render(request, 'housing/saved_searches.html', {'form': form, 'searches': searches})
+
+@login_required
+@require_POST
+def delete_saved_search(request, pk):
+    get_object_or_404(SavedSearch, pk=pk, user=request.user).delete()
+    return redirect('saved_searches')
@@ -11,11 +11,20 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import atexit
 import os
+import shutil
+import sys
+import tempfile
+
+from housing import ratelimit
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# `manage.py test` runs with the test-only overrides marked below.
+TESTING = sys.argv[1:2] == ['test']
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -52,12 +61,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'housing.middleware.SQLInstrumentationMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'housing.middleware.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'housing.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,13 +97,52 @@ WSGI_APPLICATION = 'rwanda_housing.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Connections are kept open between requests (CONN_MAX_AGE) and health-checked
+# before reuse. SQLite connections run in WAL mode so readers never block the
+# single writer, and wait on a busy database instead of failing immediately.
+CONN_MAX_AGE = int(os.environ.get('CONN_MAX_AGE', '60'))
+
+SQLITE_INIT_COMMAND = (
+    'PRAGMA journal_mode=WAL;'
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA temp_store=MEMORY;'
+    'PRAGMA cache_size=-20000;'
+    'PRAGMA mmap_size=134217728;'
+)
+
+
+def sqlite_database(name, **extra):
+    return {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,  # busy_timeout, in seconds
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': SQLITE_INIT_COMMAND,
+        },
+        **extra,
     }
+
+
+DATABASES = {
+    'default': sqlite_database(os.environ.get('DATABASE_PATH', BASE_DIR / 'db.sqlite3')),
 }
 
+# Read replicas, e.g. DATABASE_REPLICAS=/var/data/replica1.sqlite3,/var/data/replica2.sqlite3
+# Each becomes a `replica_<n>` alias; tests mirror them onto the primary.
+for index, replica_path in enumerate(
+        filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica_{index}'] = sqlite_database(
+        replica_path.strip(), TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['housing.db_router.PrimaryReplicaRouter']
+
+# After a user writes, their reads stay on the primary for this many seconds so
+# they always see their own changes despite replication lag.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '5'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -136,6 +187,93 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are saved under content-hashed names and served by housing.views.serve_media
+# (ranges, ETags, precompressed variants). Hashed URLs are cached as immutable; older
+# unhashed files for MEDIA_MAX_AGE seconds. Turn SERVE_MEDIA off when a front-end
+# server or CDN serves MEDIA_ROOT directly.
+STORAGES = {
+    'default': {'BACKEND': 'housing.storage.HashedMediaStorage'},
+    # STATICFILES_STORAGE above is ignored since Django 5.1; this keeps the storage
+    # that has actually been in effect.
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+SERVE_MEDIA = os.environ.get('SERVE_MEDIA', 'True') == 'True'
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', '3600'))
+
+# Local state of derived indexes (e.g. housing.similarity), rebuilt by management commands.
+VAR_DIR = Path(os.environ.get('VAR_DIR', BASE_DIR / 'var'))
+if TESTING:
+    # Snapshots, indexes, metrics, rate-limit buckets and profiles of a test run stay out of var/.
+    VAR_DIR = Path(tempfile.mkdtemp(prefix='rwanda-housing-tests-'))
+    atexit.register(shutil.rmtree, VAR_DIR, ignore_errors=True)
+SIMILARITY_INDEX_DIR = VAR_DIR / 'similarity'
+# Listing changes appended to the similarity index's delta log before it is folded into the base files.
+SIMILARITY_DELTA_MAX_RECORDS = 1000
+
+# housing.background runs deferred work (e.g. duplicate-detection fingerprints) on one
+# thread per process; tests run it inline.
+BACKGROUND_TASKS_INLINE = TESTING
+
+# Token-bucket rate limits (housing.throttle), as 'capacity/seconds' per IP and per account.
+# Bucket state is shared by every worker through a local SQLite file.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True') == 'True'
+RATE_LIMIT_STORE = Path(os.environ.get('RATE_LIMIT_STORE', VAR_DIR / 'ratelimit.sqlite3'))
+# Number of reverse proxies in front of the app whose X-Forwarded-For entries we trust.
+RATE_LIMIT_PROXY_COUNT = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', '0'))
+# Shared with the FastAPI backend; see housing.ratelimit.
+RATE_LIMITS = ratelimit.LIMITS
+
+# Buffered property view counters (housing.counters): flush at least this often,
+# or sooner once this many listings have unflushed views.
+VIEW_COUNTER_FLUSH_INTERVAL = float(os.environ.get('VIEW_COUNTER_FLUSH_INTERVAL', '10'))
+VIEW_COUNTER_MAX_PENDING = 1000
+
+# Columnar snapshot of listed properties (housing.catalog) behind the buy/rent pages
+# and the paged properties API. With CATALOG_SNAPSHOT_SHARED, snapshots are written to
+# CATALOG_SNAPSHOT_DIR and memory-mapped, so all workers on a host share one copy.
+CATALOG_SNAPSHOT_ENABLED = os.environ.get('CATALOG_SNAPSHOT_ENABLED', 'True') == 'True'
+CATALOG_SNAPSHOT_SHARED = os.environ.get('CATALOG_SNAPSHOT_SHARED', 'False') == 'True'
+CATALOG_SNAPSHOT_DIR = VAR_DIR / 'catalog'
+
+# Shared by every worker: set REDIS_URL when the site runs on more than one host
+# (needs the redis package), otherwise entries are files under VAR_DIR/cache.
+# Tests get a private in-memory cache.
+if TESTING:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+elif os.environ.get('REDIS_URL'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }}
+else:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': VAR_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }}
+
+# Sessions and authenticated users are read from the cache (housing.auth_cache), so
+# resolving request.user costs no query; both fall back to the database on a miss.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# ModelBackend still resolves sessions created before the cached backend existed.
+AUTHENTICATION_BACKENDS = ['housing.auth_cache.CachedModelBackend', 'django.contrib.auth.backends.ModelBackend']
+AUTH_USER_CACHE_SECONDS = int(os.environ.get('AUTH_USER_CACHE_SECONDS', '300'))
+
+# Chat (housing.chat): messages shown per page, and read messages older than
+# CHAT_ARCHIVE_AFTER_DAYS moved by `manage.py archive_chat_messages` into compressed
+# ChatArchive rows, CHAT_ARCHIVE_BATCH_SIZE per transaction and at most
+# CHAT_ARCHIVE_CHUNK_SIZE messages per row.
+CHAT_PAGE_SIZE = 50
+CHAT_ARCHIVE_AFTER_DAYS = int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', '180'))
+CHAT_ARCHIVE_BATCH_SIZE = 500
+CHAT_ARCHIVE_CHUNK_SIZE = 1000
+
+# Seconds each page of the public agent directory API (/api/agents/) is cached.
+AGENT_DIRECTORY_CACHE_SECONDS = int(os.environ.get('AGENT_DIRECTORY_CACHE_SECONDS', '60'))
+
+# Seconds before a process rebuilds its location autocomplete index (housing.autocomplete).
+LOCATION_INDEX_MAX_AGE = int(os.environ.get('LOCATION_INDEX_MAX_AGE', '300'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -143,7 +281,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'housing.auth_cache.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -156,5 +294,52 @@ CORS_ALLOW_ALL_ORIGINS = True
 AUTH_USER_MODEL = 'housing.User'
 
 # Email Settings
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# Views only enqueue mail (housing.mail.QueuedEmailBackend); the
+# `send_queued_mail` worker delivers it through EMAIL_DELIVERY_BACKEND.
+# For local testing, django.core.mail.backends.filebased.EmailBackend writes
+# every delivered message into EMAIL_FILE_PATH.
+EMAIL_BACKEND = 'housing.mail.QueuedEmailBackend'
+EMAIL_DELIVERY_BACKEND = os.environ.get(
+    'EMAIL_DELIVERY_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', BASE_DIR / 'sent_emails')
 DEFAULT_FROM_EMAIL = 'no-reply@rwandahousing.com'
+
+MAIL_QUEUE_BATCH_SIZE = 100
+MAIL_QUEUE_MAX_ATTEMPTS = 8
+MAIL_QUEUE_BASE_BACKOFF = 30  # seconds; doubles on every failed attempt
+MAIL_QUEUE_MAX_BACKOFF = 3600
+
+# Per-request SQL instrumentation (housing.middleware.SQLInstrumentationMiddleware).
+# Requests taking SQL_SLOW_REQUEST_MS or longer are logged at WARNING; set
+# SQL_LOG_LEVEL=INFO to log every request.
+SQL_SLOWEST_STATEMENTS = 3
+SQL_SLOW_REQUEST_MS = float(os.environ.get('SQL_SLOW_REQUEST_MS', '1000'))
+
+# Staff can profile one request with ?_profile=1 (cProfile) or ?_profile=sample
+# (housing.profiling); the artifacts are written to PROFILE_DIR.
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', VAR_DIR / 'profiles'))
+PROFILE_SAMPLE_INTERVAL = 0.001  # seconds
+
+# Prometheus metrics (housing.metrics), served at /metrics/ to METRICS_ALLOWED_IPS or
+# to requests bearing METRICS_TOKEN. Each worker writes its totals to METRICS_DIR every
+# METRICS_FLUSH_INTERVAL seconds and a scrape sums them.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = Path(os.environ.get('METRICS_DIR', VAR_DIR / 'metrics' / 'django'))
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'housing.sql': {
+            'handlers': ['console'],
+            'level': 'ERROR' if TESTING else os.environ.get('SQL_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,337 @@
+"""
+Load benchmark for the Django site and the FastAPI backend.
+
+Runs every route of housing/urls.py (or api/app.py) against a running server
+with a pool of concurrent clients and reports throughput, p50/p95/p99 latency
+and SQL queries per request (read from the Server-Timing header). Public routes
+are requested by a mix of anonymous and logged-in clients; chat, rating and
+upload routes always run authenticated.
+
+Seed the target database first (`python scripts/setup_data.py`), start the
+server, then for example:
+
+    python scripts/benchmark.py --base-url http://127.0.0.1:8000 --concurrency 16
+    python scripts/benchmark.py --backend fastapi --base-url http://127.0.0.1:8001
+    python scripts/benchmark.py --save-baseline bench/django.json
+    python scripts/benchmark.py --baseline bench/django.json --tolerance 0.15
+
+Write routes (add_property, chat, rate_agent, uploads) create rows in the
+target database. Destructive routes (delete_image, set_thumbnail, logout,
+activation and password reset confirmation) are not exercised.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import requests
+
+# 1x1 transparent PNG used for upload routes.
+PNG_PIXEL = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+@dataclass
+class Route:
+    name: str
+    path: str
+    method: str = 'GET'
+    auth: bool = False
+    data: dict = None
+    upload: str = None  # multipart field name holding the PNG
+
+
+DJANGO_ROUTES = [
+    Route('index', '/'),
+    Route('buy_properties', '/buy/'),
+    Route('rent_properties', '/rent/'),
+    Route('agent_list', '/agents/'),
+    Route('sell_landing', '/sell/'),
+    Route('tools_landing', '/tools/'),
+    Route('register', '/register/'),
+    Route('login', '/login/'),
+    Route('property_detail', '/property/{property_id}/'),
+    Route('agent_profile', '/profile/@{agent}/'),
+    Route('password_reset', '/password-reset/'),
+    Route('property-list', '/api/properties/'),
+    Route('property-detail', '/api/properties/{property_id}/'),
+    Route('user-list', '/api/users/'),
+    Route('add_property', '/add-property/', auth=True),
+    Route('edit_profile', '/profile/edit/', auth=True),
+    Route('inbox', '/inbox/', auth=True),
+    Route('chat_view', '/chat/@{peer}/', auth=True),
+    Route('chat_view (post)', '/chat/@{peer}/', 'POST', auth=True,
+          data={'message': 'Is this still available?'}),
+    Route('rate_agent', '/rate-agent/{agent_id}/', 'POST', auth=True,
+          data={'score': '4', 'comment': 'Benchmark rating'}),
+    Route('add_property (upload)', '/add-property/', 'POST', auth=True, upload='images',
+          data={'title': 'Benchmark listing', 'listing_type': 'sale', 'property_type': 'house',
+                'location': 'Kigali, Kimihurura', 'price': '85000000',
+                'description': 'Created by scripts/benchmark.py'}),
+]
+
+FASTAPI_ROUTES = [
+    Route('root', '/'),
+    Route('list_properties', '/api/properties'),
+    Route('get_property', '/api/properties/{property_id}'),
+    Route('list_users', '/api/users'),
+    Route('login', '/api/login', 'POST', data={'username': '{username}', 'password': '{password}'}),
+    Route('create_property', '/api/properties', 'POST', auth=True,
+          data={'title': 'Benchmark listing', 'location': 'Kigali, Kimihurura', 'price': 85000000,
+                'property_type': 'house', 'listing_type': 'sale',
+                'description': 'Created by scripts/benchmark.py'}),
+    Route('upload_property_image', '/api/properties/{property_id}/upload-image', 'POST',
+          auth=True, upload='file'),
+]
+
+
+@dataclass
+class RouteResult:
+    name: str
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    errors: int = 0
+    wall: float = 0.0
+
+    def summary(self):
+        ordered = sorted(self.latencies)
+        return {
+            'requests': len(self.latencies) + self.errors,
+            'errors': self.errors,
+            'throughput': round(len(self.latencies) / self.wall, 2) if self.wall else 0.0,
+            'p50_ms': percentile(ordered, 50),
+            'p95_ms': percentile(ordered, 95),
+            'p99_ms': percentile(ordered, 99),
+            'queries': round(sum(self.queries) / len(self.queries), 2) if self.queries else None,
+        }
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return None
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return round(ordered[rank] * 1000, 2)
+
+
+class Clients:
+    """Thread-local anonymous and authenticated HTTP sessions."""
+
+    def __init__(self, args):
+        self.args = args
+        self.local = threading.local()
+
+    def anonymous(self):
+        if not hasattr(self.local, 'anonymous'):
+            self.local.anonymous = requests.Session()
+        return self.local.anonymous
+
+    def authenticated(self):
+        if not hasattr(self.local, 'authenticated'):
+            session = requests.Session()
+            if self.args.backend == 'django':
+                self._django_login(session)
+            else:
+                self._fastapi_login(session)
+            self.local.authenticated = session
+        return self.local.authenticated
+
+    def _django_login(self, session):
+        url = self.args.base_url + '/login/'
+        session.get(url)
+        response = session.post(url, data={
+            'username': self.args.username,
+            'password': self.args.password,
+            'csrfmiddlewaretoken': session.cookies.get('csrftoken', ''),
+        }, allow_redirects=False)
+        if response.status_code != 302:
+            sys.exit(f'Login as {self.args.username!r} failed; seed the database first.')
+
+    def _fastapi_login(self, session):
+        # Each client thread registers its own user so token issuance is part of warm-up.
+        response = session.post(self.args.base_url + '/api/register', params={
+            'username': f'bench_{uuid.uuid4().hex[:12]}',
+            'password': self.args.password,
+        })
+        response.raise_for_status()
+        session.headers['Authorization'] = f"Bearer {response.json()['access_token']}"
+
+
+def discover_context(args):
+    """Find ids and usernames of seeded rows to fill in route paths."""
+    api = args.base_url + ('/api/properties/' if args.backend == 'django' else '/api/properties')
+    properties = requests.get(api).json()
+    properties = properties.get('results', properties) if isinstance(properties, dict) else properties
+    if not properties:
+        sys.exit('No properties found; seed the database first.')
+    users_url = args.base_url + ('/api/users/' if args.backend == 'django' else '/api/users')
+    users = requests.get(users_url).json()
+    users = users.get('results', users) if isinstance(users, dict) else users
+    agents = [u for u in users if u.get('user_type') == 'agent'] or users
+    peers = [u for u in users if u['username'] != args.username] or users
+    return {
+        'property_id': properties[0]['id'],
+        'agent': agents[0]['username'],
+        'agent_id': agents[0]['id'],
+        'peer': peers[0]['username'],
+        'username': args.username,
+        'password': args.password,
+    }
+
+
+def fill(value, context):
+    if isinstance(value, str):
+        return value.format(**context)
+    if isinstance(value, dict):
+        return {key: fill(item, context) for key, item in value.items()}
+    return value
+
+
+def send(clients, route, context, args, rng):
+    authenticated = route.auth or rng.random() < args.auth_ratio
+    session = clients.authenticated() if authenticated else clients.anonymous()
+    url = args.base_url + fill(route.path, context)
+    data = fill(route.data, context)
+    kwargs = {'allow_redirects': False, 'timeout': args.timeout}
+    if route.method == 'POST':
+        if args.backend == 'django':
+            data = dict(data or {}, csrfmiddlewaretoken=session.cookies.get('csrftoken', ''))
+            kwargs['data'] = data
+        elif route.upload is None and route.auth:
+            kwargs['json'] = data
+        else:
+            kwargs['params'] = data
+        if route.upload:
+            kwargs['files'] = {route.upload: ('bench.png', PNG_PIXEL, 'image/png')}
+
+    start = time.perf_counter()
+    response = session.request(route.method, url, **kwargs)
+    elapsed = time.perf_counter() - start
+    match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+    return elapsed, response.status_code < 400, int(match.group(1)) if match else None
+
+
+def warm_up(pool, clients, concurrency):
+    """Open every worker's sessions (and log in) before anything is measured."""
+    barrier = threading.Barrier(concurrency)
+
+    def open_sessions(_):
+        clients.anonymous()
+        clients.authenticated()
+        barrier.wait()
+
+    list(pool.map(open_sessions, range(concurrency)))
+
+
+def run_route(pool, clients, route, context, args):
+    result = RouteResult(route.name)
+    rngs = [random.Random(f'{args.seed}:{route.name}:{i}') for i in range(args.requests)]
+    start = time.perf_counter()
+    outcomes = list(pool.map(lambda rng: send(clients, route, context, args, rng), rngs))
+    result.wall = time.perf_counter() - start
+    for elapsed, ok, queries in outcomes:
+        if not ok:
+            result.errors += 1
+            continue
+        result.latencies.append(elapsed)
+        if queries is not None:
+            result.queries.append(queries)
+    return result
+
+
+def compare(current, baseline, tolerance):
+    """Return (route, metric, baseline, current) for every regression beyond tolerance."""
+    regressions = []
+    for name, stats in current.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for metric in ('p95_ms', 'p99_ms'):
+            if before[metric] and stats[metric] and stats[metric] > before[metric] * (1 + tolerance):
+                regressions.append((name, metric, before[metric], stats[metric]))
+        if before['throughput'] and stats['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append((name, 'throughput', before['throughput'], stats['throughput']))
+        if before['queries'] is not None and stats['queries'] is not None \
+                and stats['queries'] > before['queries']:
+            regressions.append((name, 'queries', before['queries'], stats['queries']))
+    return regressions
+
+
+def print_report(results):
+    header = f"{'route':<26}{'req':>6}{'err':>5}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'sql':>7}"
+    print(header)
+    print('-' * len(header))
+    for name, s in results.items():
+        print(f"{name:<26}{s['requests']:>6}{s['errors']:>5}{s['throughput']:>9}"
+              f"{s['p50_ms'] or '-':>9}{s['p95_ms'] or '-':>9}{s['p99_ms'] or '-':>9}"
+              f"{s['queries'] if s['queries'] is not None else '-':>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backend', choices=['django', 'fastapi'], default='django')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--auth-ratio', type=float, default=0.3,
+                        help='share of public-route requests sent by logged-in clients')
+    parser.add_argument('--username', default='agent_john')
+    parser.add_argument('--password', default='password123')
+    parser.add_argument('--routes', help='comma-separated route names to run (default: all)')
+    parser.add_argument('--seed', default='rwanda-housing')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    parser.add_argument('--save-baseline', help='store the results as the new baseline')
+    parser.add_argument('--baseline', help='compare against a stored baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    args = parser.parse_args(argv)
+    args.base_url = args.base_url.rstrip('/')
+
+    routes = DJANGO_ROUTES if args.backend == 'django' else FASTAPI_ROUTES
+    if args.routes:
+        wanted = set(args.routes.split(','))
+        routes = [route for route in routes if route.name in wanted]
+
+    context = discover_context(args)
+    clients = Clients(args)
+    results = {}
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        warm_up(pool, clients, args.concurrency)
+        for route in routes:
+            results[route.name] = run_route(pool, clients, route, context, args).summary()
+    print_report(results)
+
+    document = {
+        'backend': args.backend,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'auth_ratio': args.auth_ratio,
+        'routes': results,
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['routes']
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, before, after in regressions:
+            print(f'REGRESSION {name} {metric}: {before} -> {after}')
+        if regressions:
+            return 1
+        print(f'No regressions beyond {args.tolerance:.0%} against {args.baseline}.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Cold-start benchmark for the serverless FastAPI entry point (api/index.py).
+
+Each run starts a fresh interpreter, the way a new Vercel instance does, and
+measures:
+
+- import:          `import api.index`
+- startup:         the application's startup handlers (schema check)
+- first_response:  import + startup + one GET through the ASGI app
+- process:         wall time of the whole interpreter, as seen by this script
+
+The first run against a new database also creates the schema; later runs only
+check its version, which is the steady state on a warm database.
+
+    python scripts/cold_start.py --runs 15
+    python scripts/cold_start.py --budget-import-ms 600 --budget-first-response-ms 900
+    python scripts/cold_start.py --importtime     # slowest imports of one run
+
+Exits with status 1 when a median exceeds its budget.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PROBE = r'''
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import api.index
+t1 = time.perf_counter()
+app = api.index.app
+
+async def main():
+    await app.router.startup()
+    t2 = time.perf_counter()
+    messages, delivered = [], False
+    path = sys.argv[1]
+
+    async def receive():
+        nonlocal delivered
+        if not delivered:
+            delivered = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [(b'host', b'localhost')],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }, receive, send)
+    t3 = time.perf_counter()
+    print(json.dumps({
+        'status': messages[0]['status'],
+        'import_ms': (t1 - t0) * 1000,
+        'startup_ms': (t2 - t1) * 1000,
+        'first_response_ms': (t3 - t0) * 1000,
+    }))
+
+asyncio.run(main())
+'''
+
+METRICS = ('import_ms', 'startup_ms', 'first_response_ms', 'process_ms')
+
+
+def run_once(path, env):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', PROBE, path], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample['process_ms'] = (time.perf_counter() - start) * 1000
+    return sample
+
+
+def slowest_imports(env, limit=20):
+    """Modules imported directly by api.index/api.app (or at top level), by cumulative time."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import api.index'],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 2:
+            rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return [{'module': name, 'cumulative_ms': c / 1000, 'self_ms': s / 1000}
+            for c, s, name in sorted(rows, reverse=True)[:limit]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/api/properties', help='route for the first request')
+    parser.add_argument('--database-url', help='default: a fresh SQLite file per benchmark')
+    parser.add_argument('--budget-import-ms', type=float)
+    parser.add_argument('--budget-first-response-ms', type=float)
+    parser.add_argument('--importtime', action='store_true', help='also list the slowest imports')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        env = dict(os.environ, PYTHONPATH=str(ROOT), DATABASE_URL=args.database_url or f'sqlite:///{scratch}/cold_start.db',
+                   VAR_DIR=scratch)
+        samples = [run_once(args.path, env) for _ in range(args.runs)]
+        imports = slowest_imports(env) if args.importtime else None
+
+    statuses = {s['status'] for s in samples}
+    report = {
+        'runs': args.runs,
+        'path': args.path,
+        'statuses': sorted(statuses),
+        'first_run': {m: round(samples[0][m], 1) for m in METRICS},
+    }
+    for metric in METRICS:
+        values = sorted(s[metric] for s in samples[1:] or samples)
+        report[metric] = {
+            'median': round(statistics.median(values), 1),
+            'p90': round(values[min(len(values) - 1, int(0.9 * len(values)))], 1),
+            'min': round(values[0], 1),
+        }
+    if imports is not None:
+        report['slowest_imports'] = imports
+
+    print(f"{'metric':<20}{'median':>10}{'p90':>10}{'min':>10}{'first run':>12}")
+    for metric in METRICS:
+        row = report[metric]
+        print(f"{metric:<20}{row['median']:>10.1f}{row['p90']:>10.1f}{row['min']:>10.1f}"
+              f"{report['first_run'][metric]:>12.1f}")
+    for entry in imports or []:
+        print(f"  {entry['cumulative_ms']:>8.1f} ms  {entry['module']}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    failures = []
+    if statuses != {200}:
+        failures.append(f'first request returned {sorted(statuses)}')
+    for metric, budget in (('import_ms', args.budget_import_ms),
+                           ('first_response_ms', args.budget_first_response_ms)):
+        if budget is not None and report[metric]['median'] > budget:
+            failures.append(f"{metric} median {report[metric]['median']:.1f} ms > budget {budget:.0f} ms")
+    for failure in failures:
+        print(f'FAIL: {failure}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""
+Deterministic synthetic data generator for production-scale profiling.
+
+Creates agents and buyers, properties with gallery images, agent ratings and
+chat messages with realistic Rwandan locations and price distributions. The
+same --seed and volumes always produce the same rows: every table is split into
+fixed-size partitions whose contents depend only on (seed, table, partition),
+and partitions are fanned out over worker processes that insert them with
+bulk_create in large batches.
+
+Meant for an empty database (run `python manage.py migrate` first):
+
+    python scripts/generate_data.py                      # full scale
+    python scripts/generate_data.py --scale 0.01         # 1% of every volume
+    python scripts/generate_data.py --properties 5000 --messages 0 --workers 4
+
+All synthetic users share the password given by --password.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rwanda_housing.settings')
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.contrib.auth.hashers import make_password  # noqa: E402
+from django.db import connections, transaction  # noqa: E402
+from django.db.models import Max  # noqa: E402
+
+from housing.models import AgentRating, ChatMessage, Property, PropertyImage, conversation_key  # noqa: E402
+
+User = get_user_model()
+
+USERNAME_PREFIX = 'synth-'
+
+# (district label, sector, listing weight, price multiplier)
+LOCATIONS = [
+    ('Kigali', 'Nyarutarama', 6, 2.3),
+    ('Kigali', 'Kiyovu', 3, 2.0),
+    ('Kigali', 'Kimihurura', 6, 1.8),
+    ('Kigali', 'Kacyiru', 6, 1.5),
+    ('Kigali', 'Kibagabaga', 6, 1.3),
+    ('Kigali', 'Gacuriro', 4, 1.4),
+    ('Kigali', 'Remera', 7, 1.1),
+    ('Kigali', 'Kimironko', 7, 1.0),
+    ('Kigali', 'Kagugu', 5, 0.8),
+    ('Kigali', 'Gisozi', 5, 0.8),
+    ('Kigali', 'Kicukiro', 7, 0.9),
+    ('Kigali', 'Niboye', 4, 0.8),
+    ('Kigali', 'Gikondo', 5, 0.8),
+    ('Kigali', 'Kanombe', 4, 0.75),
+    ('Kigali', 'Gahanga', 4, 0.6),
+    ('Kigali', 'Kanyinya', 3, 0.55),
+    ('Kigali', 'Nyamirambo', 6, 0.7),
+    ('Kigali', 'Muhima', 3, 0.8),
+    ('Musanze', 'Muhoza', 3, 0.6),
+    ('Rubavu', 'Gisenyi', 3, 0.7),
+    ('Huye', 'Ngoma', 2, 0.45),
+    ('Muhanga', 'Nyamabuye', 2, 0.45),
+    ('Rwamagana', 'Kigabiro', 2, 0.45),
+    ('Nyagatare', 'Nyagatare', 1, 0.4),
+    ('Rusizi', 'Kamembe', 1, 0.45),
+    ('Karongi', 'Bwishyura', 1, 0.5),
+]
+LOCATION_WEIGHTS = [weight for _, _, weight, _ in LOCATIONS]
+
+# Median price in RWF before the location multiplier (sale: total, rent: monthly).
+MEDIAN_PRICES = {
+    ('sale', 'house'): 120_000_000,
+    ('sale', 'bungalow'): 90_000_000,
+    ('sale', 'apartment'): 80_000_000,
+    ('sale', 'flat'): 45_000_000,
+    ('rent', 'house'): 900_000,
+    ('rent', 'bungalow'): 700_000,
+    ('rent', 'apartment'): 650_000,
+    ('rent', 'flat'): 300_000,
+}
+PROPERTY_TYPES = ['house', 'apartment', 'flat', 'bungalow']
+PROPERTY_TYPE_WEIGHTS = [45, 25, 20, 10]
+
+FIRST_NAMES = ['Jean', 'Marie', 'Eric', 'Aline', 'Patrick', 'Diane', 'Emmanuel', 'Grace',
+               'Olivier', 'Claudine', 'Innocent', 'Josiane', 'Fabrice', 'Sandrine', 'Yves',
+               'Chantal', 'Didier', 'Ange', 'Thierry', 'Esperance']
+LAST_NAMES = ['Uwimana', 'Mugisha', 'Niyonzima', 'Habimana', 'Mukamana', 'Ndayisaba',
+              'Uwase', 'Nshimiyimana', 'Ingabire', 'Hakizimana', 'Mutoni', 'Iradukunda',
+              'Bizimana', 'Umutoni', 'Nkurunziza', 'Kayitesi']
+FEATURES = ['garden', 'borehole', 'solar water heater', 'city view', 'parking for two cars',
+            'fenced compound', 'servant quarters', 'modern kitchen', 'balcony', 'backup generator',
+            'tarmac road access', 'swimming pool', 'fibre internet', 'walk-in closet']
+MESSAGES = ['Hello, is this property still available?', 'Can I visit this weekend?',
+            'Is the price negotiable?', 'Yes, it is still available.',
+            'Does it come furnished?', 'I can show it to you on Saturday morning.',
+            'How far is it from the main road?', 'Thank you, I will get back to you.']
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+HISTORY_DAYS = 730
+
+# Tables in dependency order; every table in a phase can be filled in parallel.
+PHASES = [('users',), ('properties',), ('images', 'ratings', 'messages')]
+
+
+def partition_rng(seed, table, partition):
+    return random.Random(f'{seed}:{table}:{partition}')
+
+
+def timestamp(rng):
+    return EPOCH + timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+
+
+def price_for(rng, listing_type, property_type, multiplier):
+    median = MEDIAN_PRICES[(listing_type, property_type)] * multiplier
+    price = rng.lognormvariate(math.log(median), 0.35)
+    step = 50_000 if listing_type == 'sale' else 5_000
+    return max(step, round(price / step) * step)
+
+
+def build_users(rng, start, stop, plan):
+    rows = []
+    for index in range(start, stop):
+        is_agent = index < plan['agents']
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        role = 'agent' if is_agent else rng.choice(['buyer', 'buyer', 'renter', 'seller', 'landlord'])
+        username = f'{USERNAME_PREFIX}{role}-{index}'
+        areas = rng.sample(LOCATIONS, 3) if is_agent else []
+        rows.append(User(
+            id=plan['user_offset'] + index,
+            username=username,
+            email=f'{username}@example.rw',
+            password=plan['password_hash'],
+            first_name=first,
+            last_name=last,
+            user_type=role,
+            phone=f'+25078{rng.randrange(10**7):07d}',
+            date_joined=timestamp(rng),
+            locations=', '.join(sector for _, sector, _, _ in areas) or None,
+            houses_sold=rng.randrange(40) if is_agent else 0,
+            houses_rented=rng.randrange(120) if is_agent else 0,
+        ))
+    return rows
+
+
+def build_properties(rng, start, stop, plan):
+    rows = []
+    for index in range(start, stop):
+        district, sector, _, multiplier = rng.choices(LOCATIONS, weights=LOCATION_WEIGHTS)[0]
+        property_type = rng.choices(PROPERTY_TYPES, weights=PROPERTY_TYPE_WEIGHTS)[0]
+        listing_type = 'sale' if rng.random() < 0.6 else 'rent'
+        bedrooms = rng.randint(1, 6)
+        features = ', '.join(rng.sample(FEATURES, 3))
+        rows.append(Property(
+            id=plan['property_offset'] + index,
+            title=f'{bedrooms} bedroom {property_type} in {sector}',
+            location=f'{district}, {sector}',
+            price=price_for(rng, listing_type, property_type, multiplier),
+            property_type=property_type,
+            listing_type=listing_type,
+            description=f'{bedrooms} bedroom {property_type} in {sector} with {features}.',
+            owner_id=plan['user_offset'] + rng.randrange(plan['agents']),
+            created_at=timestamp(rng),
+        ))
+    return rows
+
+
+def build_images(rng, start, stop, plan):
+    # Partitions of this table are ranges of property indexes.
+    rows = []
+    per_property = plan['images_per_property']
+    slots = per_property + 2  # ids are reserved for the largest possible gallery
+    for index in range(start, stop):
+        count = rng.randint(max(1, per_property - 2), slots)
+        thumbnail = rng.randrange(count)
+        property_id = plan['property_offset'] + index
+        for n in range(count):
+            rows.append(PropertyImage(
+                id=plan['image_offset'] + index * slots + n,
+                property_id=property_id,
+                image=f'property_images/synthetic/{property_id}_{n}.jpg',
+                is_thumbnail=(n == thumbnail),
+            ))
+    return rows
+
+
+def build_ratings(rng, start, stop, plan):
+    # Rating i pairs agent (i mod agents) with rater (i div agents), so every
+    # (agent, rater) pair is unique without any coordination between workers.
+    rows = []
+    agents, buyers = plan['agents'], plan['buyers']
+    for index in range(start, stop):
+        rows.append(AgentRating(
+            id=plan['rating_offset'] + index,
+            agent_id=plan['user_offset'] + index % agents,
+            rater_id=plan['user_offset'] + agents + (index // agents) % buyers,
+            score=rng.choices([1, 2, 3, 4, 5], weights=[3, 5, 15, 40, 37])[0],
+            comment=rng.choice([None, 'Very responsive.', 'Helpful with the paperwork.',
+                                'Showed us several options.', 'Slow to reply.']),
+            created_at=timestamp(rng),
+        ))
+    return rows
+
+
+def build_messages(rng, start, stop, plan):
+    # Message i is sent during the i-th of equal slices of the history, so ids
+    # grow with timestamps as they do for real messages (chat.archive relies on it).
+    rows = []
+    agents, buyers = plan['agents'], plan['buyers']
+    slot = HISTORY_DAYS * 86400 / max(plan['messages'], 1)
+    for index in range(start, stop):
+        agent_id = plan['user_offset'] + rng.randrange(agents)
+        buyer_id = plan['user_offset'] + agents + rng.randrange(buyers)
+        from_buyer = rng.random() < 0.55
+        rows.append(ChatMessage(
+            id=plan['message_offset'] + index,
+            sender_id=buyer_id if from_buyer else agent_id,
+            receiver_id=agent_id if from_buyer else buyer_id,
+            # bulk_create skips save(), which normally fills this in.
+            conversation=conversation_key(agent_id, buyer_id),
+            message=rng.choice(MESSAGES),
+            timestamp=EPOCH + timedelta(seconds=(index + rng.random()) * slot),
+            is_read=rng.random() < 0.85,
+        ))
+    return rows
+
+
+TABLES = {
+    'users': (User, build_users, 'users'),
+    'properties': (Property, build_properties, 'properties'),
+    'images': (PropertyImage, build_images, 'properties'),
+    'ratings': (AgentRating, build_ratings, 'ratings'),
+    'messages': (ChatMessage, build_messages, 'messages'),
+}
+
+
+def keep_generated_timestamps():
+    # Generated rows carry their own history; auto_now_add would stamp them all "now".
+    for model, field in ((Property, 'created_at'), (AgentRating, 'created_at'),
+                         (ChatMessage, 'timestamp')):
+        model._meta.get_field(field).auto_now_add = False
+
+
+def fill_partition(table, partition, plan):
+    keep_generated_timestamps()
+    model, build, volume = TABLES[table]
+    size = plan['partition_size']
+    start = partition * size
+    stop = min(start + size, plan[volume])
+    rows = build(partition_rng(plan['seed'], table, partition), start, stop, plan)
+    batch_size = plan['batch_size']
+    for offset in range(0, len(rows), batch_size):
+        with transaction.atomic():
+            model.objects.bulk_create(rows[offset:offset + batch_size], batch_size=batch_size)
+    connections.close_all()
+    return table, len(rows)
+
+
+def next_id(model):
+    return (model.objects.aggregate(top=Max('id'))['top'] or 0) + 1
+
+
+def build_plan(args):
+    scale = args.scale
+    plan = {
+        'seed': args.seed,
+        'agents': max(1, int(args.agents * scale)),
+        'buyers': max(1, int(args.buyers * scale)),
+        'properties': int(args.properties * scale),
+        'ratings': int(args.ratings * scale),
+        'messages': int(args.messages * scale),
+        'images_per_property': args.images_per_property,
+        'partition_size': args.partition_size,
+        'batch_size': args.batch_size,
+        'password_hash': make_password(args.password),
+        'user_offset': next_id(User),
+        'property_offset': next_id(Property),
+        'image_offset': next_id(PropertyImage),
+        'rating_offset': next_id(AgentRating),
+        'message_offset': next_id(ChatMessage),
+    }
+    plan['users'] = plan['agents'] + plan['buyers']
+    if plan['ratings'] > plan['agents'] * plan['buyers']:
+        sys.exit('--ratings exceeds agents x buyers; every (agent, rater) pair must be unique.')
+    return plan
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seed', default='rwanda-housing')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for every volume')
+    parser.add_argument('--properties', type=int, default=100_000)
+    parser.add_argument('--agents', type=int, default=10_000)
+    parser.add_argument('--buyers', type=int, default=40_000)
+    parser.add_argument('--ratings', type=int, default=1_000_000)
+    parser.add_argument('--messages', type=int, default=5_000_000)
+    parser.add_argument('--images-per-property', type=int, default=4)
+    parser.add_argument('--partition-size', type=int, default=50_000)
+    parser.add_argument('--batch-size', type=int, default=5_000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--password', default='password123')
+    args = parser.parse_args(argv)
+
+    if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+        sys.exit('Synthetic data already present; generate into an empty database.')
+
+    plan = build_plan(args)
+    # Worker processes open their own connections.
+    connections.close_all()
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for phase in PHASES:
+            tasks = []
+            for table in phase:
+                volume = plan[TABLES[table][2]]
+                for partition in range(math.ceil(volume / plan['partition_size'])):
+                    tasks.append(pool.submit(fill_partition, table, partition, plan))
+            totals = {}
+            for task in tasks:
+                table, count = task.result()
+                totals[table] = totals.get(table, 0) + count
+            for table, count in totals.items():
+                print(f'{table:<12}{count:>12,} rows  ({time.perf_counter() - started:.1f}s)')
+
+
+if __name__ == '__main__':
+    main()